@@ -0,0 +1,59 @@
+#!/usr/bin/python3
+import sys
+sys.path.insert(0, __file__+'/../..')
+
+"""
+Captures the fixed corpus of RL866 frames the microbenchmarks parse, from the RL866 simulator.
+The corpus is committed, so the benchmarks parse the same frames from run to run. Regenerate it only when the protocol changes.
+
+For each inventory size, benchmarks/corpus/inventory-<tags>.rl866cap holds:
+  an inventory, drained with continue inventory commands when the tag reports don't fit one frame,
+  an inventory with the embedded system information and tag memory reads,
+  fleshing one tag: connect, system information, read multiple blocks, disconnect.
+Every other tag is ISO 28560-2, and every other ISO 28560-3.
+
+  benchmarks/make_corpus.py
+"""
+
+from lainuri.config import c
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+
+import lainuri.rfid_reader
+import lainuri.RL866.capture as rfid_capture
+from lainuri.RL866.iblock import IBlock_TagMemoryAccess, IBlock_TagMemoryAccess_Response
+import lainuri.RL866.simulator as simulator
+from lainuri.RL866.tag_memory_access_command import TagMemoryAccessCommand
+
+import os
+
+INVENTORY_SIZES = [1, 8, 16, 32, 64]
+corpus_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+def corpus_tags(count: int) -> list:
+  return [
+    (simulator.iso28560_3_tag if n % 2 else simulator.iso28560_2_tag)(0xe004015000000000 + n, str(1620000000 + n))
+    for n in range(0, count)
+  ]
+
+if __name__ == '__main__':
+  os.makedirs(corpus_dir, exist_ok=True)
+  for count in INVENTORY_SIZES:
+    path = os.path.join(corpus_dir, f"inventory-{count}.rl866cap")
+    with simulator.Simulator(tags=corpus_tags(count)).start() as sim:
+      rfid_reader = lainuri.rfid_reader.RFID_Reader(name='corpus', port=sim.port)
+      rfid_reader.capture = rfid_capture.Capture(path)
+
+      c['devices']['rfid-reader']['inventory-embedded-reads'] = False
+      tags = rfid_reader.query_inventory()
+      c['devices']['rfid-reader']['inventory-embedded-reads'] = True
+      rfid_reader.query_inventory()
+      # Flesh a tag like RFID_Reader._flesh_tag_details(), without putting it to the tag cache
+      lainuri.rfid_reader._tag_connect(rfid_reader, tags[0])
+      command = TagMemoryAccessCommand().ISO15693_GetTagSystemInformation()
+      IBlock_TagMemoryAccess_Response(tags[0], command).receive(rfid_reader.transceive(IBlock_TagMemoryAccess(tags[0], command)))
+      rfid_reader.read_primary_item_identifier(tags[0])
+      lainuri.rfid_reader._tag_disconnect(rfid_reader, tags[0])
+
+      rfid_reader.capture.close()
+    print(f"{path}: {len(rfid_capture.read_capture(path)[1])} frames")
@@ -0,0 +1,248 @@
+#!/usr/bin/python3
+import sys
+sys.path.insert(0, __file__+'/../..')
+
+"""
+Microbenchmarks of the pure-Python hot paths of the RFID and barcode reader protocols and the tag data codecs.
+Runs without hardware, parsing the fixed corpus of RL866 frames in benchmarks/corpus, see benchmarks/make_corpus.py
+
+Each benchmark reports the best and the median of the repeats, in microseconds per operation.
+The results are printed, and written as JSON if a results file is given.
+Given the JSON results of an earlier run as the baseline, the run fails if any benchmark is slower than the baseline
+by more than the threshold, eg. 0.3 is 30% slower, by both the best and the median of the repeats. A single slow
+repeat, eg. the machine being busy for a moment, doesn't move either of them.
+
+  benchmarks/run.py [results.json|-] [baseline.json|-] [threshold] [name filter]
+
+  make benchmark-baseline   # Records benchmarks/baseline.json
+  make benchmark            # Compares against it
+"""
+
+from lainuri.config import c
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+logging.disable(logging.INFO) # The debug and info messages would be written on every operation
+
+import lainuri.barcode_reader.model.WGC_commands as WGC_commands
+import lainuri.barcode_reader.model.WGI_commands as WGI_commands
+from lainuri.RL866.iblock import IBlock_TagInventory, IBlock_TagMemoryAccess
+from lainuri.RL866.message import Message, parseMessage
+import lainuri.RL866.CRC16
+import lainuri.RL866.capture as rfid_capture
+import lainuri.RL866.simulator as simulator
+from lainuri.RL866.tag import Tag
+from lainuri.RL866.tag_memory_access_command import TagMemoryAccessCommand
+
+import iso15692.compaction
+import iso28560
+
+import json
+import os
+import platform
+import time
+import timeit
+
+REPEAT = 11
+REPEAT_DURATION = 0.2 # Seconds each repeat loops the operations for, roughly. Shorter repeats are dominated by noise
+
+corpus_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+benchmarks = {} # name -> tuple (function running the operations, count of operations per call)
+
+def benchmark(name: str, operations: int = 1):
+  """
+  Decorator registering the function as a benchmark. The function runs the given number of operations per call.
+  """
+  def decorator(function: callable) -> callable:
+    benchmarks[name] = (function, operations)
+    return function
+  return decorator
+
+def measure(function: callable, operations: int) -> dict:
+  timer = timeit.Timer(function)
+  number, duration = timer.autorange()
+  number = max(1, int(number * REPEAT_DURATION / duration))
+  timings = sorted(timer.repeat(repeat=REPEAT, number=number))
+  best = timings[0] / number
+  median = timings[len(timings) // 2] / number
+  return {
+    'us_per_op': best * 1000000 / operations,
+    'us_per_op_median': median * 1000000 / operations,
+    'ops_per_second': operations / best,
+  }
+
+
+## Corpus
+def read_corpus(count: int) -> list:
+  """
+  @returns list of tuples (request frame, response frame) of the corpus inventory-<count>.rl866cap
+  """
+  started, records = rfid_capture.read_capture(os.path.join(corpus_dir, f"inventory-{count}.rl866cap"))
+  pairs = []
+  request = None
+  for direction, timestamp, frame in records:
+    if direction == rfid_capture.DIRECTION_WRITE: request = frame
+    elif request: pairs.append((request, frame)); request = None
+  return pairs
+
+corpus = {count: read_corpus(count) for count in [1, 8, 16, 32, 64]}
+all_frames = [frame for pairs in corpus.values() for pair in pairs for frame in pair]
+
+# Tag memories of the corpus tags, see benchmarks/make_corpus.py
+tag_memories_2 = [bytes(simulator.iso28560_2_tag(0, str(1620000000 + n)).tag_memory[0:36]) for n in range(0, 64, 2)]
+tag_memories_3 = [bytes(simulator.iso28560_3_tag(0, str(1620000000 + n)).tag_memory[0:36]) for n in range(1, 64, 2)]
+
+
+## RL866 frames
+connected_tag = Tag('e004015000000000')
+connected_tag.connect(b'\x01') # Outside of the benchmark, connecting logs the tag
+
+@benchmark('rl866.message.pack', operations=2)
+def rl866_message_pack():
+  IBlock_TagInventory(new_inventory=True).pack()
+  IBlock_TagMemoryAccess(connected_tag, TagMemoryAccessCommand().ISO15693_ReadMultipleBlocks(read_security_status=0, start_block_address=0, number_of_blocks_to_read=9)).pack()
+
+@benchmark('rl866.message.parse', operations=len(all_frames))
+def rl866_message_parse():
+  for frame in all_frames:
+    parseMessage(Message(), frame)
+
+@benchmark('rl866.crc16', operations=len(all_frames))
+def rl866_crc16():
+  crc16 = lainuri.RL866.CRC16.crc16
+  for frame in all_frames:
+    crc16(frame[1:-2])
+
+def inventory_pairs(count: int) -> list:
+  return [(request, response) for request, response in corpus[count] if rfid_capture.get_command_name(request) == 'inventory']
+
+for count in corpus.keys():
+  def rl866_inventory_response(pairs=inventory_pairs(count)):
+    for request, response in pairs:
+      rfid_capture.parse_response(request, response, {})
+  # Two inventories, one of them with the embedded reads. Reported per tag report.
+  benchmark(f"rl866.inventory_response.tags_{count}", operations=2 * count)(rl866_inventory_response)
+
+@benchmark('rl866.memory_access_response', operations=4)
+def rl866_memory_access_response():
+  tags_by_handle = {}
+  for request, response in corpus[1]:
+    if rfid_capture.get_command_name(request) in ('connect', 'memory_access', 'disconnect'):
+      rfid_capture.parse_response(request, response, tags_by_handle)
+
+
+## ISO 28560 data formats
+@benchmark('iso28560-2.primary_item_identifier', operations=len(tag_memories_2))
+def iso28560_2_primary_item_identifier():
+  for tag_memory in tag_memories_2:
+    iso28560.ISO28560_2_Object(0x07, 0x06, 4, 28, tag_memory).get_primary_item_identifier()
+
+@benchmark('iso28560-3.primary_item_identifier', operations=len(tag_memories_3))
+def iso28560_3_primary_item_identifier():
+  for tag_memory in tag_memories_3:
+    iso28560.ISO28560_3_Object(0x07, 0x3E, 4, 28, tag_memory).get_primary_item_identifier()
+
+decode_many_corpus = [(0x06, 0x07, m) for m in tag_memories_2] + [(0x3E, 0x07, m) for m in tag_memories_3]
+@benchmark('iso28560.decode_many', operations=len(decode_many_corpus))
+def iso28560_decode_many():
+  iso28560.decode_many(decode_many_corpus)
+
+@benchmark('tag.iso25680_get_primary_item_identifier', operations=len(tag_memories_2) + len(tag_memories_3))
+def tag_get_primary_item_identifier():
+  for dsfid, tag_memories in ((0x06, tag_memories_2), (0x3E, tag_memories_3)):
+    for tag_memory in tag_memories:
+      tag = Tag('e004015000000000')
+      tag.afi(0x07)
+      tag.dsfid(dsfid)
+      tag.block_size(4)
+      tag.memory_capacity_blocks(28)
+      tag.tag_memory(tag_memory)
+      tag.iso25680_get_primary_item_identifier()
+
+
+## ISO 15962 compaction
+compaction_corpus = {
+  'numeric': [str(1620000000 + n).zfill(12) for n in range(0, 32)],
+  '5_bit': ['JYVASKYLA', 'HELSINKI', 'ABCDEFGHIJK', 'XYZ'] * 8,
+  '6_bit': ['FI-JYVA', 'ABC123456', 'FI-00100', 'KIRJASTO 2'] * 8,
+}
+for scheme, strings in compaction_corpus.items():
+  pack = getattr(iso15692.compaction, f"pack_{scheme}")
+  unpack = getattr(iso15692.compaction, f"unpack_{scheme}")
+  packed = [pack(s) for s in strings]
+  benchmark(f"compaction.pack_{scheme}", operations=len(strings))(lambda pack=pack, strings=strings: [pack(s) for s in strings])
+  benchmark(f"compaction.unpack_{scheme}", operations=len(strings))(lambda unpack=unpack, packed=packed: [unpack(p) for p in packed])
+
+identifiers = [s for strings in compaction_corpus.values() for s in strings] + [str(1620000000 + n) for n in range(0, 32)]
+@benchmark('compaction.compact_many', operations=len(identifiers))
+def compaction_compact_many():
+  iso15692.compaction.compact_many(identifiers)
+
+
+## Barcode reader commands
+@benchmark('barcode.wgi.pack', operations=3)
+def barcode_wgi_pack():
+  WGI_commands.WGI_ScanControl(start_scan=True).pack()
+  WGI_commands.WGI_ScanMode(continuous_scan=True).pack()
+  WGI_commands.WGI_ACKFeedback().pack()
+
+@benchmark('barcode.wgc.pack', operations=3)
+def barcode_wgc_pack():
+  WGC_commands.WGC_ScanTrigger().pack()
+  WGC_commands.WGC_ScanStop().pack()
+  WGC_commands.WGC_VersionRead().pack()
+
+
+def run(name_filter: str = None) -> dict:
+  results = {}
+  for name, (function, operations) in benchmarks.items():
+    if name_filter and name_filter not in name: continue
+    results[name] = measure(function, operations)
+    print(f"  {name:<42}: {results[name]['us_per_op']:9.3f} us per op, median {results[name]['us_per_op_median']:9.3f}, {results[name]['ops_per_second']:12.0f} ops/s")
+  return results
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+  """
+  @returns list of the names of the benchmarks slower than the baseline by more than the threshold, by both the best
+           and the median of the repeats
+  """
+  regressions = []
+  for name, result in results.items():
+    if name not in baseline: continue
+    change = result['us_per_op'] / baseline[name]['us_per_op'] - 1
+    median_change = change
+    if 'us_per_op_median' in baseline[name]: # Baselines recorded before the medians compare the best only
+      median_change = result['us_per_op_median'] / baseline[name]['us_per_op_median'] - 1
+    if change > threshold and median_change > threshold:
+      regressions.append(name)
+      print(f"  REGRESSION {name:<31}: {baseline[name]['us_per_op']:9.3f} -> {result['us_per_op']:9.3f} us per op, {change*100:+.0f}%, median {median_change*100:+.0f}%")
+  return regressions
+
+if __name__ == '__main__':
+  results_path = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] != '-' else None
+  baseline_path = sys.argv[2] if len(sys.argv) > 2 and sys.argv[2] != '-' else None
+  threshold = float(sys.argv[3]) if len(sys.argv) > 3 else 0.3
+  name_filter = sys.argv[4] if len(sys.argv) > 4 else None
+
+  print(f"Python {platform.python_version()} on {platform.machine()}, best and median of {REPEAT} repeats of {REPEAT_DURATION}s")
+  results = run(name_filter)
+
+  if results_path:
+    with open(results_path, 'w') as f:
+      json.dump({
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+      }, f, indent=2, sort_keys=True)
+    print(f"Results written to '{results_path}'")
+
+  if baseline_path and not os.path.exists(baseline_path):
+    print(f"No baseline '{baseline_path}' to compare to, record one with 'make benchmark-baseline'")
+  elif baseline_path:
+    with open(baseline_path, 'r') as f:
+      baseline = json.load(f)['results']
+    regressions = compare(results, baseline, threshold)
+    if regressions:
+      print(f"{len(regressions)} benchmarks regressed more than {threshold*100:.0f}% from the baseline '{baseline_path}'")
+      sys.exit(1)
+    print(f"No benchmark regressed more than {threshold*100:.0f}% from the baseline '{baseline_path}'")
@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+import sys
+sys.path.insert(0, __file__+'/../..')
+
+"""
+Benchmarks the table-driven compaction codecs of iso15692.compaction against the bitarray implementations,
+and selecting the compaction of a batch of primary item identifiers with compact_many().
+
+  bin/compaction_benchmark.py [strings] [repeat]
+"""
+
+import iso15692.compaction as compaction
+
+import random
+import timeit
+import warnings
+warnings.simplefilter('ignore', DeprecationWarning) # bitarray.length()
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+rand = random.Random(20)
+corpora = {
+  'numeric': [str(rand.randrange(10**15, 10**16)) for _ in range(0, count)],
+  '5-bit'  : [''.join(chr(rand.randint(0x41, 0x5A)) for _ in range(0, 11)) for _ in range(0, count)],
+  '6-bit'  : [''.join(chr(rand.randint(0x30, 0x5A)) for _ in range(0, 11)) for _ in range(0, count)],
+}
+codecs = {
+  'numeric': (compaction.compact_numeric, compaction.decompact_numeric, compaction.pack_numeric, compaction.unpack_numeric),
+  '5-bit'  : (compaction.compact_5_bit, compaction.decompact_5_bit, compaction.pack_5_bit, compaction.unpack_5_bit),
+  '6-bit'  : (compaction.compact_6_bit, compaction.decompact_6_bit, compaction.pack_6_bit, compaction.unpack_6_bit),
+}
+
+def bench(function: callable, inputs: list) -> float:
+  return min(timeit.repeat(lambda: [function(i) for i in inputs], number=1, repeat=repeat)) / len(inputs)
+
+print(f"{count} strings of each kind, us per string")
+for name, (compact, decompact, pack, unpack) in codecs.items():
+  strings = corpora[name]
+  packed = [pack(s) for s in strings]
+  assert packed == [compact(s) for s in strings]
+  assert [unpack(p) for p in packed] == strings
+  results = [bench(compact, strings), bench(pack, strings), bench(decompact, packed), bench(unpack, packed)]
+  print(f"  {name:<7}: compact {results[0]*1000000:6.2f} -> pack {results[1]*1000000:5.2f} ({results[0]/results[1]:4.1f}x), decompact {results[2]*1000000:6.2f} -> unpack {results[3]*1000000:5.2f} ({results[2]/results[3]:4.1f}x)")
+
+piis = [str(rand.randrange(10**9, 10**10)).zfill(11 if n % 2 else 10) for n in range(0, count)] # Half with a leading zero, which can't be integer compacted
+def compact_many_by_exceptions(datas: list) -> list:
+  return [compaction.detect_best_compaction_scheme(data)(data) for data in datas]
+assert [byttes for _, byttes in compaction.compact_many(piis)] == compact_many_by_exceptions(piis)
+by_exceptions = min(timeit.repeat(lambda: compact_many_by_exceptions(piis), number=1, repeat=repeat)) / count
+many = min(timeit.repeat(lambda: compaction.compact_many(piis), number=1, repeat=repeat)) / count
+print(f"{count} primary item identifiers, half with a leading zero, us per identifier")
+print(f"  detect_best_compaction_scheme() : {by_exceptions*1000000:6.2f}")
+print(f"  compact_many()                  : {many*1000000:6.2f} ({by_exceptions/many:.1f}x)")
@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+import sys
+sys.path.insert(0, __file__+'/../..')
+
+"""
+Benchmarks the table-driven CRC-16 checksums of iso15692.crc against the implementations they replaced:
+the bit-by-bit C function of the RL866 frames compiled with 'inline', if it is installed,
+and the bit-by-bit Python loop of the ISO 28560-3 basic block.
+
+  bin/crc_benchmark.py [repeat]
+"""
+
+import iso15692.crc
+
+import random
+import time
+import timeit
+
+repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+def crc_16_ccitt_bitwise(bytess):
+  crc_sum = 0xFFFF
+  for c in bytess:
+    c <<= 8
+    for _ in range(0,8):
+      xor_flag = ((crc_sum ^ c) & 0x8000) != 0
+      crc_sum = crc_sum << 1
+      if (xor_flag):
+        crc_sum = crc_sum ^ 0x1021
+      c = c << 1
+    crc_sum &= 0xffff
+  return crc_sum
+
+def crc_16_reflected_bitwise(bytess):
+  crc = 0xFFFF
+  for val in bytess:
+    crc ^= val
+    for _ in range(0,8):
+      crc = (crc >> 1) ^ 0x8408 if crc & 0x0001 else crc >> 1
+  return crc
+
+crc_16_reflected_inline = None
+try:
+  import inline
+  started = time.monotonic()
+  c = inline.c(r'''
+#include <stdint.h>
+uint16_t cal_crc16_ext(uint16_t initval, uint8_t *ptr, uint16_t len) {
+  uint16_t crc = initval;
+  uint16_t i,j;
+  for(i=0;i<len;i++) {
+    crc ^= ptr[i];
+    for(j=0;j<8;j++) {
+      if(crc&0x0001) crc=(crc>>1)^0x8408;
+      else           crc=(crc>>1);
+    }
+  }
+  return(crc);
+}
+''')
+  print(f"inline C compiled and loaded in {(time.monotonic() - started)*1000:.0f} ms")
+  crc_16_reflected_inline = lambda data: c.cal_crc16_ext(0xFFFF, data, len(data))
+except ImportError:
+  print("'inline' is not installed, skipping the C implementation")
+
+started = time.monotonic()
+iso15692.crc._make_table_msb_first(0x1021)
+iso15692.crc._make_table_lsb_first(0x8408)
+print(f"tables built in {(time.monotonic() - started)*1000:.2f} ms")
+
+rand = random.Random(17)
+frames = [bytes(rand.getrandbits(8) for _ in range(0, rand.randint(5, 254))) for _ in range(0, 100)]
+basic_blocks = [bytes(rand.getrandbits(8) for _ in range(0, 32)) for _ in range(0, 100)]
+
+def bench(label: str, function: callable, buffers: list):
+  duration = min(timeit.repeat(lambda: [function(b) for b in buffers], number=repeat // 100 or 1, repeat=5)) / (repeat // 100 or 1)
+  size = sum(len(b) for b in buffers)
+  print(f"  {label:<24}: {duration*1000000/len(buffers):8.2f} us per buffer, {size/duration/1000000:6.2f} MB/s")
+  return duration
+
+print(f"RL866 frames, {len(frames)} frames of 5-254 bytes:")
+assert iso15692.crc.crc_16_reflected_many(frames) == [crc_16_reflected_bitwise(f) for f in frames]
+table = bench('table', iso15692.crc.crc_16_reflected, frames)
+bench('bitwise python', crc_16_reflected_bitwise, frames)
+if crc_16_reflected_inline:
+  assert [crc_16_reflected_inline(f) for f in frames] == iso15692.crc.crc_16_reflected_many(frames)
+  bench('bitwise inline C', crc_16_reflected_inline, frames)
+
+print(f"ISO 28560-3 basic blocks, {len(basic_blocks)} blocks of 32 bytes:")
+assert iso15692.crc.crc_16_ccitt_many(basic_blocks) == [crc_16_ccitt_bitwise(b) for b in basic_blocks]
+table = bench('table', iso15692.crc.crc_16_ccitt, basic_blocks)
+bitwise = bench('bitwise python', crc_16_ccitt_bitwise, basic_blocks)
+print(f"  speedup over bitwise    : {bitwise / table:.1f}x")
@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+import sys
+sys.path.insert(0, __file__+'/../..')
+
+"""
+Benchmarks decoding a synthetic corpus of tags, half ISO 28560-2 and half ISO 28560-3,
+one Tag at a time like the RFID reader does, and one data object at a time decoding the same details,
+against the bulk iso28560.decode_many().
+
+  bin/iso28560_decode_benchmark.py [tags]
+"""
+
+from lainuri.config import get_config
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+
+from lainuri.RL866.tag import Tag
+
+import iso15692.compaction
+import iso28560
+
+import time
+
+tag_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+def iso28560_2_tag_memory(primary_item_identifier: str) -> bytes:
+  pii = iso15692.compaction.compact_integer(primary_item_identifier)
+  return bytes([0x11, len(pii)]) + pii + bytes([0x24, 2]) + iso15692.compaction.compact_numeric('0201') + bytes([0x63, 7]) + b'FI-Jyva' + b'\x00'
+
+def iso28560_3_tag_memory(primary_item_identifier: str) -> bytes:
+  return bytes(iso28560.ISO28560_3_Object(afi=0x07, dsfid=0x3E, block_size=4, memory_capacity_blocks=28, tag_memory=bytearray(34)).encode(
+    content_parameter=0, type_of_usage=1, numbers_of_parts_in_item=1, ordinal_part_number=1, primary_item_identifier=primary_item_identifier, isil=None,
+  ).tag_memory())
+
+corpus = [
+  (0x06, 0x07, iso28560_2_tag_memory(str(1620000000 + n))) if n % 2 else (0x3E, 0xC2, iso28560_3_tag_memory(str(1620000000 + n)))
+  for n in range(0, tag_count)
+]
+
+started = time.perf_counter()
+piis = []
+for dsfid, afi, tag_memory in corpus:
+  tag = Tag()
+  tag.afi(afi)
+  tag.dsfid(dsfid)
+  tag.block_size(4)
+  tag.memory_capacity_blocks(28)
+  tag.tag_memory(tag_memory)
+  piis.append(tag.decode_primary_item_identifier())
+one_at_a_time = time.perf_counter() - started
+
+started = time.perf_counter()
+details = []
+for dsfid, afi, tag_memory in corpus:
+  tag = Tag()
+  tag.dsfid(dsfid)
+  dob = tag.get_data_object_format_implementation()(afi, dsfid, 4, 28, tag_memory).decode()
+  if isinstance(dob, iso28560.ISO28560_3_Object):
+    details.append((dob.primary_item_identifier, dob.isil, dob.set_information))
+  else:
+    details.append((dob.get_primary_item_identifier(), dob.get_data_element(3).data, dob.get_data_element(4).data))
+one_at_a_time_details = time.perf_counter() - started
+
+started = time.perf_counter()
+decoded = iso28560.decode_many(corpus, get_config('devices.rfid-reader.iso28560-data-format-overloads'))
+bulk = time.perf_counter() - started
+
+assert [d.primary_item_identifier for d in decoded] == piis
+assert not [d for d in decoded if d.error or d.crc_valid == False]
+
+print(f"{tag_count} tags, half ISO 28560-2 and half ISO 28560-3")
+print(f"  one Tag at a time, primary item identifier       : {one_at_a_time*1000:8.1f} ms, {one_at_a_time*1000000/tag_count:6.1f} us per tag")
+print(f"  one data object at a time, ISIL, set information : {one_at_a_time_details*1000:8.1f} ms, {one_at_a_time_details*1000000/tag_count:6.1f} us per tag")
+print(f"  decode_many(), ISIL, set information             : {bulk*1000:8.1f} ms, {bulk*1000000/tag_count:6.1f} us per tag")
+print(f"  speedup over the data objects                    : {one_at_a_time_details / bulk:.1f}x")
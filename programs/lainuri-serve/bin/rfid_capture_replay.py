@@ -0,0 +1,34 @@
+#!/usr/bin/python3
+import sys
+sys.path.insert(0, __file__+'/../..')
+
+"""
+Replays a RL866 frame capture, see devices.rfid-reader.capture-dir
+Prints the round trip times of the captured session, and how fast the captured responses are parsed.
+
+  bin/rfid_capture_replay.py capture.rl866cap [rounds]
+"""
+
+from lainuri.config import c
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+
+import lainuri.RL866.capture as rfid_capture
+
+import time
+
+if len(sys.argv) < 2:
+  print(__doc__)
+  sys.exit(1)
+
+rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+started, records = rfid_capture.read_capture(sys.argv[1])
+print(f"capture started         : {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started))}")
+print(f"frames                  : {len(records)}, spanning {records[-1][1] - records[0][1] if records else 0:.1f} s")
+
+stats = rfid_capture.replay(records, rounds)
+for command_name, rt in sorted(stats['round_trips'].items()):
+  print(f"round trip {command_name:<13}: count {rt['count']}, mean {rt['mean']*1000:.1f} ms, max {rt['max']*1000:.1f} ms")
+print(f"parse errors            : {stats['errors']}")
+print(f"responses parsed        : {stats['responses']} in {stats['duration']*1000:.1f} ms")
+print(f"responses per second    : {stats['responses_per_second']:.0f}")
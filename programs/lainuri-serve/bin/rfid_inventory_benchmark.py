@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+import sys
+sys.path.insert(0, __file__+'/../..')
+
+"""
+Measures how many RFID tags per second the RFID reader can inventory, and how long fleshing a new tag takes.
+Put a stack of items on the reader and run. Large stacks exercise the continue inventory -loop.
+Given a simulator scenario, the benchmark is run against the simulated RL866 instead of the hardware, eg. in CI.
+
+  bin/rfid_inventory_benchmark.py [rounds] [simulator scenario.yaml]
+"""
+
+from lainuri.config import c
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+
+import lainuri.rfid_reader
+import lainuri.RL866.simulator
+import lainuri.RL866.tag_cache as tag_cache
+
+import statistics
+import time
+
+rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+scenario = sys.argv[2] if len(sys.argv) > 2 else None
+
+simulator = None
+if scenario:
+  simulator = lainuri.RL866.simulator.load_scenario(scenario).start()
+  rfid_reader = lainuri.rfid_reader.RFID_Reader(name='simulator', port=simulator.port)
+else:
+  rfid_reader = lainuri.rfid_reader.get_rfid_reader()
+
+stats = []
+flesh_durations = []
+for i in range(0, rounds):
+  tags = rfid_reader.query_inventory()
+  stats.append(rfid_reader.inventory_statistics)
+  print(f"round {i+1}/{rounds}: {rfid_reader.inventory_statistics}")
+
+for tag in tags:
+  tag_cache.invalidate(tag.serial_number()) # Measure reading the tag, not the cache
+  started = time.monotonic()
+  try:
+    rfid_reader.flesh_tag_details(tag)
+    flesh_durations.append(time.monotonic() - started)
+  except Exception as e:
+    print(f"fleshing tag '{tag.serial_number()}' failed: {type(e).__name__} {e}")
+
+print(f"tags min/max           : {min(s['tags'] for s in stats)}/{max(s['tags'] for s in stats)}")
+print(f"transmissions mean     : {statistics.mean(s['transmissions'] for s in stats):.2f}")
+print(f"inventory duration mean: {statistics.mean(s['duration'] for s in stats)*1000:.1f} ms")
+print(f"tags per second mean   : {statistics.mean(s['tags_per_second'] for s in stats):.1f}")
+if flesh_durations:
+  print(f"tag fleshing mean      : {statistics.mean(flesh_durations)*1000:.1f} ms")
+
+if simulator: simulator.stop()
@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+import sys
+sys.path.insert(0, __file__+'/../..')
+
+"""
+Bulk tagging mode. Programs item barcodes to the blank RFID tags placed on the RFID reader, one item per tag,
+and reports the sustained tags per minute.
+
+The item barcodes are read from the first column of a CSV file, or from the barcode reader if no CSV is given.
+Given a simulator scenario, eg. with 'generate: {format: blank}', the tags are programmed to the simulated RL866 instead of the hardware.
+
+  bin/rfid_program_tags.py [items.csv|-] [simulator scenario.yaml]
+"""
+
+from lainuri.config import c
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+
+from lainuri.constants import Status
+import lainuri.barcode_reader
+import lainuri.rfid_reader
+import lainuri.rfid_tag_programmer as rfid_tag_programmer
+import lainuri.RL866.simulator
+
+import queue
+
+barcodes = None
+barcode_reader = None
+csv_path = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] != '-' else None
+scenario = sys.argv[2] if len(sys.argv) > 2 else None
+
+simulator = None
+if scenario:
+  simulator = lainuri.RL866.simulator.load_scenario(scenario).start()
+  rfid_reader = lainuri.rfid_reader.RFID_Reader(name='simulator', port=simulator.port)
+else:
+  rfid_reader = lainuri.rfid_reader.get_rfid_reader()
+
+if csv_path:
+  item_barcodes = rfid_tag_programmer.read_item_barcodes_csv(csv_path)
+else:
+  barcodes = queue.Queue()
+  barcode_reader = lainuri.barcode_reader.init(lambda barcode_reader, barcode: barcodes.put(barcode))
+  if not barcode_reader:
+    print("Barcode reader is disabled by config, give the item barcodes as a CSV")
+    sys.exit(1)
+  barcode_reader.start_polling_barcodes()
+  print("Read the item barcodes with the barcode reader, and place a blank tag on the RFID reader for each. Interrupt to stop.")
+  item_barcodes = rfid_tag_programmer.queue_item_barcodes(barcodes)
+
+programmer = rfid_tag_programmer.TagProgrammer(rfid_reader)
+try:
+  for result in programmer.program(item_barcodes):
+    if result['status'] != Status.SUCCESS:
+      print(f"{result['item_barcode']}: {result['states']['exception']['type']} {result['states']['exception']['trace']}")
+except KeyboardInterrupt:
+  pass
+finally:
+  if barcodes: barcodes.put(None) # Releases the programmer's thread waiting for the next item barcode
+  if barcode_reader: barcode_reader.stop_polling_barcodes()
+  if simulator: simulator.stop()
+
+print(f"{programmer.statistics['tags_programmed']} tags programmed, {programmer.statistics['tags_failed']} failed, in {programmer.statistics['duration']:.1f} s")
+print(f"sustained {programmer.statistics['tags_per_minute']:.0f} tags per minute")
@@ -0,0 +1,40 @@
+#!/usr/bin/python3
+import sys
+sys.path.insert(0, __file__+'/../..')
+
+"""
+Runs a simulated RL866 RFID reader behind a pseudo-terminal, until interrupted.
+Point the RFID reader to the printed pty, or to the symlink, with devices.rfid-reader.readers[].port
+
+  bin/rfid_simulator.py scenario.yaml [symlink]
+"""
+
+from lainuri.config import c
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+
+import lainuri.RL866.simulator
+
+import os
+import time
+
+if len(sys.argv) < 2:
+  print(__doc__)
+  sys.exit(1)
+
+simulator = lainuri.RL866.simulator.load_scenario(sys.argv[1]).start()
+link = sys.argv[2] if len(sys.argv) > 2 else None
+if link:
+  if os.path.islink(link): os.remove(link)
+  os.symlink(simulator.port, link)
+print(f"RL866 simulator listening at '{simulator.port}'" + (f", linked from '{link}'" if link else ''))
+
+try:
+  while True:
+    time.sleep(10)
+    print(f"{simulator.clock():.0f}s tags present '{len(simulator.tags_present())}' commands '{simulator.commands}'")
+except KeyboardInterrupt:
+  pass
+finally:
+  simulator.stop()
+  if link: os.remove(link)
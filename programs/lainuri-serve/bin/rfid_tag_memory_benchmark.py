@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+import sys
+sys.path.insert(0, __file__+'/../..')
+
+"""
+Measures with tracemalloc how much memory a field of RFID tags held over a day takes, against the simulated RL866.
+
+  retained tags : the fleshed tags held in the reader's inventory
+  event history : the RFID tag events held in the event history, filled up over the day
+  per poll      : the peak memory allocated by an inventory poll of the unchanged field
+
+  bin/rfid_tag_memory_benchmark.py [tags] [polls]
+"""
+
+from lainuri.config import c
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+
+from lainuri.constants import Status
+import lainuri.event
+import lainuri.event_queue
+from lainuri.rfid_reader import RFID_Reader
+from lainuri.RL866.inventory import Inventory
+import lainuri.RL866.simulator as simulator
+import lainuri.RL866.tag_cache as tag_cache
+
+import gc
+import statistics
+import tracemalloc
+
+tag_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+polls = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+def traced_memory() -> int:
+  gc.collect()
+  return tracemalloc.get_traced_memory()[0]
+
+with simulator.scenario({'generate': {'count': tag_count, 'format': 'iso28560-2'}}) as sim:
+  reader = RFID_Reader(name='simulator', port=sim.port)
+  reader.inventory = Inventory(appear_hysteresis=1, disappear_hysteresis=1)
+  tag_cache.clear()
+  tracemalloc.start()
+
+  reader.do_inventory(no_events=True)
+  tags = list(reader.tags_present)
+  assert len(tags) == tag_count and all(tag.iso25680_get_primary_item_identifier() for tag in tags)
+
+  per_poll = []
+  for i in range(0, polls):
+    before = traced_memory()
+    tracemalloc.reset_peak()
+    reader.do_inventory(no_events=True)
+    per_poll.append(tracemalloc.get_traced_memory()[1] - before)
+
+  before = traced_memory()
+  history = [lainuri.event.LERFIDTagsNew([tags[i % tag_count]], tags, Status.SUCCESS) for i in range(0, lainuri.event_queue.history_size)]
+  event_history = traced_memory() - before
+  del history
+
+  before = traced_memory()
+  reader.inventory = Inventory(appear_hysteresis=1, disappear_hysteresis=1)
+  reader.tags_new = reader.tags_lost = tags = []
+  retained_tags = before - traced_memory()
+  tracemalloc.stop()
+
+print(f"{tag_count} tags, {lainuri.event_queue.history_size} events in the history")
+print(f"retained tags : {retained_tags / 1024:8.1f} KiB, {retained_tags / tag_count:6.0f} B per tag")
+print(f"event history : {event_history / 1024:8.1f} KiB")
+print(f"per poll      : {statistics.median(per_poll) / 1024:8.1f} KiB allocated at peak, median of {polls} polls")
@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+import sys
+sys.path.insert(0, __file__+'/../..')
+
+"""
+Microbenchmark of parsing the RL866 inventory responses, without a reader.
+Compares the memoryview/struct tag report parser against the earlier parser,
+which sliced each field of each tag report into its own bytes-object.
+
+  bin/rl866_inventory_parse_benchmark.py [tags] [repeat]
+"""
+
+from lainuri.config import c
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO) # The legacy parser's debug messages are still formatted, but not written
+
+import lainuri.helpers as helpers
+from lainuri.RL866.iblock import IBlock_TagInventory_Response
+import lainuri.RL866.CRC16
+import lainuri.RL866.state as state
+from lainuri.RL866.tag import Tag
+
+import timeit
+
+tag_count = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+class LegacyTag(Tag):
+  """
+  Tag as it was before it was slotted, keeping the raw fields of the tag report the legacy parser sets
+  """
+  pass
+
+class Legacy_TagInventory_Response(IBlock_TagInventory_Response):
+  """
+  The tag report parser as it was, for reference
+  """
+  def fieldn_tag_report(self):
+    i = [4]
+    self.tags = []
+    for j in range(0,self.tags_transmitted):
+      tag = LegacyTag()
+      self.tags.append(tag)
+
+      tag.field41 = helpers.shift_byte(self.PARM, i)
+      tag.antenna_id_present           = tag.field41[0] & 1<<0
+      tag.air_protocol_type_id_present = tag.field41[0] & 1<<1
+      tag.tag_type_id_present          = tag.field41[0] & 1<<2
+      tag.tag_serial_number_present    = tag.field41[0] & 1<<3
+      tag.tag_memory_data_present      = tag.field41[0] & 1<<4
+      tag.embedded_command_present     = tag.field41[0] & 1<<7
+      log.debug(f"New tag '{tag}'")
+
+      tag.field42 = None
+      if tag.antenna_id_present:
+        tag.field42 = helpers.shift_byte(self.PARM, i)
+        tag.antenna_id(tag.field42[0])
+        log.debug(f"antenna id '{tag.antenna_id}' detected")
+
+      tag.field43 = None
+      if tag.air_protocol_type_id_present:
+        tag.field43 = helpers.shift_byte(self.PARM, i)
+        tag.air_protocol_type_id(tag.field43[0])
+        log.debug(f"air protocol '{state.air_protocol_type_table[tag.air_protocol_type_id()]}' detected")
+
+      tag.field44 = None
+      if tag.tag_type_id_present:
+        tag.field44 = helpers.shift_byte(self.PARM, i)
+        tag.tag_type_id(tag.field44[0])
+        log.debug(f"tag type id '{tag.tag_type_id}'")
+
+      tag.field45 = None
+      if tag.tag_serial_number_present:
+        tag.field45 = helpers.shift_byte(self.PARM, i)
+        tag.length_of_serial_number = tag.field45[0]
+        log.debug(f"length of serial number '{tag.length_of_serial_number}'")
+      tag.field46 = None
+      if tag.tag_serial_number_present:
+        tag.field46 = helpers.shift_bytes(self.PARM, i, tag.length_of_serial_number)
+        tag.serial_number('{:16x}'.format(helpers.lower_byte_fo_to_int(tag.field46[0:8])))
+        log.debug(f"Received serial number '{tag.serial_number}'")
+
+      tag.field47 = None
+      if tag.tag_memory_data_present:
+        tag.field47 = helpers.shift_word(self.PARM, i)
+        tag.number_of_tag_memory_bits = helpers.word_to_int(tag.field47)
+        log.debug(f"number of tag memory bits '{tag.number_of_tag_memory_bits}'")
+      tag.field48 = None
+      if tag.tag_memory_data_present:
+        tag.field48 = helpers.shift_bytes(self.PARM, i, (tag.number_of_tag_memory_bits + 7) // 8)
+        tag.tag_memory(bytes(tag.field48))
+        log.debug(f"Received tag memory data '{tag.field48.hex()}'")
+
+      tag.field49 = None
+      if tag.embedded_command_present:
+        tag.field49 = self.field49_embedded_commands(tag, i)
+
+      tag.validate()
+
+    return self.tags
+
+def tag_report(serial_number: int, tag_memory: bytes = None) -> bytes:
+  report = bytes([0x01, state.AIR_PROTO_ISO15693, state.TAG_NXP_ICODE_SLIX, 9]) + serial_number.to_bytes(8, 'little') + b'\x00'
+  if tag_memory is None: return bytes([0x0f]) + report
+  return bytes([0x1f]) + report + helpers.int_to_word(len(tag_memory) * 8) + tag_memory
+
+def inventory_responses(tag_count: int, tag_memory: bytes = None) -> list:
+  """
+  @returns list of inventory response frames reporting the given number of tags, as many tag reports in each frame as fit
+  """
+  reports = [tag_report(0xe004010000000000 + n, tag_memory) for n in range(0, tag_count)]
+  frames = []
+  while reports:
+    transmitted = []
+    while reports and 4 + 3 + 4 + sum(len(r) for r in transmitted) + len(reports[0]) + 2 <= 255:
+      transmitted.append(reports.pop(0))
+    INF = b'\x31\x00\x00' + bytes([1 if reports else 0]) + helpers.int_to_word(len(reports) + len(transmitted)) + bytes([len(transmitted)]) + b''.join(transmitted)
+    LEN_RID_PCB_INF = bytes([len(INF) + 5, 0x01, 0x00]) + INF
+    frames.append(b'\xfa' + LEN_RID_PCB_INF + lainuri.RL866.CRC16.crc16(LEN_RID_PCB_INF))
+  return frames
+
+def parse(response_class, frames: list) -> list:
+  return [tag for frame in frames for tag in response_class(frame).tags]
+
+for label, tag_memory in [('serial numbers', None), ('serial numbers and tag memory', b'\x91\x01\x04\x60\x91\xce\x43\x80\x02')]:
+  frames = inventory_responses(tag_count, tag_memory)
+  assert [t.serial_number() for t in parse(IBlock_TagInventory_Response, frames)] == [t.serial_number() for t in parse(Legacy_TagInventory_Response, frames)]
+
+  print(f"{tag_count} tags in {len(frames)} inventory responses, tag reports with {label}:")
+  results = {}
+  for name, response_class in [('legacy', Legacy_TagInventory_Response), ('memoryview', IBlock_TagInventory_Response)]:
+    results[name] = min(timeit.repeat(lambda: parse(response_class, frames), number=repeat, repeat=5)) / repeat
+    print(f"  {name:<10}: {results[name]*1000000:8.1f} us per inventory, {results[name]*1000000/tag_count:6.2f} us per tag")
+  print(f"  speedup   : {results['legacy'] / results['memoryview']:.2f}x")
@@ -0,0 +1,111 @@
+"""
+Decides which antennas of a multi-antenna RFID reader are inventoried on each inventory round,
+and keeps per-antenna statistics for the status surface.
+
+Scheduling policies, devices.rfid-reader.antenna-scheduling:
+
+  round-robin: one antenna is inventoried per round, cycling through the configured antennas.
+  activity:    antennas where tags have recently appeared or been lost are inventoried on every round,
+               the idle antennas take turns round-robin, one per round.
+               So the antennas items are being handled at react fast, and the idle antennas are still watched.
+
+Without configured antennas the reader inventories with its default antenna, and the antenna selection is not sent at all.
+"""
+
+from lainuri.config import get_config
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+
+import time
+
+SCHEDULING_ROUND_ROBIN = 'round-robin'
+SCHEDULING_ACTIVITY = 'activity'
+
+class AntennaStatistics():
+  def __init__(self, antenna_id: int):
+    self.antenna_id = antenna_id
+    self.inventories = 0
+    self.tags = 0 # Tags seen by this antenna on its latest inventory
+    self.tags_seen_total = 0
+    self.last_inventory = None
+    self.last_seen = None # When a tag was last seen by this antenna
+    self.last_activity = None # When a tag last appeared or was lost at this antenna
+
+  def to_ui(self) -> dict:
+    return {
+      'inventories': self.inventories,
+      'tags': self.tags,
+      'tags_seen_total': self.tags_seen_total,
+      'last_inventory': self.last_inventory,
+      'last_seen': self.last_seen,
+      'last_activity': self.last_activity,
+    }
+
+class AntennaScheduler():
+  def __init__(self, antennas: list = None, scheduling: str = None, activity_window: float = None):
+    """
+    @param antennas, list of antenna ids to inventory. Empty means the reader's default antenna.
+    @param scheduling, 'round-robin' or 'activity'
+    @param activity_window, seconds an antenna is considered active after a tag has appeared or been lost at it
+    """
+    self.antennas = sorted(antennas if antennas is not None else (get_config('devices.rfid-reader.antennas') or []))
+    self.scheduling = scheduling or get_config('devices.rfid-reader.antenna-scheduling') or SCHEDULING_ROUND_ROBIN
+    self.activity_window = activity_window or get_config('devices.rfid-reader.antenna-activity-window') or 5
+    if self.scheduling not in (SCHEDULING_ROUND_ROBIN, SCHEDULING_ACTIVITY):
+      raise ValueError(f"Unknown antenna scheduling '{self.scheduling}'")
+    for antenna_id in self.antennas:
+      if not (1 <= antenna_id <= 255): raise ValueError(f"Antenna id '{antenna_id}' out of range 1-255")
+
+    self.statistics = {antenna_id: AntennaStatistics(antenna_id) for antenna_id in self.antennas}
+    self.cursor = 0
+
+  def next_antennas(self) -> list:
+    """
+    @returns list of antenna ids to inventory on this round, or an empty list to use the reader's default antenna
+    """
+    if not self.antennas: return []
+
+    antennas = []
+    idle = self.antennas
+    if self.scheduling == SCHEDULING_ACTIVITY:
+      now = time.time()
+      antennas = [a for a in self.antennas if self.statistics[a].last_activity and now - self.statistics[a].last_activity <= self.activity_window]
+      idle = [a for a in self.antennas if a not in antennas]
+    # The idle antennas take turns in the configured order, continuing from the antenna which had the previous turn
+    for i in range(0, len(self.antennas)):
+      antenna_id = self.antennas[(self.cursor + i) % len(self.antennas)]
+      if antenna_id in idle:
+        antennas.append(antenna_id)
+        self.cursor = (self.cursor + i + 1) % len(self.antennas)
+        break
+    return sorted(antennas)
+
+  def record(self, antennas: list, tags: list, tags_changed: list = None):
+    """
+    Account an inventory round.
+
+    @param antennas, the antennas inventoried, as returned by next_antennas()
+    @param tags, the tag reports received
+    @param tags_changed, the tags which appeared or were lost on this round, marking their antennas active
+    """
+    now = time.time()
+    for antenna_id in antennas:
+      stats = self.statistics.get(antenna_id)
+      if not stats: continue
+      stats.inventories += 1
+      stats.last_inventory = now
+      stats.tags = 0
+
+    for tag in tags:
+      stats = self.statistics.get(tag._antenna_id)
+      if not stats: continue
+      stats.tags += 1
+      stats.tags_seen_total += 1
+      stats.last_seen = now
+
+    for tag in tags_changed or []:
+      stats = self.statistics.get(tag._antenna_id)
+      if stats: stats.last_activity = now
+
+  def to_ui(self) -> dict:
+    return {str(antenna_id): stats.to_ui() for antenna_id, stats in self.statistics.items()}
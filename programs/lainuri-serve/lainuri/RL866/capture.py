@@ -0,0 +1,233 @@
+"""
+Capture the RL866 frames going over the wire, and replay them offline.
+
+With devices.rfid-reader.capture-dir set, every RFID reader writes each frame it sends and receives
+into a capture file '<capture-dir>/<reader name>-<start time>.rl866cap'.
+
+Capture file format:
+  Header:  MAGIC, BYTE version, DOUBLE wall clock time the capture was started
+  Records: BYTE direction '>' written or '<' read, DOUBLE monotonic seconds since the capture was started, the frame as is
+The frame carries its own length in its LEN-byte, so records need no length field.
+Multibyte fields are little-endian. A capture cut short by a crash is read up to the last complete record.
+The records are buffered, and flushed to disk at most FLUSH_INTERVAL seconds after they were recorded, and when the
+capture is closed, so capturing doesn't write to disk for every frame, but the frames leading to a hang are still on disk.
+
+replay() parses the captured responses with the same message classes the RFID_Reader uses,
+pairing each response with the request sent before it. This gives a parser benchmark from real traffic,
+and the round trip times per command of the captured session.
+"""
+
+from lainuri.config import get_config
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+
+import os
+import struct
+import threading
+import time
+
+import lainuri.exception.rfid as exception_rfid
+import lainuri.helpers as helpers
+import lainuri.RL866.iblock as iblock
+from lainuri.RL866.iblock import IBlock_TagInventory_Response, IBlock_TagConnect_Response, IBlock_TagDisconnect_Response, IBlock_TagMemoryAccess_Response
+from lainuri.RL866.message import Message, parseMessage
+from lainuri.RL866.sblock import SBlock_RESYNC_Response
+from lainuri.RL866.tag import Tag
+import lainuri.RL866.tag_memory_access_command as tag_memory_access_command
+from lainuri.RL866.tag_memory_access_command import TagMemoryAccessCommand
+
+MAGIC = b'RL866CAP'
+VERSION = 1
+HEADER = struct.Struct('<8sBd')
+RECORD = struct.Struct('<cd')
+DIRECTION_WRITE = b'>'
+DIRECTION_READ = b'<'
+FLUSH_INTERVAL = 1 # Seconds
+
+command_names = {
+  iblock.CMD_INVENTORY: 'inventory',
+  iblock.CMD_CONNECT: 'connect',
+  iblock.CMD_DISCONNECT: 'disconnect',
+  iblock.CMD_MEMORY_ACCESS: 'memory_access',
+}
+
+class Capture():
+  def __init__(self, path: str):
+    self.path = path
+    self.lock = threading.Lock()
+    self.started = time.monotonic()
+    self.file = open(path, 'wb')
+    self.file.write(HEADER.pack(MAGIC, VERSION, time.time()))
+    self.file.flush()
+    self.flush_timer = None
+
+  def record(self, direction: bytes, frame: bytes):
+    with self.lock:
+      if self.file.closed: return
+      self.file.write(RECORD.pack(direction, time.monotonic() - self.started) + bytes(frame))
+      if not self.flush_timer:
+        self.flush_timer = threading.Timer(FLUSH_INTERVAL, self.flush)
+        self.flush_timer.daemon = True
+        self.flush_timer.start()
+
+  def flush(self):
+    with self.lock:
+      self.flush_timer = None
+      if not self.file.closed: self.file.flush()
+
+  def close(self):
+    with self.lock:
+      if self.flush_timer: self.flush_timer.cancel()
+      self.flush_timer = None
+      self.file.close()
+
+def open_capture(reader_name: str) -> Capture:
+  """
+  @returns Capture for the given reader, or None if capturing is not enabled with devices.rfid-reader.capture-dir
+  """
+  capture_dir = get_config('devices.rfid-reader.capture-dir')
+  if not capture_dir: return None
+  os.makedirs(capture_dir, exist_ok=True)
+  path = os.path.join(capture_dir, f"{reader_name}-{time.strftime('%Y%m%dT%H%M%S')}.rl866cap")
+  log.info(f"Capturing the frames of RFID reader '{reader_name}' to '{path}'")
+  return Capture(path)
+
+def read_capture(path: str) -> tuple:
+  """
+  @returns tuple (wall clock time the capture was started, list of tuples (direction, seconds since the capture was started, frame))
+  """
+  with open(path, 'rb') as f:
+    data = f.read()
+  if len(data) < HEADER.size: raise ValueError(f"Capture '{path}' is missing the header")
+  magic, version, started = HEADER.unpack_from(data, 0)
+  if magic != MAGIC or version != VERSION: raise ValueError(f"Capture '{path}' is not a RL866 capture version '{VERSION}'")
+
+  records = []
+  i = HEADER.size
+  while i + RECORD.size + 2 <= len(data):
+    direction, timestamp = RECORD.unpack_from(data, i)
+    frame_length = data[i + RECORD.size + 1] + 1
+    frame = data[i + RECORD.size : i + RECORD.size + frame_length]
+    if len(frame) < frame_length: break
+    records.append((direction, timestamp, frame))
+    i += RECORD.size + frame_length
+  if i != len(data): log.warning(f"Capture '{path}' ends in an incomplete record, ignoring the last '{len(data) - i}' bytes")
+  return (started, records)
+
+def replay(records: list, rounds: int = 1) -> dict:
+  """
+  Parse the captured responses, as fast as possible.
+
+  @param records, as returned by read_capture()
+  @param rounds, how many times the capture is parsed, to benchmark the parsers
+  @returns dict of statistics:
+    responses, how many responses were parsed
+    errors, dict of exception id or type -> count, of the responses which failed to parse or carried an error status
+    duration, seconds spent parsing
+    responses_per_second
+    round_trips, dict of command name -> dict of the count, mean and max seconds from writing the request to reading the response
+  """
+  responses = 0
+  errors = {}
+  round_trips = {}
+  duration = 0
+  for r in range(0, rounds):
+    tags_by_handle = {}
+    request = None
+    started = time.monotonic()
+    for direction, timestamp, frame in records:
+      if direction == DIRECTION_WRITE:
+        request = (timestamp, frame)
+        continue
+      if not request:
+        continue # The capture started in the middle of an exchange
+
+      responses += 1
+      try:
+        parse_response(request[1], frame, tags_by_handle)
+      except Exception as e:
+        error = getattr(e, 'id', None) if isinstance(e, exception_rfid.RFIDCommand) else type(e).__name__
+        errors[error] = errors.get(error, 0) + 1
+
+      if r == 0:
+        command_name = get_command_name(request[1])
+        rt = round_trips.setdefault(command_name, {'count': 0, 'mean': 0, 'max': 0, 'total': 0})
+        rt['count'] += 1
+        rt['total'] += timestamp - request[0]
+        rt['max'] = max(rt['max'], timestamp - request[0])
+      request = None
+    duration += time.monotonic() - started
+
+  for rt in round_trips.values():
+    rt['mean'] = rt.pop('total') / rt['count']
+  return {
+    'responses': responses,
+    'errors': errors,
+    'duration': duration,
+    'responses_per_second': responses / duration if duration else 0,
+    'round_trips': round_trips,
+  }
+
+def get_command_name(request: bytes) -> str:
+  if request[3] & 0xC0 == 0xC0: return 'resync'
+  return command_names.get(request[4], hex(request[4]))
+
+def parse_response(request: bytes, response: bytes, tags_by_handle: dict) -> Message:
+  """
+  Parse the response with the message class the RFID_Reader reads it with.
+  The tags connected to are tracked in tags_by_handle, so the tag memory responses can be parsed with the tag's block size.
+  """
+  if request[3] & 0xC0 == 0xC0:
+    return SBlock_RESYNC_Response(response)
+
+  INF = request[4:-2]
+  CMD = INF[0]
+  if CMD == iblock.CMD_INVENTORY:
+    i = [1]
+    field1 = helpers.shift_byte(INF, i)[0]
+    if field1 & 1<<0: helpers.shift_bytes(INF, i, (helpers.shift_byte(INF, i)[0] + 7) // 8) # Antenna selection
+    embedded_commands = []
+    if field1 & 1<<1:
+      afi, access_operations = iblock.shift_air_protocol_inventory_parameters(INF, i)
+      embedded_commands = [access_operation_to_mac_command(*access_operation) for access_operation in access_operations]
+    return IBlock_TagInventory_Response(response, embedded_commands)
+
+  elif CMD == iblock.CMD_CONNECT:
+    tag = Tag('{:16x}'.format(helpers.lower_byte_fo_to_int(INF[6:14])))
+    tag.air_protocol_type_id(INF[2])
+    tag.tag_type_id(INF[3])
+    message = IBlock_TagConnect_Response(response, tag)
+    tags_by_handle[tag.get_connection_handle()[0]] = tag
+    return message
+
+  elif CMD == iblock.CMD_DISCONNECT:
+    tag = tags_by_handle.pop(INF[1], None) or Tag()
+    if not tag.get_connection_handle(): tag.connect(INF[1:2])
+    return IBlock_TagDisconnect_Response(response, tag)
+
+  elif CMD == iblock.CMD_MEMORY_ACCESS:
+    tag = tags_by_handle.get(INF[1]) or Tag()
+    mac_command = access_operation_to_mac_command(*tag_memory_access_command.shift_access_operation(INF, [2]))
+    return IBlock_TagMemoryAccess_Response(tag, mac_command).receive(response)
+
+  message = Message()
+  parseMessage(message, response)
+  return message
+
+def access_operation_to_mac_command(access_code: int, parameter: bytes) -> TagMemoryAccessCommand:
+  """
+  @returns TagMemoryAccessCommand which parses the response of the given access operation like the original command does
+  """
+  mac_command = TagMemoryAccessCommand()
+  if access_code == tag_memory_access_command.ACCESS_GET_TAG_SYSTEM_INFORMATION:
+    return mac_command.ISO15693_GetTagSystemInformation()
+  elif access_code == tag_memory_access_command.ACCESS_READ_MULTIPLE_BLOCKS:
+    return mac_command.ISO15693_ReadMultipleBlocks(
+      read_security_status=parameter[0],
+      start_block_address=helpers.word_to_int(parameter[1:3]),
+      number_of_blocks_to_read=helpers.word_to_int(parameter[3:5]),
+    )
+  mac_command.command = helpers.int_to_word(access_code)
+  mac_command.parameter = parameter
+  mac_command.response_parser = mac_command._no_response_parser
+  return mac_command
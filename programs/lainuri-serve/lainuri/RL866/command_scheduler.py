@@ -0,0 +1,180 @@
+"""
+Schedules the threads sharing a RFID reader's serial line, one request/response exchange at a time.
+
+Each exchange waits for its turn by the priority class of the thread sending it:
+  PRIORITY_SECURITY   the gate alarm writes of a checkout or a checkin
+  PRIORITY_USER       fleshing the tags a patron just placed on the reader
+  PRIORITY_BACKGROUND the inventory polling, and everything not given a priority
+Multi-frame operations whose frames must not be interleaved with other commands, like draining an inventory with
+continue inventory commands, hold one turn for all of their frames. The turn is reentrant, so the exchanges inside
+it don't queue again. Between the frames they check preempted(), and give up the operation if a more urgent exchange
+is waiting, eg. the inventory is taken again on the next poll. Other multi-frame operations, like reading a long tag
+memory, take a turn for each frame.
+So a security write waits for the one exchange already on the wire, which can still take up to the serial read
+timeout if the reader doesn't answer. Within a class the exchange with the earliest deadline goes first, then the
+one waiting the longest. Exchanges getting their turn past their deadline are recorded.
+
+The time each exchange waited for its turn is recorded into the metric 'rfid.queue_wait.<class>',
+and the time past the deadline of the exchanges getting their turn late into 'rfid.deadline_missed'.
+
+  with command_scheduler.priority(command_scheduler.PRIORITY_SECURITY, deadline=0.5):
+    IBlock_TagConnect_Response(rfid_reader.transceive(IBlock_TagConnect(tag)), tag)
+"""
+
+from lainuri.config import get_config
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+
+import lainuri.metrics as metrics
+
+import heapq
+import itertools
+import math
+import threading
+import time
+
+PRIORITY_SECURITY = 0
+PRIORITY_USER = 1
+PRIORITY_BACKGROUND = 2
+priority_names = {
+  PRIORITY_SECURITY: 'security',
+  PRIORITY_USER: 'user',
+  PRIORITY_BACKGROUND: 'background',
+}
+
+_thread_priority = threading.local()
+
+def current_priority() -> tuple:
+  """
+  @returns tuple (priority class, deadline seconds or None) of the RFID commands the calling thread sends
+  """
+  return (getattr(_thread_priority, 'priority_class', PRIORITY_BACKGROUND), getattr(_thread_priority, 'deadline', None))
+
+class priority():
+  """
+  Context manager setting the priority class of the RFID commands the thread sends inside the block.
+  Nested blocks keep the more urgent priority class and the earlier deadline.
+  """
+  __slots__ = ('priority_class', 'deadline', 'previous')
+
+  def __init__(self, priority_class: int, deadline: float = None):
+    """
+    @param deadline, seconds each exchange inside the block may wait for its turn
+    """
+    self.priority_class = priority_class
+    self.deadline = deadline
+
+  def __enter__(self):
+    self.previous = current_priority()
+    previous_class, previous_deadline = self.previous
+    _thread_priority.priority_class = min(previous_class, self.priority_class)
+    deadlines = [d for d in (previous_deadline, self.deadline) if d is not None]
+    _thread_priority.deadline = min(deadlines) if deadlines else None
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    _thread_priority.priority_class, _thread_priority.deadline = self.previous
+    return False
+
+class CommandScheduler():
+  def __init__(self, name: str = ''):
+    self.name = name
+    self.condition = threading.Condition()
+    self.busy = False
+    self.owner = None # Thread holding the turn
+    self.depth = 0 # Nested turns of the owner
+    self.holder = None # Heap entry of the owner
+    self.waiting = [] # Heap of tuples (priority class, deadline, arrival sequence)
+    self.sequence = itertools.count()
+    self.exchanges = {priority_class: 0 for priority_class in priority_names}
+    self.deadlines_missed = 0
+
+  def turn(self, priority_class: int = None, deadline: float = None) -> 'Turn':
+    """
+    @param priority_class, None for the calling thread's current priority class
+    @param deadline, seconds the exchange may wait for its turn, None for the calling thread's current deadline
+    @returns context manager holding the serial line for the exchanges in the block
+    """
+    if priority_class is None:
+      priority_class, current_deadline = current_priority()
+      if deadline is None: deadline = current_deadline
+    return Turn(self, priority_class, deadline)
+
+  def acquire(self, priority_class: int, deadline: float = None) -> float:
+    """
+    Wait for the turn to use the serial line. A thread already holding the turn keeps it.
+
+    @returns seconds waited
+    """
+    started = time.monotonic()
+    deadline = started + deadline if deadline is not None else math.inf
+    entry = (priority_class, deadline, next(self.sequence))
+    with self.condition:
+      if self.owner == threading.get_ident():
+        self.depth += 1
+        self.exchanges[priority_class] = self.exchanges.get(priority_class, 0) + 1
+        return 0
+      heapq.heappush(self.waiting, entry)
+      try:
+        while self.busy or self.waiting[0] is not entry:
+          self.condition.wait()
+      finally: # Also if the wait is interrupted, so the entry doesn't block the ones behind it
+        if self.waiting[0] is entry:
+          heapq.heappop(self.waiting)
+        else:
+          self.waiting.remove(entry)
+          heapq.heapify(self.waiting)
+          self.condition.notify_all()
+      self.busy = True
+      self.owner = threading.get_ident()
+      self.depth = 1
+      self.holder = entry
+      self.exchanges[priority_class] = self.exchanges.get(priority_class, 0) + 1
+
+    now = time.monotonic()
+    metrics.record('rfid.queue_wait.' + priority_names.get(priority_class, str(priority_class)), now - started)
+    if now > deadline:
+      self.deadlines_missed += 1
+      metrics.record('rfid.deadline_missed', now - deadline)
+      log.warning(f"RFID reader '{self.name}' {priority_names.get(priority_class)} command got its turn '{now - deadline:.3f}' s past its deadline")
+    return now - started
+
+  def release(self):
+    with self.condition:
+      self.depth -= 1
+      if self.depth: return
+      self.busy = False
+      self.owner = None
+      self.holder = None
+      self.condition.notify_all()
+
+  def preempted(self) -> bool:
+    """
+    @returns True if an exchange more urgent than the turn held is waiting, ie. one of a more urgent priority class,
+             or of the same class with an earlier deadline
+    """
+    with self.condition:
+      return bool(self.waiting) and self.holder is not None and self.waiting[0][:2] < self.holder[:2]
+
+  def to_ui(self) -> dict:
+    return {
+      'waiting': len(self.waiting),
+      'exchanges': {priority_names.get(priority_class, str(priority_class)): count for priority_class, count in self.exchanges.items()},
+      'deadlines_missed': self.deadlines_missed,
+    }
+
+class Turn():
+  __slots__ = ('scheduler', 'priority_class', 'deadline')
+
+  def __init__(self, scheduler: CommandScheduler, priority_class: int, deadline: float):
+    self.scheduler = scheduler
+    self.priority_class = priority_class
+    self.deadline = deadline
+
+  def __enter__(self):
+    self.scheduler.acquire(self.priority_class, self.deadline)
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.scheduler.release()
+    return False
@@ -4,11 +4,52 @@ log = logging.getLogger(__name__)
 
 import lainuri.exception.rfid as exception_rfid
 import lainuri.helpers as helpers
-from lainuri.RL866.tag_memory_access_command import TagMemoryAccessCommand
+from lainuri.RL866.tag_memory_access_command import TagMemoryAccessCommand, shift_access_operation
 from lainuri.RL866.message import Message, Request, Response, parseMessage, parseIBlockResponseINF
 from lainuri.RL866.tag import Tag
 import lainuri.RL866.state as state
 
+import struct
+
+WORD = struct.Struct('<H')
+SERIAL_NUMBER = struct.Struct('<Q') # The first 8 bytes of the serial number, ISO15693 UID
+
+# Tag report flag bits, which fields are present in the report
+TAG_REPORT_ANTENNA_ID = 1<<0
+TAG_REPORT_AIR_PROTOCOL_TYPE_ID = 1<<1
+TAG_REPORT_TAG_TYPE_ID = 1<<2
+TAG_REPORT_SERIAL_NUMBER = 1<<3
+TAG_REPORT_TAG_MEMORY_DATA = 1<<4
+TAG_REPORT_EMBEDDED_COMMAND = 1<<7
+
+# CMD bytes of the I-blocks, as ints, to dispatch on the first byte of a request's INF
+CMD_INVENTORY = 0x31
+CMD_CONNECT = 0x32
+CMD_DISCONNECT = 0x33
+CMD_MEMORY_ACCESS = 0x34
+
+def shift_air_protocol_inventory_parameters(buffer: bytes, i: list) -> tuple:
+  """
+  Parse the air protocol inventory parameters of a TagInventory request, see IAirProtocolInventoryParameter
+
+  @param i, iterator as an array, incremented past the parameters
+  @returns tuple (afi filter, list of embedded access operations as tuples (access code, access parameter))
+  """
+  afi = None
+  embedded_commands = []
+  for n in range(0, helpers.shift_byte(buffer, i)[0]):
+    helpers.shift_byte(buffer, i) # Air protocol
+    helpers.shift_byte(buffer, i) # Antenna interface
+    end = helpers.shift_ebv(buffer, i) + i[0]
+    flag = helpers.shift_byte(buffer, i)[0]
+    if flag & 1<<0: afi = helpers.shift_byte(buffer, i)[0]
+    if flag & 1<<1: helpers.shift_bytes(buffer, i, 4) # Tag memory reads are not reported, use the embedded commands
+    if flag & 1<<7:
+      for m in range(0, helpers.shift_byte(buffer, i)[0]):
+        embedded_commands.append(shift_access_operation(buffer, i))
+    i[0] = end
+  return (afi, embedded_commands)
+
 class ITimeout():
   def __init__(self, type: int = 0, timeout: int = 500, value: int = 0):
     if type not in (0,1,2,3):
@@ -17,22 +58,85 @@ class ITimeout():
     self.timeout = timeout
     self.value = value
 
+class IAirProtocolInventoryParameter():
+  """
+  6.3.Air protocol inventory parameter, for the ISO15693 air protocol.
+
+    Field 1.Flag:
+      Data type:BYTE
+      b0: AFI is present or not
+      b1: Tag memory read is present or not
+      b7: Embedded commands are present or not
+    Field 2.AFI:
+      Data type:BYTE
+      Only tags with this AFI answer the inventory.
+      This field is only present if flag's bit 0 is '1'
+    Field 3.Tag memory read:
+      This field is only present if flag's bit 1 is '1'
+      The blocks read are returned in the "Tag memory data" fields of the tag report.
+      Field 3.1.Start block address:
+        Data type:WORD
+      Field 3.2.Number of blocks to read:
+        Data type:WORD
+    Field 4.Embedded commands: Node
+      This field is only present if flag's bit 7 is '1'
+      The results are returned in the "Embedded commands" field of the tag report.
+      Field 4.1.Number of embedded commands:
+        Data type:BYTE
+      Field 4.2.Embedded command #1:
+        Same as the "Tag access operation" of the tag memory access command.
+      ......
+      Field 4.n.Embedded command #n
+  """
+  def __init__(self, air_interface_protocol: int = state.AIR_PROTO_ISO15693, antenna_interface: int = 0, afi: int = None, read_tag_memory: tuple = None, embedded_commands: list = None):
+    """
+    @param antenna_interface, 0 means the parameter applies to all antenna interfaces
+    @param read_tag_memory, tuple (start_block_address, number_of_blocks_to_read)
+    @param embedded_commands, list of TagMemoryAccessCommands to run for each tag found
+    """
+    self.air_interface_protocol = air_interface_protocol
+    self.antenna_interface = antenna_interface
+    self.afi = afi
+    self.read_tag_memory = read_tag_memory
+    self.embedded_commands = embedded_commands or []
+
+  def pack(self) -> bytes:
+    flag = 0x00
+    parameter = bytearray()
+    if self.afi != None:
+      flag |= 1<<0
+      parameter += helpers.int_to_byte(self.afi)
+    if self.read_tag_memory:
+      flag |= 1<<1
+      parameter += helpers.int_to_word(self.read_tag_memory[0]) + helpers.int_to_word(self.read_tag_memory[1])
+    if self.embedded_commands:
+      flag |= 1<<7
+      parameter += helpers.int_to_byte(len(self.embedded_commands))
+      for mac_command in self.embedded_commands:
+        parameter += mac_command.pack_access_operation()
+    return bytes([flag]) + parameter
+
 class IBlock(Message):
   def __init__(self, RID, INF):
     if not self.PCB:
-      PCB = 0x00
       #PCB = PCB | (1<<5) # Chaining bit is set
-      if state.transmission_sequence_number == 0:
-        PCB = PCB & ~(1<<6)
-      elif state.transmission_sequence_number == 1:
-        PCB = PCB |  (1<<6)
-      else:
-        raise Exception(f"transmission_sequence_number '{state.transmission_sequence_number}' must be 1 or 0!")
-      self.PCB = bytes([PCB])
+      self.sequence(state.transmission_sequence_number)
 
     super().__init__(RID=RID, INF=INF)
 
-    if isinstance(self, Request): state.increment_transmission_sequence_number()
+  def sequence(self, transmission_sequence_number: int):
+    """
+    Stamp the I-block sequence number into the PCB.
+    """
+    PCB = self.PCB[0] if self.PCB else 0x00
+    if transmission_sequence_number == 0:
+      PCB = PCB & ~(1<<6)
+    elif transmission_sequence_number == 1:
+      PCB = PCB |  (1<<6)
+    else:
+      raise Exception(f"transmission_sequence_number '{transmission_sequence_number}' must be 1 or 0!")
+    self.PCB = bytes([PCB])
+    return self
 
 class IBlock_ReadSystemConfigurationBlock(IBlock, Request):
   """
@@ -117,7 +221,7 @@ class IBlock_TagInventory(IBlock, Request):
 
     super().__init__(RID=state.RID_request, INF=self.INF)
 
-  def field2_query_multiple_antenna(self, query_multiple_antenna) -> bytearray:
+  def field2_query_multiple_antenna(self, query_multiple_antenna: list) -> bytearray:
     """
     Field 2.Antenna selection parameter:
       Field 2.1 Number of antenna:
@@ -127,13 +231,20 @@ class IBlock_TagInventory(IBlock, Request):
       LEN=(Number of antenna+7)/ 8
       If the corresponding bit is 1, it indicates that the corresponding
       antenna interface is selected.
+
+    The manual is rather obscure about the bit order. Antenna id 1 is the lowest bit of the first byte,
+    so selecting only antenna 1 gives 01 01, which is what was sent here before the antennas were configurable.
+
+    @param query_multiple_antenna, list of antenna ids to inventory, starting from 1
     """
-    field2 = bytearray()
-    # TODO The manual is rather obscure about the content of the bytes
-    # So skipping it's implementation specifics for now
-    field2.append(1)
-    field2.append(1)
+    number_of_antenna = max(query_multiple_antenna)
+    selection_bits = bytearray((number_of_antenna + 7) // 8)
+    for antenna_id in query_multiple_antenna:
+      if antenna_id < 1: raise ValueError(f"Antenna id '{antenna_id}' must be 1 or more")
+      selection_bits[(antenna_id - 1) // 8] |= 1 << ((antenna_id - 1) % 8)
 
+    field2 = bytearray([number_of_antenna])
+    field2 += selection_bits
     return field2
 
   def field3_air_protocol_parameter_set(self, parameters) -> bytearray:
@@ -162,10 +273,11 @@ class IBlock_TagInventory(IBlock, Request):
     field3 = bytearray()
     field3.append(len(parameters))
     for p in parameters:
+      parameter = p.pack()
       field3.append( state.getAirProtocolCode(p) )
-      field3.append( p.antenna_interface // 0 ) # Which antenna interface the antenna is applied to 0 means it applies to all antenna interfaces
-      field3.append(  ) # Parameter length
-      field3.append(  ) # 6.3. Air protocol inventory parameter
+      field3.append( p.antenna_interface ) # Which antenna interface the antenna is applied to 0 means it applies to all antenna interfaces
+      field3 += helpers.int_to_ebv(len(parameter)) # Parameter length
+      field3 += parameter # 6.3. Air protocol inventory parameter
 
     return field3
 
@@ -197,7 +309,12 @@ class IBlock_TagInventory_Response(IBlock, Response):
   tags_buffered = -1
   tags: Tag = []
 
-  def __init__(self, resp_bytes: bytearray):
+  def __init__(self, resp_bytes: bytearray, embedded_commands: list = None):
+      """
+      @param embedded_commands, the TagMemoryAccessCommands embedded in the inventory request, to parse the embedded command results with
+      """
+      self.embedded_commands = embedded_commands or []
+
       parseMessage(self, resp_bytes)
       parseIBlockResponseINF(self)
 
@@ -221,6 +338,7 @@ class IBlock_TagInventory_Response(IBlock, Response):
       there are more labels need to inventory, you need to issue continue inventory
       command, the bit 3 of “Field1 flag” set to 1.
     """
+    self.stop_type = self.PARM[0]
     return bytearray(self.PARM[0:1])
 
   def field2_total_number_of_tag_report_buffered(self) -> bytearray:
@@ -293,71 +411,85 @@ class IBlock_TagInventory_Response(IBlock, Response):
     ......
     Field n Tag report # n: Node
     """
-    # Iterator is an array, because Python doesn't have references to atomic objects
-    i = [4] # Start iterating the PARM after all the static fields have been processed
+    # A single pass over the reports with an integer offset, reading the fields in place through a memoryview.
+    # Only the tag memory data is copied out, the other fields are decoded straight into the Tag.
+    PARM = memoryview(self.PARM)
+    i = 4 # Start iterating the PARM after all the static fields have been processed
     self.tags = []
     for j in range(0,self.tags_transmitted):
       tag = Tag()
       self.tags.append(tag)
 
-      tag.field41 = helpers.shift_byte(self.PARM, i)
-      tag.antenna_id_present           = tag.field41[0] & 1<<0
-      tag.air_protocol_type_id_present = tag.field41[0] & 1<<1
-      tag.tag_type_id_present          = tag.field41[0] & 1<<2
-      tag.tag_serial_number_present    = tag.field41[0] & 1<<3
-      tag.tag_memory_data_present      = tag.field41[0] & 1<<4
-      tag.embedded_command_present     = tag.field41[0] & 1<<7
-      log.debug(f"New tag '{tag}'")
-
-      tag.field42 = None
-      if tag.antenna_id_present:
-        tag.field42 = helpers.shift_byte(self.PARM, i)
-        tag.antenna_id(tag.field42[0])
-        log.debug(f"antenna id '{tag.antenna_id}' detected")
-
-      tag.field43 = None
-      if tag.air_protocol_type_id_present:
-        tag.field43 = helpers.shift_byte(self.PARM, i)
-        tag.air_protocol_type_id(tag.field43[0])
-        log.debug(f"air protocol '{state.air_protocol_type_table[tag.air_protocol_type_id()]}' detected")
-
-      tag.field44 = None
-      if tag.tag_type_id_present:
-        tag.field44 = helpers.shift_byte(self.PARM, i)
-        tag.tag_type_id(tag.field44[0])
-        log.debug(f"tag type id '{tag.tag_type_id}'")
-
-      tag.field45 = None
-      if tag.tag_serial_number_present:
-        tag.field45 = helpers.shift_byte(self.PARM, i)
-        tag.length_of_serial_number = tag.field45[0]
-        log.debug(f"length of serial number '{tag.length_of_serial_number}'")
-      tag.field46 = None
-      if tag.tag_serial_number_present:
-        tag.field46 = helpers.shift_bytes(self.PARM, i, tag.length_of_serial_number)
-        #tag.serial_number(hex(helpers.lower_byte_fo_to_int(tag.field46[0:8])))
-        tag.serial_number('{:16x}'.format(helpers.lower_byte_fo_to_int(tag.field46[0:8])))
-        log.debug(f"Received serial number '{tag.serial_number}'")
-
-      tag.field47 = None
-      if tag.tag_memory_data_present:
-        tag.field47 = helpers.shift_word(self.PARM, i)
-        tag.number_of_tag_memory_bits = tag.field47[0]
-        log.debug(f"number of tag memory bits '{tag.number_of_tag_memory_bits}'")
-      tag.field48 = None
-      if tag.tag_memory_data_present:
-        tag.field48 = helpers.shift_bytes(self.PARM, i, tag.number_of_tag_memory_bits/8)
-        tag.tag_memory(hex(helpers.lower_byte_fo_to_int(tag.field48)))
-        log.debug(f"Received tag memory data '{tag.tag_memory}'")
-
-      #TODO:: tag.field48 Embedded commands and all the subfields
-      if tag.embedded_command_present:
-        raise Exception("TODO: embedded_command_present, but no support implemented. Triggered by tag '{j}' in message {self.__dict__}")
+      flag = PARM[i]
+      i += 1
+      if flag & TAG_REPORT_ANTENNA_ID:
+        tag._antenna_id = PARM[i]
+        i += 1
+      if flag & TAG_REPORT_AIR_PROTOCOL_TYPE_ID:
+        tag._air_protocol_type_id = PARM[i]
+        i += 1
+      if flag & TAG_REPORT_TAG_TYPE_ID:
+        tag._tag_type_id = PARM[i]
+        i += 1
+      if flag & TAG_REPORT_SERIAL_NUMBER:
+        length_of_serial_number = PARM[i]
+        i += 1
+        if length_of_serial_number >= 8: serial_number = SERIAL_NUMBER.unpack_from(PARM, i)[0]
+        else:                            serial_number = int.from_bytes(PARM[i:i+length_of_serial_number], 'little')
+        tag._serial_number = '{:16x}'.format(serial_number)
+        i += length_of_serial_number
+      if flag & TAG_REPORT_TAG_MEMORY_DATA:
+        tag.number_of_tag_memory_bits = WORD.unpack_from(PARM, i)[0]
+        i += 2
+        length_of_tag_memory = (tag.number_of_tag_memory_bits + 7) // 8
+        tag._tag_memory = bytes(PARM[i:i+length_of_tag_memory])
+        i += length_of_tag_memory
+      if flag & TAG_REPORT_EMBEDDED_COMMAND:
+        iterator = [i]
+        self.field49_embedded_commands(tag, iterator)
+        i = iterator[0]
+      if i > len(PARM):
+        raise exception_rfid.RFIDCommand('ERR_MSG_SIZE', f"Tag report #{j+1} overflows the inventory response of '{len(PARM)}' bytes")
 
       tag.validate()
 
     return self.tags
 
+  def field49_embedded_commands(self, tag: Tag, i: list):
+    """
+    Field 4.9.Embedded commands: Node
+      Field 4.9.1 The total length of the embedded command:
+        Data type:EBV
+      Field 4.9.2 - 4.9.5 Embedded command result #1 .. #n:
+        Same as the "Access operation result" of the tag memory access command response.
+
+    An embedded command failing for the tag is recorded into the AccessOperationResult.exception of the tag,
+    instead of failing the inventory of all the tags.
+    """
+    total_length = helpers.shift_ebv(self.PARM, i)
+    end = i[0] + total_length
+    tag.embedded_command_results = []
+    while i[0] < end:
+      result = AccessOperationResult()
+      peek = [i[0]]
+      helpers.shift_ebv(self.PARM, peek) # Peek past the result length to find out which command the result is for
+      access_code = helpers.shift_word(self.PARM, peek)
+      mac_commands = [mac for mac in self.embedded_commands if mac.command == access_code]
+      if not mac_commands:
+        raise exception_rfid.RFIDCommand('ERR_READ', f"Embedded command result '{access_code.hex()}' for tag '{tag.serial_number()}' doesn't match any of the embedded commands '{[mac.command.hex() for mac in self.embedded_commands]}'")
+      try:
+        parse_access_operation_result(result, self.PARM, i, tag, mac_commands[0])
+      except exception_rfid.RFIDCommand as e:
+        # The command failed for this tag only, eg. the tag has less blocks than were read. The result is already
+        # shifted past, so keep the rest of the inventory and let the tag be fleshed by connecting to it.
+        log.info(f"Embedded command '{access_code.hex()}' failed for tag '{tag.serial_number()}'. {e}")
+        result.exception = e
+      tag.embedded_command_results.append(result)
+    if any(result.exception for result in tag.embedded_command_results):
+      tag._tag_memory = None
+    if i[0] != end:
+      raise exception_rfid.RFIDCommand('ERR_MSG_SIZE', f"Embedded command results of tag '{tag.serial_number()}' overflow their total length '{total_length}'")
+
 class IBlock_TagConnect(IBlock, Request):
   """
   1. ISO14443A tag, the connection contains REQA / WUPA, SELECT,
@@ -434,11 +566,10 @@ class IBlock_TagConnect(IBlock, Request):
           When address mode is 0 ,this field should be absent.
       """
       field5.append(1)
-      if len(tag.field46) != 9: raise Exception(f"Connecting to tag failed. serial number {tag.field46} is not 8 bytes + terminator long! Using tag '{tag.__dict__}'")
-      field5 += tag.field46[0:8]
+      field5 += tag.serial_number_bytes()
 
     else:
-      raise exception_rfid.TagMalformed(id=tag.serial_number(), description=f"Unsupported air_protocol '{state.air_protocol_type_table[tag.air_protocol_type_id()]}'. Using tag '{tag.__dict__}'")
+      raise exception_rfid.TagMalformed(id=tag.serial_number(), description=f"Unsupported air_protocol '{state.air_protocol_type_table[tag.air_protocol_type_id()]}'. Using tag '{tag.to_dict()}'")
 
     return field5
 
@@ -476,7 +607,7 @@ class IBlock_TagDisconnect(IBlock, Request):
     00: Disconnect all tags connected
     """
     self.field1 = tag.get_connection_handle()
-    if None == self.field1: raise Exception(f"Trying to disconnect a tag that has not been connected to? Tag '{tag.__dict__}'")
+    if None == self.field1: raise Exception(f"Trying to disconnect a tag that has not been connected to? Tag '{tag.to_dict()}'")
     self.INF += self.field1
 
     super().__init__(RID=state.RID_request, INF=self.INF)
@@ -525,7 +656,7 @@ class IBlock_TagMemoryAccess(IBlock, Request):
     >0: Hanlde of connected tag
     """
     self.field1 = tag.get_connection_handle()
-    if None == self.field1: raise Exception(f"Trying to memory access a tag that has not been connected to? Tag '{tag.__dict__}'")
+    if None == self.field1: raise Exception(f"Trying to memory access a tag that has not been connected to? Tag '{tag.to_dict()}'")
     self.INF += self.field1
 
     """
@@ -557,11 +688,11 @@ class IBlock_TagMemoryAccess(IBlock, Request):
     ......
     Field 3.Tag access operatio#n
     """
-    self.field31 = bytes([mac_command.len()])
+    self.field31 = helpers.int_to_ebv(mac_command.len())
     self.field32 = mac_command.command
     self.field33 = mac_command.parameter
 
-    return self.field31 + self.field32 + self.field33
+    return mac_command.pack_access_operation()
 
 
 class IBlock_TagMemoryAccess_Response(IBlock, Response):
@@ -607,26 +738,46 @@ class IBlock_TagMemoryAccess_Response(IBlock, Response):
     ......
     Field n. Access operation result#n
     """
-    self.field11 = self.PARM[0:1] # TODO: Presume length is always only 1 byte
-    self.length_of_access_result = self.field11[0]
-    self.field12 = self.PARM[1:3]
-    self.access_code = helpers.word_to_int(self.field12)
-    self.field13 = self.PARM[3:4]
-    self.access_status = self.field13[0]
-    self.field14 = self.PARM[4:]
-
-    if self.field12 != mac_command.command:
-      raise Exception(f"Access code/command of the request '{mac_command.command}' and response '{self.field12}' do not match! Message '{self.__dict__}'")
+    return parse_access_operation_result(self, self.PARM, [0], tag, mac_command)
 
-    if self.access_status != 1:
-      self.error_code = helpers.word_to_int(self.field14)
-      error = state.error_codes.get(self.error_code)
-      if not error: error = ['ERR_???', f"Given message '{self}' has status error '{self.STA.hex()}' but there is no matching error code?"]
-      raise exception_rfid.RFIDCommand(*error)
 
-    if not mac_command.response_parser:
-      raise Exception(f"No response handler in mac_command '{mac_command}'! Message '{self.__dict__}'")
+class AccessOperationResult():
+  """
+  Result of a single tag memory access operation, eg. an embedded command of the inventory tag report.
+  See parse_access_operation_result()
+  """
+  exception = None # exception.rfid.RFIDCommand if the operation failed for the tag
 
-    mac_command.response_parser(self, tag)
+def parse_access_operation_result(result, buffer: bytes, i: list, tag: Tag, mac_command: TagMemoryAccessCommand) -> bytes:
+  """
+  Parse the access operation result starting from the buffer index i and feed it to the mac_command's response parser.
+  Populates the parsing object result with field11 - field14.
 
-    return self.field11 + self.field12 + self.field13 + self.field14
+  @param i, iterator as an array, incremented past the access operation result
+  @returns the bytes of the whole access operation result
+  """
+  start = i[0]
+  result.length_of_access_result = helpers.shift_ebv(buffer, i)
+  result.field11 = buffer[start:i[0]]
+  end = i[0] + result.length_of_access_result
+  result.field12 = helpers.shift_word(buffer, i)
+  result.access_code = helpers.word_to_int(result.field12)
+  result.field13 = helpers.shift_byte(buffer, i)
+  result.access_status = result.field13[0]
+  result.field14 = helpers.shift_bytes(buffer, i, end - i[0])
+
+  if result.field12 != mac_command.command:
+    raise Exception(f"Access code/command of the request '{mac_command.command}' and response '{result.field12}' do not match! Result '{result.__dict__}'")
+
+  if result.access_status != 1:
+    result.error_code = helpers.word_to_int(result.field14)
+    error = state.error_codes.get(result.error_code)
+    if not error: error = ['ERR_???', f"Given result '{result.__dict__}' has status error '{result.field14.hex()}' but there is no matching error code?"]
+    raise exception_rfid.RFIDCommand(*error)
+
+  if not mac_command.response_parser:
+    raise Exception(f"No response handler in mac_command '{mac_command}'! Result '{result.__dict__}'")
+
+  mac_command.response_parser(result, tag)
+
+  return buffer[start:end]
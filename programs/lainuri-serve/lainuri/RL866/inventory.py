@@ -0,0 +1,176 @@
+"""
+Keeps track of which RFID tags are present in the reader's field.
+
+Tags are keyed by their serial number (UID), so diffing a fresh inventory
+against the tags already present is a dict lookup per tag instead of a scan
+of every present tag.
+
+Each tag goes through a small presence state machine, to debounce tags
+flickering on the edge of the antenna's field:
+
+  APPEARING -- seen appear_hysteresis consecutive inventories --> PRESENT
+  APPEARING -- missed once ---------------------------------------> forgotten
+  PRESENT   -- missed disappear_hysteresis consecutive inventories -> lost
+
+Only the PRESENT-transitions are announced as new/lost tags.
+
+With multiple antennas, a round may inventory only some of the antennas. A tag is then counted as missed
+only if an antenna it was last seen at was inventoried, so tags at the idle antennas are not lost just because
+their antenna was not inventoried on this round.
+
+The present tags are also indexed by their serial number and primary item identifier (item barcode),
+so per-item RFID operations, eg. setting the gate alarm, find their tag without scanning and decoding every tag.
+The indexes are updated as tags become present and are lost, and the lookups are thread safe,
+because the inventory is updated by the reader's polling thread and looked up by the event handlers.
+The primary item identifiers are decoded before taking the lock, so decoding tag memory doesn't block the lookups.
+"""
+
+from lainuri.config import get_config
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+
+import threading
+import time
+
+from lainuri.RL866.tag import Tag
+
+APPEARING = 'appearing'
+PRESENT = 'present'
+
+class TagPresence():
+  def __init__(self, tag: Tag):
+    self.tag = tag
+    self.state = APPEARING
+    self.seen_count = 0
+    self.missed_count = 0
+    self.antennas = set() # Antennas the tag was seen at on the latest inventory it was seen in
+    self.last_seen = {} # antenna id -> time.time() when the tag was last seen at the antenna
+    self.primary_item_identifier = None # The tag is indexed by this, while it is present
+
+  def __repr__(self):
+    return f"{self.__class__} at {id(self)}:> serial_number='{self.tag.serial_number()}' state='{self.state}' seen_count='{self.seen_count}' missed_count='{self.missed_count}' antennas='{self.antennas}'"
+
+class Inventory():
+  def __init__(self, appear_hysteresis: int = None, disappear_hysteresis: int = None):
+    """
+    @param appear_hysteresis, how many consecutive inventories a tag must be seen in, before it is announced as new
+    @param disappear_hysteresis, how many consecutive inventories a present tag must be missing from, before it is announced as lost
+    """
+    self.appear_hysteresis = appear_hysteresis or get_config('devices.rfid-reader.inventory-appear-hysteresis') or 1
+    self.disappear_hysteresis = disappear_hysteresis or get_config('devices.rfid-reader.inventory-disappear-hysteresis') or 2
+    self.tags: dict = {}
+    self.tags_by_serial_number: dict = {} # serial number -> present Tag
+    self.tags_by_primary_item_identifier: dict = {} # primary item identifier -> present Tag
+    self.lock = threading.Lock()
+
+  def clear(self):
+    with self.lock:
+      self.tags = {}
+      self.tags_by_serial_number = {}
+      self.tags_by_primary_item_identifier = {}
+
+  def tags_present(self) -> list:
+    with self.lock:
+      return list(self.tags_by_serial_number.values())
+
+  def find_by_serial_number(self, serial_number: str) -> Tag:
+    """
+    @returns the present Tag, or None
+    """
+    with self.lock:
+      return self.tags_by_serial_number.get(serial_number)
+
+  def find_by_primary_item_identifier(self, primary_item_identifier: str) -> Tag:
+    """
+    @returns the present Tag, or None
+    """
+    with self.lock:
+      return self.tags_by_primary_item_identifier.get(primary_item_identifier)
+
+  def is_settled(self) -> bool:
+    """
+    @returns False if some tag is still being debounced, ie. it is appearing or has been missed
+    """
+    with self.lock:
+      for tp in self.tags.values():
+        if tp.state == APPEARING or tp.missed_count: return False
+      return True
+
+  def _index(self, tp: TagPresence, primary_item_identifier: str):
+    tp.primary_item_identifier = primary_item_identifier
+    self.tags_by_serial_number[tp.tag.serial_number()] = tp.tag
+    if primary_item_identifier: self.tags_by_primary_item_identifier[primary_item_identifier] = tp.tag
+
+  def _unindex(self, tp: TagPresence):
+    self.tags_by_serial_number.pop(tp.tag.serial_number(), None)
+    if tp.primary_item_identifier and self.tags_by_primary_item_identifier.get(tp.primary_item_identifier) is tp.tag:
+      del self.tags_by_primary_item_identifier[tp.primary_item_identifier]
+
+  def update(self, tags: list, flesh: callable = None, antennas: list = None) -> tuple:
+    """
+    Diff the tags from a fresh inventory against the known tags.
+
+    @param tags, the tags received from the reader in this inventory round.
+                 The same tag can be reported by multiple antennas, the reports are merged by serial number.
+    @param flesh, callback invoked with the Tag when it is about to become present, eg. to read the tag memory.
+                  If it throws, no state is changed, so the tag is fleshed again on the next inventory round.
+    @param antennas, the antennas inventoried on this round. None means every antenna.
+    @returns tuple (tags_new, tags_lost)
+    """
+    tags_by_serial = {}
+    antennas_by_serial = {}
+    for tag in tags:
+      serial_number = tag.serial_number()
+      tags_by_serial.setdefault(serial_number, tag)
+      antennas_seen = antennas_by_serial.setdefault(serial_number, set())
+      if tag._antenna_id is not None: antennas_seen.add(tag._antenna_id)
+
+    # Flesh every tag becoming present before touching the state, so a failing tag doesn't leave the inventory half-updated.
+    # Their primary item identifiers are decoded here too, outside of the lock.
+    promoted = [] # tuples (serial number, primary item identifier)
+    for serial_number, tag in tags_by_serial.items():
+      tp = self.tags.get(serial_number)
+      if tp and tp.state == PRESENT: continue
+      if (tp.seen_count if tp else 0) + 1 >= self.appear_hysteresis:
+        if flesh: flesh(tp.tag if tp else tag)
+        promoted.append((serial_number, _primary_item_identifier(tp.tag if tp else tag)))
+
+    with self.lock:
+      now = time.time()
+      for serial_number, tag in tags_by_serial.items():
+        tp = self.tags.get(serial_number)
+        if not tp:
+          tp = self.tags[serial_number] = TagPresence(tag)
+        tp.seen_count += 1
+        tp.missed_count = 0
+        tp.antennas = antennas_by_serial[serial_number]
+        for antenna_id in tp.antennas: tp.last_seen[antenna_id] = now
+
+      tags_new = []
+      for serial_number, primary_item_identifier in promoted:
+        tp = self.tags[serial_number]
+        tp.state = PRESENT
+        self._index(tp, primary_item_identifier)
+        tags_new.append(tp.tag)
+
+      tags_lost = []
+      for serial_number in [sn for sn in self.tags.keys() if sn not in tags_by_serial]:
+        tp = self.tags[serial_number]
+        if antennas is not None and tp.antennas and not tp.antennas.intersection(antennas): continue # Not looked for on this round
+        tp.missed_count += 1
+        tp.seen_count = 0
+        if tp.state == APPEARING:
+          del self.tags[serial_number]
+        elif tp.missed_count >= self.disappear_hysteresis:
+          del self.tags[serial_number]
+          self._unindex(tp)
+          tags_lost.append(tp.tag)
+
+    return (tags_new, tags_lost)
+
+def _primary_item_identifier(tag: Tag) -> str:
+  """
+  Tags whose memory has not been read, eg. when not fleshed, are not decoded, as that would only fail.
+  """
+  if tag._primary_item_identifier is None and not tag._tag_memory: return None
+  return tag.iso25680_get_primary_item_identifier() or None
@@ -3,9 +3,17 @@ from lainuri.logging_context import logging
 log = logging.getLogger(__name__)
 
 import lainuri.exception.rfid as exception_rfid
+import lainuri.helpers as helpers
 import lainuri.RL866.CRC16
 import lainuri.RL866.state
 
+import struct
+
+# Precompiled layouts of the fixed parts of a frame, multibyte fields are little-endian
+FRAME_HEADER = struct.Struct('<BBBB') # SOF LEN RID PCB
+IBLOCK_RESPONSE_HEADER = struct.Struct('<BH') # CMD STA, at the start of the INF
+
+single_bytes = [bytes([i]) for i in range(256)] # Interned one-byte fields, instead of allocating new ones for each frame
 
 class Message():
   """
@@ -80,18 +88,10 @@ class Message():
 
   def pack(self) -> bytes:
     self.len()
-
-    data = self.SOF + self.LEN + self.RID + self.PCB
-    if self.INF: data += self.INF
-
-    data += self.chk()
-    return data
+    return b''.join((self.SOF, self.LEN, self.RID, self.PCB, self.INF or b'', self.chk()))
 
   def chk(self, CHK=None):
-    data = self.LEN + self.RID + self.PCB
-    if self.INF: data += self.INF
-
-    self.CHK = lainuri.RL866.CRC16.crc16(data)
+    self.CHK = lainuri.RL866.CRC16.crc16(b''.join((self.LEN, self.RID, self.PCB, self.INF or b'')))
 
     if CHK and CHK != self.CHK: raise Exception(f"${type(self)} - Given checksum '{CHK}' is not the expected checksum '{self.CHK}'")
     return self.CHK
@@ -111,30 +111,32 @@ class Response():
 def parseMessage(self, bs: bytes):
   """
   STATIC function to parse
+
+  The frame is read through a memoryview, so only the INF and the CHK are copied out of it.
   """
-  self.SOF = bytes([bs[0]])
-  self.LEN = bytes([bs[1]])
-  self.RID = bytes([bs[2]])
-  self.PCB = bytes([bs[3]])
-  self.CHK = bs[-2:]
-  self.INF = bs[4:-2]
-
-  if not self.CHK == lainuri.RL866.CRC16.crc16(self.LEN + self.RID + self.PCB + self.INF):
+  frame = memoryview(bs)
+  SOF, LEN, RID, PCB = FRAME_HEADER.unpack_from(frame, 0)
+  self.SOF = single_bytes[SOF]
+  self.LEN = single_bytes[LEN]
+  self.RID = single_bytes[RID]
+  self.PCB = single_bytes[PCB]
+  self.CHK = bytes(frame[-2:])
+  self.INF = bytes(frame[4:-2])
+
+  if not self.CHK == lainuri.RL866.CRC16.crc16(bytes(frame[1:-2])):
     raise exception_rfid.RFIDCommand('ERR_CRC', "CRC not matches")
 
 def parseIBlockResponseINF(self):
   if not getattr(self, 'INF', None): raise exception_rfid.RFIDCommand('ERR_READ', f"Trying to parse IBlock INF but the given message '{self}' is missing self.INF")
   if not getattr(self, 'CMD', None): raise exception_rfid.RFIDCommand('ERR_READ', f"Trying to parse IBlock INF but the given message '{self}' is missing self.CMD")
 
-  CMD = bytes([self.INF[0]])
+  CMD, status = IBLOCK_RESPONSE_HEADER.unpack_from(self.INF, 0)
   self.STA = self.INF[1:3] # Extract WORD bytes
   self.PARM = self.INF[3:]
 
-  if not self.CMD == CMD: raise exception_rfid.RFIDCommand('ERR_READ', f"Trying to parse IBlock INF but the given message '{self}' has conflicting CMDs? Class instance CMD='{self.CMD}'. INF contains CMD='{CMD}'?")
+  if not self.CMD[0] == CMD: raise exception_rfid.RFIDCommand('ERR_READ', f"Trying to parse IBlock INF but the given message '{self}' has conflicting CMDs? Class instance CMD='{self.CMD}'. INF contains CMD='{single_bytes[CMD]}'?")
 
-  if self.STA[0] or self.STA[1]:
-    status = helpers.word_to_int(self.STA)
-    #status = (self.STA[1] <<8) + self.STA[0]
+  if status:
     error = lainuri.RL866.state.error_codes.get(status)
     if not error: error = ['ERR_???', f"Given message '{self}' has status error '{self.STA.hex()}' but there is no matching error code?"]
     raise exception_rfid.RFIDCommand(*error)
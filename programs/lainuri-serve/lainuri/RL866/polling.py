@@ -0,0 +1,80 @@
+"""
+Adapts the RFID inventory polling interval to the activity at the reader.
+
+While tags are appearing or disappearing, or a patron is using the kiosk, the reader is polled at the fastest
+interval, devices.rfid-reader.polling_interval, which can be 0 to poll as fast as the reader answers.
+After the field has been stable and the kiosk idle for devices.rfid-reader.polling-idle-after seconds,
+the interval backs off exponentially up to the devices.rfid-reader.polling-interval-max ceiling.
+This keeps the serial line, the CPU and the event queue quiet overnight, without slowing down
+the detection of the first book a patron places on the reader.
+
+  ACTIVE -- stable and idle for idle_after seconds --> IDLE (backing off)
+  IDLE   -- tags change or a patron is active -------> ACTIVE
+"""
+
+from lainuri.config import get_config
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+
+import time
+
+ACTIVE = 'active'
+IDLE = 'idle'
+
+BACKOFF_FACTOR = 2
+BACKOFF_FIRST_INTERVAL = 0.25 # When the fastest interval is 0, backing off starts from here
+
+class AdaptivePollingInterval():
+  def __init__(self, min_interval: float = None, max_interval: float = None, idle_after: float = None):
+    """
+    @param min_interval, seconds between inventories while active
+    @param max_interval, ceiling of the seconds between inventories while idle
+    @param idle_after, seconds the field must be stable and the kiosk idle, before backing off
+    """
+    self.min_interval = min_interval if min_interval is not None else (get_config('devices.rfid-reader.polling_interval') or 0)
+    self.max_interval = max_interval if max_interval is not None else (get_config('devices.rfid-reader.polling-interval-max') or 2)
+    self.idle_after = idle_after if idle_after is not None else (get_config('devices.rfid-reader.polling-idle-after') or 30)
+    if self.max_interval < self.min_interval: self.max_interval = self.min_interval
+
+    self.state = ACTIVE
+    self.interval = self.min_interval
+    self.last_activity = time.monotonic()
+    self.polls = 0
+    self.transitions_to_active = 0
+    self.transitions_to_idle = 0
+
+  def update(self, tags_changed: bool, session_active: bool, now: float = None) -> float:
+    """
+    Account an inventory round.
+
+    @param tags_changed, did tags appear or disappear, or are they still being debounced
+    @param session_active, is a patron or an admin using the kiosk
+    @returns seconds to wait before the next inventory
+    """
+    now = now if now is not None else time.monotonic()
+    self.polls += 1
+    if tags_changed or session_active: self.last_activity = now
+
+    if now - self.last_activity < self.idle_after:
+      if self.state == IDLE:
+        self.state = ACTIVE
+        self.transitions_to_active += 1
+        log.info(f"Polling active, tags_changed='{tags_changed}' session_active='{session_active}'")
+      self.interval = self.min_interval
+    elif self.state == ACTIVE:
+      self.state = IDLE
+      self.transitions_to_idle += 1
+      self.interval = min(max(self.min_interval, BACKOFF_FIRST_INTERVAL), self.max_interval)
+      log.info(f"Polling idle after '{self.idle_after}' seconds without activity, backing off up to '{self.max_interval}' seconds")
+    else:
+      self.interval = min(self.interval * BACKOFF_FACTOR, self.max_interval)
+    return self.interval
+
+  def to_ui(self) -> dict:
+    return {
+      'state': self.state,
+      'interval': self.interval,
+      'polls': self.polls,
+      'transitions_to_active': self.transitions_to_active,
+      'transitions_to_idle': self.transitions_to_idle,
+    }
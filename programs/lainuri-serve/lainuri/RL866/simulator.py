@@ -0,0 +1,443 @@
+"""
+Simulated RL866 RFID reader behind a pseudo-terminal.
+
+The simulator opens a pty and answers the RL866 S-block/I-block protocol on it, so the RFID_Reader
+can be pointed at the pty's slave device, eg. with devices.rfid-reader.readers[].port,
+and inventory throughput and tag fleshing latency can be measured without the hardware.
+
+Supported messages:
+  S-block RESYNC
+  I-block TagInventory, with the antenna selection, the AFI filter and embedded commands, and continue inventory
+  I-block TagConnect, TagDisconnect
+  I-block TagMemoryAccess, with GetTagSystemInformation, Read/WriteMultipleBlocks, Write_AFI, Write_DSFID and the EAS commands
+
+The tag population is scripted. Each tag arrives to and leaves from the field at the given seconds since the simulator was started.
+Every command can be given a latency and an error injection rate.
+
+Scenario files are YAML:
+
+  seed: 1                 # Seeds the error injection
+  max_tags_per_transmission: 16 # Simulates a small tag report buffer. By default as many tag reports as fit in a frame
+  latency:                # Seconds, per command
+    inventory: 0.02
+    inventory_per_tag: 0.002
+    connect: 0.005
+    memory_access: 0.01
+  errors:                 # Rate of commands failing with ERR_RFID_TRANSC_WRERR, per command
+    connect: 0.01
+  tags:
+    - serial_number: e004010000000001
+      format: iso28560-2  # or iso28560-3, or blank for a tag to program
+      primary_item_identifier: '1620168259'
+      afi: 0x07
+      antenna: 1
+      arrives: 0
+      leaves: 10
+  generate:               # Generate a population of tags present all the time
+    count: 40
+    format: iso28560-3
+"""
+
+from lainuri.config import get_config
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+
+import os
+import pty
+import random
+import select
+import threading
+import time
+import tty
+import yaml
+
+import iso15692.compaction
+import iso28560
+
+import lainuri.helpers as helpers
+import lainuri.RL866.CRC16
+import lainuri.RL866.state as rfid_state
+from lainuri.RL866.iblock import CMD_INVENTORY, CMD_CONNECT, CMD_DISCONNECT, CMD_MEMORY_ACCESS, shift_air_protocol_inventory_parameters
+from lainuri.RL866.tag_memory_access_command import ACCESS_READ_MULTIPLE_BLOCKS, ACCESS_WRITE_MULTIPLE_BLOCKS, ACCESS_WRITE_AFI, ACCESS_WRITE_DSFID, ACCESS_GET_TAG_SYSTEM_INFORMATION, ACCESS_ENABLE_EAS, ACCESS_DISABLE_EAS, ACCESS_EAS_ALARM, shift_access_operation
+
+SOF = 0xFA
+RID_RESPONSE = b'\x01'
+PCB_RESYNC_RESPONSE = b'\xE0'
+MAX_INF_LEN = 255 - 5 # LEN is a byte, and counts itself, RID, PCB and CHK[2] in addition to the INF
+
+ERR_OK = 0x000
+ERR_NOSYS = 0x003
+ERR_MSG_OPERCODE = 0x103
+ERR_MSG_PARAM = 0x105
+ERR_RFID_TRANSC_WRERR = 0x401
+ERR_RFID_TRANSC_NODATA = 0x408
+ERR_RFID_WRONG_HANDLE = 0x415
+ERR_RFID_TAG_INVALID_BLK_ADDR = 0x41C
+ERR_RFID_TAG_NOFOUND = 0x420
+
+class SimulatedTag():
+  def __init__(self, serial_number: int, tag_memory: bytes = b'', afi: int = 0x07, dsfid: int = 0x06, block_size: int = 4, memory_capacity_blocks: int = 28,
+               eas: bool = False, antenna_id: int = 1, arrives: float = 0, leaves: float = None,
+               air_protocol_type_id: int = rfid_state.AIR_PROTO_ISO15693, tag_type_id: int = rfid_state.TAG_NXP_ICODE_SLIX):
+    """
+    @param serial_number, the tag UID
+    @param tag_memory, the start of the tag memory. The rest of the memory capacity is zeroes.
+    @param arrives, seconds since the simulator start the tag enters the field
+    @param leaves, seconds since the simulator start the tag leaves the field, None to stay
+    """
+    if len(tag_memory) > block_size * memory_capacity_blocks: raise ValueError(f"Tag memory of '{len(tag_memory)}' bytes doesn't fit the tag memory capacity '{memory_capacity_blocks}' blocks of '{block_size}' bytes")
+    self.serial_number = serial_number
+    self.tag_memory = bytearray(tag_memory) + bytearray(block_size * memory_capacity_blocks - len(tag_memory))
+    self.afi = afi
+    self.dsfid = dsfid
+    self.block_size = block_size
+    self.memory_capacity_blocks = memory_capacity_blocks
+    self.eas = eas
+    self.antenna_id = antenna_id
+    self.arrives = arrives
+    self.leaves = leaves
+    self.air_protocol_type_id = air_protocol_type_id
+    self.tag_type_id = tag_type_id
+
+  def is_present(self, clock: float) -> bool:
+    return self.arrives <= clock and (self.leaves is None or clock < self.leaves)
+
+  def uid(self) -> bytes:
+    return self.serial_number.to_bytes(8, byteorder='little')
+
+def iso28560_2_tag(serial_number: int, primary_item_identifier: str, **kwargs) -> SimulatedTag:
+  """
+  A tag with the ISO 28560-2 primary item identifier data element, compacted as an integer.
+  """
+  data = iso15692.compaction.compact_integer(primary_item_identifier)
+  precursor = (1 << 4) | 1 # Integer compaction, object identifier 1, the primary item identifier
+  tag_memory = bytes([precursor, len(data)]) + data + b'\x00'
+  return SimulatedTag(serial_number, tag_memory=tag_memory, **{'dsfid': 0x06, **kwargs})
+
+def iso28560_3_tag(serial_number: int, primary_item_identifier: str, **kwargs) -> SimulatedTag:
+  """
+  A tag with the ISO 28560-3 basic block.
+  """
+  tag_memory = iso28560.ISO28560_3_Object(afi=kwargs.get('afi', 0x07), dsfid=0x3E, block_size=None, memory_capacity_blocks=None, tag_memory=bytearray(34)).encode(
+    content_parameter=0,
+    type_of_usage=1,
+    numbers_of_parts_in_item=1,
+    ordinal_part_number=1,
+    primary_item_identifier=primary_item_identifier,
+    isil=None,
+  ).tag_memory()
+  return SimulatedTag(serial_number, tag_memory=bytes(tag_memory), **{'dsfid': 0x3E, **kwargs})
+
+def blank_tag(serial_number: int, primary_item_identifier: str = None, **kwargs) -> SimulatedTag:
+  """
+  A tag never programmed, the tag memory zeroes and the DSFID unset.
+  """
+  return SimulatedTag(serial_number, **{'dsfid': 0x00, **kwargs})
+
+tag_formats = {
+  'blank': blank_tag,
+  'iso28560-2': iso28560_2_tag,
+  'iso28560-3': iso28560_3_tag,
+}
+
+def load_scenario(path: str) -> 'Simulator':
+  with open(path, 'r') as f:
+    return scenario(yaml.safe_load(f) or {})
+
+def scenario(scenario_config: dict) -> 'Simulator':
+  """
+  @param scenario_config, see the module documentation
+  @returns Simulator, not started
+  """
+  tags = []
+  for i, tag_config in enumerate(scenario_config.get('tags') or []):
+    tag_config = dict(tag_config)
+    serial_number = tag_config.pop('serial_number')
+    tag_format = tag_formats.get(tag_config.pop('format', 'iso28560-2'))
+    if not tag_format: raise ValueError(f"Scenario tags[{i}] has an unknown format. Known formats '{list(tag_formats.keys())}'")
+    if 'antenna' in tag_config: tag_config['antenna_id'] = tag_config.pop('antenna')
+    primary_item_identifier = tag_config.pop('primary_item_identifier', None)
+    tags.append(tag_format(
+      int(serial_number, 16) if isinstance(serial_number, str) else serial_number,
+      str(primary_item_identifier) if primary_item_identifier is not None else None,
+      **tag_config,
+    ))
+
+  generate = scenario_config.get('generate')
+  if generate:
+    tag_format = tag_formats[generate.get('format', 'iso28560-2')]
+    first_serial_number = generate.get('first_serial_number', 0xe004015000000000)
+    for i in range(0, generate['count']):
+      tags.append(tag_format(first_serial_number + i, str(generate.get('first_primary_item_identifier', 1000000000) + i), antenna_id=generate.get('antenna', 1)))
+
+  return Simulator(
+    tags=tags,
+    latency=scenario_config.get('latency'),
+    errors=scenario_config.get('errors'),
+    seed=scenario_config.get('seed'),
+    max_tags_per_transmission=scenario_config.get('max_tags_per_transmission'),
+  )
+
+class Simulator():
+  def __init__(self, tags: list = None, latency: dict = None, errors: dict = None, seed: int = None, max_tags_per_transmission: int = None):
+    """
+    @param tags, list of SimulatedTags
+    @param latency, dict of command name -> seconds to wait before responding.
+                    Command names are 'resync', 'inventory', 'connect', 'disconnect' and 'memory_access'.
+                    'inventory_per_tag' is added to the inventory latency for each tag reported.
+    @param errors, dict of command name -> rate 0-1 of the commands failing
+    @param seed, seeds the error injection, for repeatable runs
+    @param max_tags_per_transmission, how many tag reports the inventory response holds at most, before continue inventory is needed
+    """
+    self.tags = list(tags or [])
+    self.latency = latency or {}
+    self.errors = errors or {}
+    self.random = random.Random(seed)
+    self.max_tags_per_transmission = max_tags_per_transmission
+    self.commands = {} # command name -> count of commands received
+    self.handles = {} # connection handle -> SimulatedTag
+    self.next_handle = 1
+    self.inventory_buffer = []
+    self.inventory_tags_buffered = 0
+    self.started = time.monotonic()
+    self.killswitch = None
+    self.thread = None
+
+    self.master, self.slave = pty.openpty()
+    tty.setraw(self.slave) # Don't let the line discipline echo or translate the binary frames before the reader opens the port
+    self.port = os.ttyname(self.slave)
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, *args):
+    self.stop()
+
+  def start(self) -> 'Simulator':
+    self.started = time.monotonic()
+    self.thread = threading.Thread(name="RL866-Simulator", target=self.serve, daemon=True)
+    self.thread.start()
+    log.info(f"RL866 simulator listening at '{self.port}' with '{len(self.tags)}' tags")
+    return self
+
+  def stop(self):
+    self.killswitch = 'engage'
+    if self.thread: self.thread.join()
+    os.close(self.master)
+    os.close(self.slave)
+
+  def clock(self) -> float:
+    """
+    @returns seconds since the simulator was started
+    """
+    return time.monotonic() - self.started
+
+  def tags_present(self) -> list:
+    clock = self.clock()
+    return [tag for tag in self.tags if tag.is_present(clock)]
+
+  def serve(self):
+    buf = bytearray()
+    while not self.killswitch:
+      ready, _, _ = select.select([self.master], [], [], 0.1)
+      if not ready: continue
+      try:
+        buf += os.read(self.master, 1024)
+      except OSError: # The reader side is being reopened
+        time.sleep(0.1)
+        continue
+
+      while True:
+        # Hunt for the start of frame, like the reader does
+        sof = buf.find(bytes([SOF]))
+        if sof < 0: buf.clear(); break
+        del buf[0:sof]
+        if len(buf) < 2 or len(buf) < buf[1] + 1: break
+        frame = bytes(buf[0:buf[1] + 1])
+        del buf[0:len(frame)]
+        try:
+          response = self.handle_frame(frame)
+          if response: os.write(self.master, response)
+        except Exception as e:
+          log.exception(f"RL866 simulator failed handling frame '{frame.hex()}'")
+
+  def handle_frame(self, frame: bytes) -> bytes:
+    """
+    @returns the response frame, or None if the request is not answered
+    """
+    if frame[-2:] != lainuri.RL866.CRC16.crc16(frame[1:-2]):
+      log.warning(f"RL866 simulator dropped frame with invalid CRC '{frame.hex()}'")
+      return None
+    PCB = frame[3]
+    INF = frame[4:-2]
+
+    if PCB & 0xC0 == 0xC0: # S-block
+      self._command('resync')
+      self.inventory_buffer = []
+      return self.pack(PCB_RESYNC_RESPONSE, b'')
+
+    # I-block. Respond with the sequence number of the request.
+    PCB_response = bytes([PCB & 1<<6])
+    CMD = INF[0]
+    handlers = {
+      CMD_INVENTORY: ('inventory', self.inventory),
+      CMD_CONNECT: ('connect', self.connect),
+      CMD_DISCONNECT: ('disconnect', self.disconnect),
+      CMD_MEMORY_ACCESS: ('memory_access', self.memory_access),
+    }
+    if CMD not in handlers:
+      return self.pack(PCB_response, bytes([CMD]) + helpers.int_to_word(ERR_MSG_OPERCODE))
+
+    command_name, handler = handlers[CMD]
+    self._command(command_name)
+    if self._inject_error(command_name):
+      return self.pack(PCB_response, bytes([CMD]) + helpers.int_to_word(ERR_RFID_TRANSC_WRERR))
+    try:
+      status, PARM = handler(INF[1:])
+    except IndexError: # The request is shorter than its fields
+      status, PARM = (ERR_MSG_PARAM, b'')
+    return self.pack(PCB_response, bytes([CMD]) + helpers.int_to_word(status) + (PARM if status == ERR_OK else b''))
+
+  def pack(self, PCB: bytes, INF: bytes) -> bytes:
+    len_rid_pcb_inf = bytes([len(INF) + 5]) + RID_RESPONSE + PCB + INF
+    return bytes([SOF]) + len_rid_pcb_inf + lainuri.RL866.CRC16.crc16(len_rid_pcb_inf)
+
+  def _command(self, command_name: str):
+    self.commands[command_name] = self.commands.get(command_name, 0) + 1
+    if self.latency.get(command_name): time.sleep(self.latency[command_name])
+
+  def _inject_error(self, command_name: str) -> bool:
+    return bool(self.errors.get(command_name)) and self.random.random() < self.errors[command_name]
+
+  def inventory(self, parm: bytes) -> tuple:
+    i = [0]
+    field1 = helpers.shift_byte(parm, i)[0]
+    antennas = None
+    if field1 & 1<<0:
+      max_antenna_id = helpers.shift_byte(parm, i)[0]
+      selection_bits = helpers.shift_bytes(parm, i, (max_antenna_id + 7) // 8)
+      antennas = [a for a in range(1, max_antenna_id+1) if selection_bits[(a-1) // 8] & 1 << ((a-1) % 8)]
+    afi = None
+    embedded_commands = []
+    if field1 & 1<<1:
+      afi, embedded_commands = shift_air_protocol_inventory_parameters(parm, i)
+
+    if not field1 & 1<<3: # New inventory, otherwise continue sending the tags buffered by the previous inventory
+      self.inventory_buffer = [tag for tag in self.tags_present()
+                               if (antennas is None or tag.antenna_id in antennas) and
+                                  (not afi or tag.afi == afi)]
+      self.inventory_tags_buffered = len(self.inventory_buffer)
+
+    reports = b''
+    tags_transmitted = 0
+    while self.inventory_buffer and (not self.max_tags_per_transmission or tags_transmitted < self.max_tags_per_transmission):
+      report = self._tag_report(self.inventory_buffer[0], antennas is not None, embedded_commands)
+      if 1 + 6 + len(reports) + len(report) > MAX_INF_LEN: break
+      reports += report
+      tags_transmitted += 1
+      self.inventory_buffer.pop(0)
+    if self.latency.get('inventory_per_tag'): time.sleep(self.latency['inventory_per_tag'] * tags_transmitted)
+
+    stop_type = 1 if self.inventory_buffer else 0
+    return (ERR_OK, bytes([stop_type]) + helpers.int_to_word(self.inventory_tags_buffered) + bytes([tags_transmitted]) + reports)
+
+  def _tag_report(self, tag: SimulatedTag, report_antenna: bool, embedded_commands: list) -> bytes:
+    flag = 1<<1 | 1<<2 | 1<<3
+    report = b''
+    if report_antenna:
+      flag |= 1<<0
+      report += bytes([tag.antenna_id])
+    report += bytes([tag.air_protocol_type_id, tag.tag_type_id, 9]) + tag.uid() + b'\x00'
+    if embedded_commands:
+      flag |= 1<<7
+      results = b''.join(self._access_operation_result(tag, access_code, parameter) for access_code, parameter in embedded_commands)
+      report += helpers.int_to_ebv(len(results)) + results
+    return bytes([flag]) + report
+
+  def connect(self, parm: bytes) -> tuple:
+    connect_parameter = parm[4:4+parm[3]]
+    if connect_parameter[0] != 1: return (ERR_NOSYS, b'') # Only the addressed mode is simulated
+    uid = connect_parameter[1:9]
+    tags = [tag for tag in self.tags_present() if tag.uid() == uid]
+    if not tags: return (ERR_RFID_TAG_NOFOUND, b'')
+
+    handle = self.next_handle
+    self.next_handle = self.next_handle % 255 + 1
+    self.handles[handle] = tags[0]
+    return (ERR_OK, bytes([handle]))
+
+  def disconnect(self, parm: bytes) -> tuple:
+    if not self.handles.pop(parm[0], None): return (ERR_RFID_WRONG_HANDLE, b'')
+    return (ERR_OK, b'')
+
+  def memory_access(self, parm: bytes) -> tuple:
+    tag = self.handles.get(parm[0])
+    if not tag: return (ERR_RFID_WRONG_HANDLE, b'')
+
+    i = [1]
+    results = b''
+    while i[0] < len(parm):
+      access_code, parameter = shift_access_operation(parm, i)
+      results += self._access_operation_result(tag, access_code, parameter)
+    return (ERR_OK, results)
+
+  def _access_operation_result(self, tag: SimulatedTag, access_code: int, parameter: bytes) -> bytes:
+    if not tag.is_present(self.clock()):
+      error, data = (ERR_RFID_TRANSC_NODATA, b'')
+    else:
+      error, data = self.access(tag, access_code, parameter)
+    result = helpers.int_to_word(access_code) + (bytes([1]) + data if error == ERR_OK else bytes([0]) + helpers.int_to_word(error))
+    return helpers.int_to_ebv(len(result)) + result
+
+  def access(self, tag: SimulatedTag, access_code: int, parameter: bytes) -> tuple:
+    """
+    Execute a tag memory access command on the tag.
+
+    @returns tuple (error code, access result data)
+    """
+    if access_code == ACCESS_GET_TAG_SYSTEM_INFORMATION:
+      return (ERR_OK, b'\x0f' + tag.uid() + bytes([tag.dsfid, tag.afi, tag.memory_capacity_blocks, tag.block_size, 0x01]))
+
+    elif access_code == ACCESS_READ_MULTIPLE_BLOCKS:
+      read_security_status = parameter[0]
+      start_block_address = helpers.word_to_int(parameter[1:3])
+      number_of_blocks = helpers.word_to_int(parameter[3:5])
+      if start_block_address + number_of_blocks > tag.memory_capacity_blocks: return (ERR_RFID_TAG_INVALID_BLK_ADDR, b'')
+      data = b''
+      for block_address in range(start_block_address, start_block_address + number_of_blocks):
+        if read_security_status: data += b'\x00'
+        data += tag.tag_memory[block_address * tag.block_size : (block_address+1) * tag.block_size]
+      return (ERR_OK, helpers.int_to_word(number_of_blocks) + data)
+
+    elif access_code == ACCESS_WRITE_MULTIPLE_BLOCKS:
+      start_block_address = helpers.word_to_int(parameter[0:2])
+      number_of_blocks = helpers.word_to_int(parameter[2:4])
+      data = parameter[4:4 + number_of_blocks * tag.block_size]
+      if start_block_address + number_of_blocks > tag.memory_capacity_blocks: return (ERR_RFID_TAG_INVALID_BLK_ADDR, b'')
+      if len(data) != number_of_blocks * tag.block_size: return (ERR_MSG_PARAM, b'')
+      tag.tag_memory[start_block_address * tag.block_size : start_block_address * tag.block_size + len(data)] = data
+      return (ERR_OK, b'')
+
+    elif access_code == ACCESS_WRITE_AFI:
+      if len(parameter) != 1: return (ERR_MSG_PARAM, b'')
+      tag.afi = parameter[0]
+      return (ERR_OK, b'')
+
+    elif access_code == ACCESS_WRITE_DSFID:
+      if len(parameter) != 1: return (ERR_MSG_PARAM, b'')
+      tag.dsfid = parameter[0]
+      return (ERR_OK, b'')
+
+    elif access_code == ACCESS_ENABLE_EAS:
+      tag.eas = True
+      return (ERR_OK, b'')
+
+    elif access_code == ACCESS_DISABLE_EAS:
+      tag.eas = False
+      return (ERR_OK, b'')
+
+    elif access_code == ACCESS_EAS_ALARM:
+      # A tag with EAS disabled doesn't answer the alarm
+      return (ERR_OK, b'') if tag.eas else (ERR_RFID_TRANSC_NODATA, b'')
+
+    return (ERR_NOSYS, b'')
@@ -4,11 +4,33 @@ log = logging.getLogger(__name__)
 
 import lainuri.helpers
 
+import threading
+
+"""
+The module level sequence number is stamped into the I-blocks when they are built, and is never toggled.
+Readers keep their own ProtocolSession, and restamp the I-blocks with its sequence number when writing them.
+"""
 transmission_sequence_number = 0
-def increment_transmission_sequence_number():
-  global transmission_sequence_number
-  transmission_sequence_number ^= 1
-  log.debug(f"incremented to '{transmission_sequence_number}'")
+
+class ProtocolSession():
+  """
+  Protocol state of one connection to a RFID reader.
+  Every reader toggles its own I-block sequence number, so multiple readers don't mix up each other's sequence.
+  """
+  def __init__(self, name: str = ''):
+    self.name = name
+    self.transmission_sequence_number = 0
+    self.lock = threading.Lock()
+
+  def next_transmission_sequence_number(self) -> int:
+    """
+    @returns the sequence number for the next I-block request, and toggles it for the one after
+    """
+    with self.lock:
+      transmission_sequence_number = self.transmission_sequence_number
+      self.transmission_sequence_number ^= 1
+    log.debug(f"session '{self.name}' sequence number '{transmission_sequence_number}'")
+    return transmission_sequence_number
 
 RID_request = b'\xFF'
 
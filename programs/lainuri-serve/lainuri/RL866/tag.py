@@ -11,9 +11,32 @@ import yaml
 
 
 class Tag():
+  """
+  Tags are retained in the inventory of each RFID reader and in the tag cache, so they are kept small.
+  The attributes are slotted, and once the primary item identifier is decoded, release_tag_memory()
+  drops the raw tag memory and the embedded command results, keeping only the decoded details.
+  """
 
   eval_security_regex = re.compile('^[0-9A-Za-z_-]+$')
 
+  __slots__ = (
+    '_afi',
+    '_air_protocol_type_id',
+    '_antenna_id',
+    '_block_size',
+    '_connected_handle',
+    '_dsfid',
+    '_memory_capacity_blocks',
+    '_primary_item_identifier',
+    '_serial_number',
+    '_tag_memory',
+    '_tag_type_id',
+    '_ui',
+    'embedded_command_results',
+    'number_of_tag_memory_bits',
+    'uid',
+  )
+
   def __init__(self, serial_number: str = None):
     self._afi = None
     self._air_protocol_type_id = None
@@ -26,47 +49,57 @@ class Tag():
     self._serial_number = serial_number
     self._tag_memory = None
     self._tag_type_id = None
+    self._ui = None
+    self.embedded_command_results = None
+    self.number_of_tag_memory_bits = None
+    self.uid = None
 
   def __repr__(self):
     return f"{self.__class__} at {id(self)}:> afi='{self._afi}' dsfid='{self._dsfid}' serial_number='{self._serial_number}'" + \
-      f" pii='{self._primary_item_identifier}'" if self._primary_item_identifier else ''
+      (f" pii='{self._primary_item_identifier}'" if self._primary_item_identifier else '')
 
   def __dump__(self):
-    return yaml.dump({'!type': self.__class__, '!id': hex(id(self)), **self.__dict__})
+    return yaml.dump({'!type': self.__class__, '!id': hex(id(self)), **self.to_dict()})
+
+  def to_dict(self) -> dict:
+    """
+    @returns dict of the attributes, for the log and the error messages
+    """
+    return {attribute: getattr(self, attribute) for attribute in self.__slots__}
 
   def afi(self, afi: int = None) -> int:
     if afi != None: self._afi = afi
-    if self._afi == None: raise AttributeError(f"ISO15693_GetTagSystemInformation not invoked for this tag '{self.__dict__}'")
+    if self._afi == None: raise AttributeError(f"ISO15693_GetTagSystemInformation not invoked for this tag '{self.to_dict()}'")
     return self._afi
 
   def dsfid(self, dsfid: int = None) -> int:
     if dsfid != None: self._dsfid = dsfid
-    if self._dsfid == None: raise AttributeError(f"ISO15693_GetTagSystemInformation not invoked for this tag '{self.__dict__}'")
+    if self._dsfid == None: raise AttributeError(f"ISO15693_GetTagSystemInformation not invoked for this tag '{self.to_dict()}'")
     return self._dsfid
 
   def block_size(self, block_size: int = None) -> int:
     if block_size != None: self._block_size = block_size
-    if self._block_size == None: raise AttributeError(f"ISO15693_GetTagSystemInformation not invoked for this tag '{self.__dict__}'")
+    if self._block_size == None: raise AttributeError(f"ISO15693_GetTagSystemInformation not invoked for this tag '{self.to_dict()}'")
     return self._block_size
 
   def memory_capacity_blocks(self, memory_capacity_blocks: int = None) -> int:
     if memory_capacity_blocks != None: self._memory_capacity_blocks = memory_capacity_blocks
-    if self._memory_capacity_blocks == None: raise AttributeError(f"ISO15693_GetTagSystemInformation not invoked for this tag '{self.__dict__}'")
+    if self._memory_capacity_blocks == None: raise AttributeError(f"ISO15693_GetTagSystemInformation not invoked for this tag '{self.to_dict()}'")
     return self._memory_capacity_blocks
 
   def antenna_id(self, antenna_id=None):
     if antenna_id != None: self._antenna_id = antenna_id
-    if None == self._antenna_id: raise AttributeError(f"antenna_id not set for tag '{self.__dict__}'")
+    if None == self._antenna_id: raise AttributeError(f"antenna_id not set for tag '{self.to_dict()}'")
     return self._antenna_id
 
   def air_protocol_type_id(self, air_protocol_type_id=None):
     if air_protocol_type_id != None: self._air_protocol_type_id = air_protocol_type_id
-    if None == self._air_protocol_type_id: raise AttributeError(f"air_protocol_type_id not set for tag '{self.__dict__}'")
+    if None == self._air_protocol_type_id: raise AttributeError(f"air_protocol_type_id not set for tag '{self.to_dict()}'")
     return self._air_protocol_type_id
 
   def tag_type_id(self, tag_type_id=None):
     if tag_type_id != None: self._tag_type_id = tag_type_id
-    if None == self._tag_type_id: raise AttributeError(f"tag_type_id not set for tag '{self.__dict__}'")
+    if None == self._tag_type_id: raise AttributeError(f"tag_type_id not set for tag '{self.to_dict()}'")
     return self._tag_type_id
 
   def get_tag_type(self) -> str:
@@ -74,17 +107,23 @@ class Tag():
 
   def serial_number(self, serial_number=None):
     if serial_number: self._serial_number = serial_number
-    if None == self._serial_number: raise AttributeError(f"serial_number not set for tag '{self.__dict__}'")
+    if None == self._serial_number: raise AttributeError(f"serial_number not set for tag '{self.to_dict()}'")
     return self._serial_number
 
+  def serial_number_bytes(self) -> bytes:
+    """
+    @returns the 8 bytes of the serial number as it is on the air interface, least significant byte first
+    """
+    return int(self.serial_number(), 16).to_bytes(8, 'little')
+
   def tag_memory(self, tag_memory=None):
     if tag_memory: self._tag_memory = tag_memory
-    if None == self._tag_memory: raise AttributeError(f"ISO15693_ReadMultipleBlocks or similar not invoked for this tag '{self.__dict__}'")
+    if None == self._tag_memory: raise AttributeError(f"ISO15693_ReadMultipleBlocks or similar not invoked for this tag '{self.to_dict()}'")
     return self._tag_memory
 
   def connect(self, handle: bytes):
     self._connected_handle = handle
-    log.info(f"Connected as handle '{handle}' to tag '{lp.pformat(self.__dict__)}'")
+    log.info(f"Connected as handle '{handle}' to tag '{lp.pformat(self.to_dict())}'")
 
   def disconnect(self):
     log.info(f"Disconnected old handle '{self._connected_handle}' to tag '{self.serial_number()}'")
@@ -105,6 +144,26 @@ class Tag():
       'serial_number': self.serial_number(),
     }
 
+  def ui_snapshot(self) -> dict:
+    """
+    The to_ui() of the tag with the 'item_barcode', for the RFID tag events.
+    Built once the primary item identifier is known, and shared by every event the tag is in afterwards,
+    so the event history doesn't hold a copy of each tag present for each event. Do not modify it.
+    """
+    if self._ui: return self._ui
+    ui = {**self.to_ui(), 'item_barcode': self.iso25680_get_primary_item_identifier()}
+    if self._primary_item_identifier: self._ui = ui
+    return ui
+
+  def release_tag_memory(self):
+    """
+    Once the primary item identifier is decoded, the raw tag memory is no longer needed.
+    A tag which failed to decode keeps its memory, to decode again or to debug.
+    """
+    if not self._primary_item_identifier: return
+    self._tag_memory = None
+    self.embedded_command_results = None
+
 
   ## ISO 15692 / ISO 25680 commands
   def get_data_object_format_implementation(self):
@@ -127,21 +186,28 @@ class Tag():
     else:
       raise ValueError(f"class name '{name}' doesn't match allowed eval security scope '{self.eval_security_regex}'")
 
+  def decode_primary_item_identifier(self) -> str:
+    """
+    @throws iso15692.EndOfTagMemory if the tag memory read so far is too short to decode the primary item identifier
+            Exception if decoding fails otherwise
+    """
+    dob = self.get_data_object_format_implementation()(
+      afi=self.afi(),
+      dsfid=self.dsfid(),
+      block_size=self.block_size(),
+      memory_capacity_blocks=self.memory_capacity_blocks(),
+      tag_memory=self.tag_memory()
+    )
+    self._primary_item_identifier = dob.get_primary_item_identifier()
+    return self._primary_item_identifier
+
   def iso25680_get_primary_item_identifier(self):
 
     if self._primary_item_identifier != None:
       return self._primary_item_identifier
 
     try:
-      self.dob = self.get_data_object_format_implementation()(
-        afi=self.afi(),
-        dsfid=self.dsfid(),
-        block_size=self.block_size(),
-        memory_capacity_blocks=self.memory_capacity_blocks(),
-        tag_memory=self.tag_memory()
-      )
-
-      self._primary_item_identifier = self.dob.get_primary_item_identifier()
+      self.decode_primary_item_identifier()
     except Exception as e:
       log.exception(e)
       self._primary_item_identifier = ''
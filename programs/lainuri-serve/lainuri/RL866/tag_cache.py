@@ -0,0 +1,142 @@
+"""
+Cache of RFID tag details keyed by the tag's serial number (UID).
+
+Fleshing a tag entering the field takes four extra reader transactions:
+connect, get system information, read the tag memory and disconnect. The
+same books are put on the reader over and over again, so the tag details
+and the decoded ISO 28560 primary item identifier are cached here.
+
+The cache has an in-memory LRU tier, and optionally an on-disk tier in the
+Lainuri database which survives restarts.
+
+Entries must be invalidated whenever Lainuri writes to the tag, eg. AFI, EAS
+or the tag memory. Tags can also be reprogrammed elsewhere, so entries older
+than devices.rfid-reader.tag-cache-ttl are ignored, and entries not matching
+the AFI or the DSFID the inventory already reported for the tag are dropped.
+"""
+
+from lainuri.config import get_config
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+
+import lainuri.db.rfid_tag_cache
+from lainuri.RL866.tag import Tag
+
+import collections
+import threading
+import time
+
+lock = threading.Lock()
+lru = collections.OrderedDict()
+persistent_tier_failed = False
+
+def get_max_size() -> int:
+  return get_config('devices.rfid-reader.tag-cache-size') or 1024
+
+def is_persistent() -> bool:
+  return bool(get_config('devices.rfid-reader.tag-cache-persistent')) and not persistent_tier_failed
+
+def is_expired(entry: dict) -> bool:
+  ttl = get_config('devices.rfid-reader.tag-cache-ttl')
+  return bool(ttl) and time.time() - (entry.get('cached_date') or 0) > ttl
+
+def get(serial_number: str) -> dict:
+  with lock:
+    entry = lru.get(serial_number)
+    if entry and not is_expired(entry):
+      lru.move_to_end(serial_number)
+      return entry
+    if entry: del lru[serial_number]
+
+  if is_persistent():
+    entry = _persistent_tier_call('get', serial_number)
+    if entry and is_expired(entry):
+      log.debug(f"get():> Cached tag '{serial_number}' expired")
+      _persistent_tier_call('delete', serial_number)
+      return None
+    if entry:
+      _lru_put(entry)
+      return entry
+  return None
+
+def put(tag: Tag) -> dict:
+  """
+  Cache the fleshed details of the given tag.
+  Tags which are missing details, or failed to decode a primary item identifier, are not cached.
+  """
+  try:
+    entry = {
+      'serial_number': tag.serial_number(),
+      'afi': tag.afi(),
+      'dsfid': tag.dsfid(),
+      'block_size': tag.block_size(),
+      'memory_capacity_blocks': tag.memory_capacity_blocks(),
+      'primary_item_identifier': tag.iso25680_get_primary_item_identifier(),
+      'cached_date': time.time(),
+    }
+  except AttributeError as e:
+    log.debug(f"put():> Not caching tag '{tag}', details missing. {e}")
+    return None
+  if not entry['primary_item_identifier']:
+    return None
+
+  _lru_put(entry)
+  if is_persistent():
+    _persistent_tier_call('put', entry)
+  return entry
+
+def flesh_from_cache(tag: Tag) -> bool:
+  """
+  Flesh out the tag with the cached details.
+  The AFI and the DSFID already known from the inventory response, eg. by the AFI filter or the embedded commands,
+  must match the cached ones. Otherwise the tag has been changed and the cached entry is dropped.
+
+  @returns True if the tag was found in the cache
+  """
+  entry = get(tag.serial_number())
+  if not entry: return False
+
+  if (tag._afi is not None and tag._afi != entry['afi']) or (tag._dsfid is not None and tag._dsfid != entry['dsfid']):
+    log.info(f"flesh_from_cache():> Tag '{tag.serial_number()}' has changed since it was cached. afi='{tag._afi}' dsfid='{tag._dsfid}' entry='{entry}'")
+    invalidate(tag.serial_number())
+    return False
+
+  tag.afi(entry['afi'])
+  tag.dsfid(entry['dsfid'])
+  tag.block_size(entry['block_size'])
+  tag.memory_capacity_blocks(entry['memory_capacity_blocks'])
+  tag._primary_item_identifier = entry['primary_item_identifier']
+  log.debug(f"flesh_from_cache():> Cache hit for tag '{tag.serial_number()}'")
+  return True
+
+def invalidate(serial_number: str):
+  log.debug(f"invalidate():> serial_number='{serial_number}'")
+  with lock:
+    lru.pop(serial_number, None)
+  if is_persistent():
+    _persistent_tier_call('delete', serial_number)
+
+def clear():
+  with lock:
+    lru.clear()
+  if is_persistent():
+    _persistent_tier_call('clear')
+
+def _lru_put(entry: dict):
+  with lock:
+    lru[entry['serial_number']] = entry
+    lru.move_to_end(entry['serial_number'])
+    while len(lru) > get_max_size():
+      lru.popitem(last=False)
+
+def _persistent_tier_call(function_name: str, *args):
+  """
+  The on-disk tier is just an optimization. If it is not available, fall back to the in-memory tier only.
+  """
+  global persistent_tier_failed
+  try:
+    return getattr(lainuri.db.rfid_tag_cache, function_name)(*args)
+  except Exception as e:
+    log.exception(f"RFID tag cache on-disk tier failed. Using only the in-memory tier from now on.")
+    persistent_tier_failed = True
+    return None
@@ -12,6 +12,27 @@ import lainuri.RL866.state
 EXPECTED_NO_BYTES = 0
 EXPECTED_MULTIPLE_BYTES = 255
 
+# Access codes of the tag access operations
+ACCESS_READ_MULTIPLE_BLOCKS = 0x0003
+ACCESS_WRITE_MULTIPLE_BLOCKS = 0x0004
+ACCESS_WRITE_AFI = 0x0006
+ACCESS_WRITE_DSFID = 0x0008
+ACCESS_GET_TAG_SYSTEM_INFORMATION = 0x000A
+ACCESS_ENABLE_EAS = 0x000C
+ACCESS_DISABLE_EAS = 0x000D
+ACCESS_EAS_ALARM = 0x000F
+
+def shift_access_operation(buffer: bytes, i: list) -> tuple:
+  """
+  Parse a tag access operation, see TagMemoryAccessCommand.pack_access_operation()
+
+  @param i, iterator as an array, incremented past the access operation
+  @returns tuple (access code, access parameter)
+  """
+  length = helpers.shift_ebv(buffer, i)
+  access_code = helpers.word_to_int(helpers.shift_word(buffer, i))
+  return (access_code, bytes(helpers.shift_bytes(buffer, i, length - 2)))
+
 
 class TagMemoryAccessCommand():
   """
@@ -22,6 +43,7 @@ class TagMemoryAccessCommand():
   command = b''
   parameter = b''
   response_parser: Callable = None
+  start_block_address: int = 0
 
   def __init__(self):
     pass
@@ -30,6 +52,20 @@ class TagMemoryAccessCommand():
     if not self.command: raise Exception(f"Requesting to len() TagMemoryAccessCommand-object, which doesn't have it's command set?")
     return len(self.command) + len(self.parameter)
 
+  def pack_access_operation(self) -> bytes:
+    """
+    Tag access operation:
+      Field 1.Access operation length:
+        Data type:EBV
+        The length contains the length of the access code and the
+        access parameter.
+      Field 2.Access code:
+        Data type:WORD
+      Field 3.Access parameter:
+        Data type:BYTE[n]
+    """
+    return helpers.int_to_ebv(self.len()) + self.command + self.parameter
+
   def ISO15693_Reset(self):
     log.info(f"TagMemoryAccessCommand ISO15693_Reset chosen")
     self.command = helpers.int_to_word(0x0001)
@@ -89,7 +125,8 @@ class TagMemoryAccessCommand():
       Data type: WORD
     """
     if read_security_status: self.read_security_status = read_security_status
-    if tag and tag.tag_memory_capacity_blocks: number_of_blocks_to_read = tag.tag_memory_capacity_blocks - start_block_address
+    if tag and tag._memory_capacity_blocks: number_of_blocks_to_read = min(number_of_blocks_to_read, tag._memory_capacity_blocks - start_block_address)
+    self.start_block_address = start_block_address
 
     self.command = helpers.int_to_word(0x0003)
     self.parameter = helpers.int_to_byte(read_security_status) + \
@@ -147,10 +184,23 @@ class TagMemoryAccessCommand():
     self.response_parser = self._no_response_parser
     return self
 
+  def ISO15693_Write_DSFID(self, tag: Tag, byte: bytes):
+    log.info(f"TagMemoryAccessCommand ISO15693_Write_DSFID chosen")
+    """
+    Field 1.DSFID:
+      Data type:BYTE
+    """
+    self.command = helpers.int_to_word(0x0008)
+    if len(byte) != 1:
+      raise Exception(f"Writing DSFID to tag='{tag.serial_number()}' input error. DSFID is only 1 byte! Trying to write bytes '{byte}'")
+    self.parameter = byte
+    self.response_parser = self._no_response_parser
+    return self
+
   def _eas_compliant(self, tag: Tag):
     if (not tag.air_protocol_type_id() == lainuri.RL866.state.AIR_PROTO_ISO15693) or \
        (not " SLI" in lainuri.RL866.state.supported_tag_types[tag.air_protocol_type_id()][tag.tag_type_id()]):
-      raise Exception(f"EAS is supported only with SLI tag types. Uncompliant tag='{tag.__dict__}'")
+      raise Exception(f"EAS is supported only with SLI tag types. Uncompliant tag='{tag.to_dict()}'")
 
   def ISO15693_Enable_EAS(self, tag: Tag):
     log.info(f"TagMemoryAccessCommand ISO15693_Enable_EAS chosen")
@@ -262,7 +312,12 @@ class TagMemoryAccessCommand():
     # Split the response to blocks of bytes
     response['data_of_blocks_read'] = []
     for i in range(0,response['number_blocks_read']): response['data_of_blocks_read'].append(response['field2'][i*block_size:(i+1)*block_size].hex())
-    tag.tag_memory(response['field2'])
+
+    # Tag memory can be read in parts. Patch the blocks read into the tag memory known so far, if they are contiguous with it.
+    tag_memory = tag._tag_memory or b''
+    offset = self.start_block_address * block_size
+    if offset <= len(tag_memory):
+      tag.tag_memory(bytes(tag_memory[0:offset]) + bytes(response['field2']) + bytes(tag_memory[offset+len(response['field2']):]))
 
     return response
 
@@ -0,0 +1,214 @@
+"""
+Keeps the RFID tag connections of a reader open between consecutive operations on the same tag.
+
+Each operation on a tag, eg. fleshing the tag details or setting the gate alarm, used to connect to the tag and
+disconnect after it. Now the connection handle is kept open for devices.rfid-reader.tag-session-idle-timeout seconds
+after the operation, and the next operation on the tag reuses it. So the operations queued for a tag, eg. the AFI and
+the EAS writes of a checkout, or the retries of a failed write, share one connection.
+
+The connection is closed, ie. the tag disconnected:
+  - once it has been idle for the idle timeout, see close_idle(), called by the reader's polling thread
+  - when the tag leaves the field, see close()
+  - when an operation on the tag fails, as the handle might no longer be good. Once the other threads operating on the
+    tag are done with it, or right away if the reader rejected the handle.
+  - when there are too many connections open, the connection idle the longest
+
+Threads opening the same tag at once share one connection, the later ones wait for the first one to connect.
+
+  with rfid_reader.tag_sessions.session(tag):
+    _tag_write_afi(rfid_reader, tag, flag_on)
+"""
+
+from lainuri.config import get_config
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+
+import contextlib
+import threading
+import time
+
+from lainuri.RL866.tag import Tag
+
+MAX_TAG_SESSIONS = 32 # Connections kept open at once, well below the 255 connection handles of the RL866
+HANDLE_DEAD_ERRORS = ['ERR_RFID_WRONG_HANDLE'] # exception.rfid.RFIDCommand ids telling the reader no longer knows the handle
+
+class TagSession():
+  __slots__ = ('tag', 'users', 'last_used', 'connecting', 'failed')
+
+  def __init__(self, tag: Tag):
+    self.tag = tag
+    self.users = 0 # Threads operating on the tag right now
+    self.last_used = time.monotonic()
+    self.connecting = True # The first user is still connecting to the tag, the others wait for it
+    self.failed = False # An operation failed, disconnect once the users are done with it
+
+  def __repr__(self):
+    return f"{self.__class__} at {id(self)}:> serial_number='{self.tag.serial_number()}' handle='{self.tag.get_connection_handle()}' users='{self.users}' last_used='{self.last_used}' connecting='{self.connecting}' failed='{self.failed}'"
+
+class TagSessions():
+  def __init__(self, connect: callable, disconnect: callable, idle_timeout: float = None, max_sessions: int = MAX_TAG_SESSIONS):
+    """
+    @param connect, function(tag) connecting to the tag
+    @param disconnect, function(tag) disconnecting from the tag
+    @param idle_timeout, seconds to keep an unused connection open, None for devices.rfid-reader.tag-session-idle-timeout.
+                         0 disconnects right after each operation.
+    """
+    self.connect = connect
+    self.disconnect = disconnect
+    self.idle_timeout = idle_timeout if idle_timeout is not None else get_config('devices.rfid-reader.tag-session-idle-timeout')
+    self.max_sessions = max_sessions
+    self.sessions: dict = {} # serial number -> TagSession
+    self.lock = threading.Lock()
+    self.connected = threading.Condition(self.lock) # Notified when a connecting session is connected, or gave up
+    self.connects = 0
+    self.reuses = 0
+
+  @contextlib.contextmanager
+  def session(self, tag: Tag):
+    """
+    Context manager keeping the tag connected for the operations in the block.
+    If the block fails, the tag is disconnected, see fail().
+    """
+    self.open(tag)
+    try:
+      yield tag
+    except Exception as e:
+      self.fail(tag, e)
+      raise
+    self.release(tag)
+
+  def open(self, tag: Tag) -> Tag:
+    """
+    Connect to the tag, or reuse the open connection to it. Every open() must be followed by a release() or a close().
+
+    @throws exception.rfid.RFIDCommand if connecting fails
+    """
+    serial_number = tag.serial_number()
+    connecting = None
+    with self.lock:
+      session = self.sessions.get(serial_number)
+      while session and session.connecting:
+        self.connected.wait()
+        session = self.sessions.get(serial_number)
+      if session:
+        session.users += 1
+        session.last_used = time.monotonic()
+        self.reuses += 1
+      else: # Claim the tag before connecting, so other threads opening it wait for this connection
+        session = self.sessions[serial_number] = TagSession(tag)
+        session.users += 1
+        connecting = session
+    if session is not connecting:
+      if session.tag is not tag: # Another Tag instance of the same tag, eg. a fresh inventory report
+        tag.connect(session.tag.get_connection_handle())
+        session.tag = tag
+      return tag
+
+    try:
+      self.connect(tag)
+    except Exception:
+      with self.lock:
+        if self.sessions.get(serial_number) is session: del self.sessions[serial_number]
+        session.connecting = False
+        self.connected.notify_all()
+      raise
+    with self.lock:
+      session.connecting = False
+      self.connects += 1
+      self.connected.notify_all()
+    self._close_least_recently_used()
+    return tag
+
+  def release(self, tag: Tag):
+    """
+    The operation on the tag is done. Keep the connection open for the next one, or disconnect if not kept idle.
+    """
+    with self.lock:
+      session = self.sessions.get(tag.serial_number())
+      if not session: return
+      session.users -= 1
+      session.last_used = time.monotonic()
+      if session.users or (self.idle_timeout and not session.failed): return
+      del self.sessions[tag.serial_number()]
+    self._disconnect(session.tag)
+
+  def fail(self, tag: Tag, exception: Exception = None):
+    """
+    The operation on the tag failed, and the connection handle might no longer be good. Disconnect once the other threads
+    operating on the tag are done with it, or right away if the reader no longer knows the handle.
+    """
+    handle_dead = getattr(exception, 'id', None) in HANDLE_DEAD_ERRORS
+    with self.lock:
+      session = self.sessions.get(tag.serial_number())
+      if not session: return
+      session.users -= 1
+      session.failed = True
+      if session.users and not handle_dead: return
+      del self.sessions[tag.serial_number()]
+    if handle_dead: session.tag.disconnect() # Nothing to disconnect on the reader
+    else: self._disconnect(session.tag)
+
+  def close(self, tags: list):
+    """
+    Disconnect from the tags now, eg. when they have left the field. Tags without an open connection are skipped.
+    Tags still being connected to are disconnected once the connecting thread is done with them.
+    """
+    sessions = []
+    with self.lock:
+      for tag in tags:
+        session = self.sessions.get(tag.serial_number())
+        if not session: continue
+        if session.connecting:
+          session.failed = True
+          continue
+        del self.sessions[tag.serial_number()]
+        sessions.append(session)
+    for session in sessions:
+      self._disconnect(session.tag)
+
+  def close_idle(self):
+    """
+    Disconnect from the tags not operated on for the idle timeout.
+    """
+    if not self.sessions: return
+    idle_since = time.monotonic() - self.idle_timeout
+    with self.lock:
+      sessions = [session for session in self.sessions.values() if not session.users and session.last_used <= idle_since]
+      for session in sessions:
+        del self.sessions[session.tag.serial_number()]
+    for session in sessions:
+      self._disconnect(session.tag)
+
+  def forget(self):
+    """
+    Drop the connections without disconnecting, eg. when the reader is reset and the connection handles are gone anyway.
+    """
+    with self.lock:
+      for session in self.sessions.values():
+        session.tag.disconnect()
+      self.sessions = {}
+      self.connected.notify_all()
+
+  def _close_least_recently_used(self):
+    with self.lock:
+      if len(self.sessions) <= self.max_sessions: return
+      idle = [session for session in self.sessions.values() if not session.users]
+      if not idle: return
+      session = min(idle, key=lambda session: session.last_used)
+      del self.sessions[session.tag.serial_number()]
+    self._disconnect(session.tag)
+
+  def _disconnect(self, tag: Tag):
+    if not tag.get_connection_handle(): return
+    try:
+      self.disconnect(tag)
+    except Exception as e:
+      log.warning(f"Disconnecting tag '{tag.serial_number()}' failed. {type(e).__name__}: {e}")
+      tag.disconnect()
+
+  def to_ui(self) -> dict:
+    return {
+      'open': len(self.sessions),
+      'connects': self.connects,
+      'reuses': self.reuses,
+    }
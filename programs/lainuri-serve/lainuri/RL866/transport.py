@@ -0,0 +1,67 @@
+"""
+Frame-aware serial transport for the RL866.
+
+Every RL866 message is framed as
+  SOF(0xFA) LEN RID PCB INF[n] CHK[2]
+where LEN counts all the bytes of the frame except the SOF. So after the two
+header bytes we know exactly how many bytes are still on their way, and can
+block on the serial line until precisely that many have arrived, instead of
+polling and sleeping.
+
+Waiting is done with select() on the serial line's file descriptor, so the port
+settings (eg. the pyserial timeout) never need to be reconfigured per read.
+"""
+
+from lainuri.config import get_config
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+
+import select
+import serial
+import time
+
+import lainuri.exception.rfid as exception_rfid
+import lainuri.RL866.CRC16
+
+SOF = 0xFA
+MIN_FRAME_LEN = 5 # LEN + RID + PCB + CHK[2]
+
+def read_frame(ser: serial.Serial, timeout: float = 5) -> bytearray:
+  """
+  Read exactly one RL866 frame from the serial line.
+  Returns the complete frame, including the SOF and the checksum.
+
+  @throws exception.rfid.RFIDTimeout if the frame is not fully received within timeout seconds
+          exception.rfid.RFIDCommand if the received frame is malformed or the checksum doesn't match
+  """
+  deadline = time.monotonic() + timeout
+
+  # Hunt for the start of frame. Anything before it is line noise or leftovers from a previously timed out exchange.
+  sof = _read_exactly(ser, 1, deadline)
+  while sof[0] != SOF:
+    log.warning(f"read_frame():> Discarding unexpected byte '{hex(sof[0])}' while waiting for SOF")
+    sof = _read_exactly(ser, 1, deadline)
+
+  length = _read_exactly(ser, 1, deadline)
+  if length[0] < MIN_FRAME_LEN:
+    raise exception_rfid.RFIDCommand('ERR_MSG_SIZE', f"Received frame LEN '{length[0]}' is shorter than the minimum frame length '{MIN_FRAME_LEN}'")
+
+  frame = sof + length + _read_exactly(ser, length[0]-1, deadline)
+
+  if frame[-2:] != lainuri.RL866.CRC16.crc16(bytes(frame[1:-2])):
+    raise exception_rfid.RFIDCommand('ERR_CRC', f"CRC not matches for frame '{frame.hex()}'")
+  return frame
+
+def _read_exactly(ser: serial.Serial, count: int, deadline: float) -> bytearray:
+  """
+  Blocking read of exactly count bytes. Wakes up as soon as new bytes are available.
+  """
+  buf = bytearray()
+  while len(buf) < count:
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+      raise exception_rfid.RFIDTimeout(f"read timeout, received '{len(buf)}' of '{count}' expected bytes '{buf.hex()}'")
+    ready, _, _ = select.select([ser.fileno()], [], [], remaining)
+    if ready:
+      buf += ser.read(min(count - len(buf), max(ser.in_waiting, 1)))
+  return buf
@@ -7,9 +7,11 @@ import time
 
 def handle_signal_SIGUSR1(signum, frame):
   import lainuri.event_queue
+  import lainuri.metrics
   print(f"Received signal SIGUSR1 '{signum}' '{frame}'")
   start = lainuri.event_queue.hii - 10 if lainuri.event_queue.hii - 10 > 0 else 0
   pprint([e.__dict__ for e in lainuri.event_queue.history[start:start+10] if e != None])
+  pprint(lainuri.metrics.snapshot())
 
 
 if __name__ == '__main__':
@@ -37,7 +37,7 @@ def _db_exists():
   global conn, c
   if (not (conn and c)) and (not pathlib.Path(_get_db_path()).exists()): return False
   try:
-    c.execute("SELECT * FROM receipt_templates")
+    c.execute("SELECT * FROM receipt_templates").fetchall() # Exhaust the cursor, so it doesn't keep holding a shared lock on the database
   except sqlite3.Error as e:
     if str(e) == "no such table: receipt_templates": return False
     else: raise e
@@ -73,4 +73,6 @@ def drop_database():
   (conn, c) = dbh()
   if conn:
     close_db()
+  import lainuri.db.rfid_tag_cache
+  lainuri.db.rfid_tag_cache.close_db()
   pathlib.Path(_get_db_path()).unlink()
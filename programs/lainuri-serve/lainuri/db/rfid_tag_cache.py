@@ -0,0 +1,83 @@
+"""
+On-disk tier of the RFID tag cache, see lainuri.RL866.tag_cache
+
+The RFID reader polling thread is the main user of this table. The default
+connection of lainuri.db is bound to the thread which created it, so this
+table is accessed through a connection of its own.
+"""
+
+from lainuri.config import get_config
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+
+import lainuri.db
+
+import sqlite3
+import threading
+import time
+
+lock = threading.Lock()
+conn = None
+
+def _dbh() -> sqlite3.Connection:
+  global conn
+  if not conn:
+    conn = sqlite3.connect(lainuri.db._get_db_path(), check_same_thread=False)
+  return conn
+
+def _rfid_tag_cache_row_to_dict(row: sqlite3.Row) -> dict:
+  return {
+    'serial_number': row[0], 'afi': row[1], 'dsfid': row[2],
+    'block_size': row[3], 'memory_capacity_blocks': row[4],
+    'primary_item_identifier': row[5],
+    'cached_date': row[6],
+  }
+
+def get(serial_number: str) -> dict:
+  with lock:
+    c = _dbh().execute("SELECT * FROM rfid_tag_cache WHERE serial_number = ?", (serial_number,))
+    row = c.fetchone()
+  return row and _rfid_tag_cache_row_to_dict(row)
+
+def put(entry: dict):
+  log.debug(f"put():> entry='{entry}'")
+  with lock:
+    _dbh().execute('''
+    INSERT OR REPLACE INTO rfid_tag_cache (
+      serial_number, afi, dsfid,
+      block_size, memory_capacity_blocks,
+      primary_item_identifier,
+      cached_date
+    ) VALUES (
+      ?,?,?,
+      ?,?,
+      ?,
+      ?
+    )
+    ''', (
+      entry['serial_number'], entry['afi'], entry['dsfid'],
+      entry['block_size'], entry['memory_capacity_blocks'],
+      entry['primary_item_identifier'],
+      entry.get('cached_date') or time.time(),
+    ))
+    conn.commit()
+
+def delete(serial_number: str) -> int:
+  log.debug(f"delete():> serial_number='{serial_number}'")
+  with lock:
+    c = _dbh().execute("DELETE FROM rfid_tag_cache WHERE serial_number = ?", (serial_number,))
+    conn.commit()
+  return c.rowcount
+
+def clear() -> int:
+  log.debug(f"clear():>")
+  with lock:
+    c = _dbh().execute("DELETE FROM rfid_tag_cache")
+    conn.commit()
+  return c.rowcount
+
+def close_db():
+  global conn
+  with lock:
+    if conn: conn.close()
+    conn = None
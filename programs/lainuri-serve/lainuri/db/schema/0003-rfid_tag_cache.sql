@@ -0,0 +1,9 @@
+CREATE TABLE rfid_tag_cache (
+  serial_number TEXT PRIMARY KEY,
+  afi INTEGER NOT NULL,
+  dsfid INTEGER NOT NULL,
+  block_size INTEGER NOT NULL,
+  memory_capacity_blocks INTEGER NOT NULL,
+  primary_item_identifier TEXT NOT NULL,
+  cached_date INTEGER NOT NULL
+);
@@ -226,6 +226,43 @@ class LESetTagAlarmComplete(LEvent):
     super().__init__(event=self.event, client=client, recipient=recipient, event_id=event_id)
     self.validate_params()
 
+class LESetTagAlarms(LEvent):
+  event = 'set-tag-alarms'
+  default_handler = 'lainuri.websocket_handlers.tag_alarm.set_tag_alarms'
+  default_recipient = 'server'
+
+  serializable_attributes = ['item_barcodes', 'on']
+  item_barcodes = []
+  on = True
+
+  def __init__(self, item_barcodes: list, on: bool, client: WebSocket = None, recipient: WebSocket = None, event_id: str = None):
+    self.item_barcodes = item_barcodes
+    self.on = on
+    super().__init__(event=self.event, client=client, recipient=recipient, event_id=event_id)
+    self.validate_params()
+
+class LESetTagAlarmsComplete(LEvent):
+  event = 'set-tag-alarms-complete'
+  default_recipient = 'client'
+
+  serializable_attributes = ['items', 'on', 'status', 'states']
+  items = {}
+  on = True
+  states = {}
+  status = Status.NOT_SET
+
+  def __init__(self, items: dict, on: bool, status: Status, states: dict = {}, client: WebSocket = None, recipient: WebSocket = None, event_id: str = None):
+    """
+    @param items, dict of item_barcode -> {'status': Status, 'states': dict}
+    @param status, SUCCESS only if the gate alarm of every item was set
+    """
+    self.items = items
+    self.on = on
+    self.states = states
+    self.status = status
+    super().__init__(event=self.event, client=client, recipient=recipient, event_id=event_id)
+    self.validate_params()
+
 class LERingtoneList(LEvent):
   event = 'ringtone-list'
   default_handler = 'lainuri.websocket_handlers.ringtone.ringtone_list'
@@ -538,8 +575,8 @@ class LERFIDTagsLost(LEvent):
   tags_present = []
 
   def __init__(self, tags_lost: list, tags_present: list, client: WebSocket = None, recipient: WebSocket = None, event_id: str = None):
-    self.tags_present = [{**tag.to_ui(), 'item_barcode': tag.iso25680_get_primary_item_identifier()} for tag in tags_present]
-    self.tags_lost =    [{**tag.to_ui(), 'item_barcode': tag.iso25680_get_primary_item_identifier()} for tag in tags_lost   ]
+    self.tags_present = [tag.ui_snapshot() for tag in tags_present]
+    self.tags_lost =    [tag.ui_snapshot() for tag in tags_lost]
     super().__init__(event=self.event, client=client, recipient=recipient, event_id=event_id)
 
 class LERFIDTagsNew(LEvent):
@@ -552,8 +589,8 @@ class LERFIDTagsNew(LEvent):
   status = Status.NOT_SET
 
   def __init__(self, tags_new: list, tags_present: list, status: Status, states: dict = {}, client: WebSocket = None, recipient: WebSocket = None, event_id: str = None):
-    self.tags_present = [{**tag.to_ui(), 'item_barcode': tag.iso25680_get_primary_item_identifier()} for tag in tags_present]
-    self.tags_new =     [{**tag.to_ui(), 'item_barcode': tag.iso25680_get_primary_item_identifier()} for tag in tags_new    ]
+    self.tags_present = [tag.ui_snapshot() for tag in tags_present]
+    self.tags_new =     [tag.ui_snapshot() for tag in tags_new]
     self.states = states
     self.status = status
     super().__init__(event=self.event, client=client, recipient=recipient, event_id=event_id)
@@ -593,10 +630,33 @@ class LEServerStatusResponse(LEvent):
   event = 'server-status-response'
   default_recipient = 'client'
 
-  serializable_attributes = ['statuses']
+  serializable_attributes = ['statuses', 'statistics']
 
-  def __init__(self, statuses: dict, client: WebSocket = None, recipient: WebSocket = None, event_id: str = None):
+  def __init__(self, statuses: dict, statistics: dict = None, client: WebSocket = None, recipient: WebSocket = None, event_id: str = None):
     self.statuses = statuses
+    self.statistics = statistics or {}
+    super().__init__(event=self.event, client=client, recipient=recipient, event_id=event_id)
+    self.validate_params()
+
+class LEMetricsRequest(LEvent):
+  event = 'metrics-request'
+  default_handler = 'lainuri.websocket_handlers.status.metrics_request'
+  default_recipient = 'server'
+
+  def __init__(self, client: WebSocket = None, recipient: WebSocket = None, event_id: str = None):
+    super().__init__(event=self.event, client=client, recipient=recipient, event_id=event_id)
+
+class LEMetricsResponse(LEvent):
+  event = 'metrics-response'
+  default_recipient = 'client'
+
+  serializable_attributes = ['metrics']
+
+  def __init__(self, metrics: dict, client: WebSocket = None, recipient: WebSocket = None, event_id: str = None):
+    """
+    @param metrics, dict of metric name -> dict of counts and latency percentiles in seconds, see lainuri.metrics.snapshot()
+    """
+    self.metrics = metrics
     super().__init__(event=self.event, client=client, recipient=recipient, event_id=event_id)
     self.validate_params()
 
@@ -38,6 +38,12 @@ class RFIDReset(lainuri.exception.RFID):
 class RFIDTimeout(lainuri.exception.RFID):
   pass
 
+class RFIDReaderUnavailable(lainuri.exception.RFID):
+  """
+  None of the configured RFID readers could be connected to
+  """
+  pass
+
 class TagMalformed(lainuri.exception.RFID):
   """
   The given tag's data model and/or tag specifications are inconsistent with the ISO standards
@@ -45,3 +51,11 @@ class TagMalformed(lainuri.exception.RFID):
   def __init__(self, id: str, description: str):
     self.id = id
     self.description = description
+
+class TagProgrammingVerification(lainuri.exception.RFID):
+  """
+  Reading back the programmed tag didn't match what was written
+  """
+  def __init__(self, id: str, description: str):
+    self.id = id
+    self.description = description
@@ -48,6 +48,27 @@ def shift_dword(buffer: bytearray, iterator: list) -> bytearray:
   iterator[0] += 4
   return buffer[ iterator[0]-4 : iterator[0] ] # Get the next four bytes
 
+def shift_ebv(buffer: bytearray, iterator: list) -> int:
+  """
+  EBV, Extensible Bit Vector. Unsigned integer of variable length.
+  Each byte carries 7 bits of the value, most significant bits first.
+  The highest bit of a byte is set, if the value continues in the next byte.
+  """
+  intgr = 0
+  while True:
+    byte = shift_byte(buffer, iterator)
+    if not byte: raise IndexError(f"shift_ebv():> EBV continues past the end of the buffer '{buffer}'")
+    intgr = (intgr << 7) | (byte[0] & 0x7F)
+    if not byte[0] & 0x80: return intgr
+
+def int_to_ebv(intgr: int) -> bytes:
+  ebv = bytearray([intgr & 0x7F])
+  intgr >>= 7
+  while intgr:
+    ebv.insert(0, (intgr & 0x7F) | 0x80)
+    intgr >>= 7
+  return bytes(ebv)
+
 def word_to_int(bs: bytes) -> int:
   if len(bs) != 2: raise Exception("word_to_int(bs):> WORD is not 2 bytes!")
   return lower_byte_fo_to_int(bs)
@@ -67,7 +88,7 @@ def lower_byte_fo_to_int(bs: bytes) -> int:
   WORD      16-bit data, the value range 0000h-FFFFh,Lower byte first out
   DWORD     32-bit data, the value range00000000h-FFFFFFFFh,Lower byte first out
   BYTE[ n ] Array type, It consists of many of BYTE types
-  EBV # TODO: EBV looks like a big mess
+  EBV       Extensible bit vector, see shift_ebv()
   """
   return int.from_bytes(bs, 'little')
 
@@ -0,0 +1,120 @@
+"""
+In-memory latency metrics, eg. of each phase of the RFID inventory and tag fleshing.
+
+Recording a sample is two clock reads, a deque append and a counter increment.
+The percentiles are computed only when somebody asks for them, with snapshot().
+
+Each metric keeps a rolling window of its latest samples for the percentiles,
+and the total counts since the start, or the latest clear().
+
+  with lainuri.metrics.timed('rfid.connect'):
+    ...
+
+  @lainuri.metrics.timed_function('rfid.write_afi')
+  def _tag_write_afi(rfid_reader, tag, flag_on):
+    ...
+"""
+
+from lainuri.config import get_config
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+
+import collections
+import functools
+import threading
+import time
+
+WINDOW_SIZE = 1024 # How many of the latest samples the percentiles are computed from
+
+class Histogram():
+  def __init__(self, name: str, window_size: int = WINDOW_SIZE):
+    self.name = name
+    self.samples = collections.deque(maxlen=window_size) # tuples (duration, error)
+    self.count = 0
+    self.errors = 0
+    self.lock = threading.Lock()
+
+  def record(self, duration: float, error: bool = False):
+    with self.lock:
+      self.samples.append((duration, error))
+      self.count += 1
+      if error: self.errors += 1
+
+  def snapshot(self) -> dict:
+    """
+    @returns dict of the counts since the start, and the percentiles and the error rate of the rolling window. Durations are in seconds.
+    """
+    with self.lock:
+      samples = list(self.samples)
+      count = self.count
+      errors = self.errors
+    durations = sorted(duration for duration, error in samples)
+    return {
+      'count': count,
+      'errors': errors,
+      'error_rate': sum(1 for duration, error in samples if error) / len(samples) if samples else 0,
+      'p50': percentile(durations, 50),
+      'p95': percentile(durations, 95),
+      'p99': percentile(durations, 99),
+      'max': durations[-1] if durations else None,
+      'mean': sum(durations) / len(durations) if durations else None,
+    }
+
+def percentile(durations_sorted: list, p: int) -> float:
+  """
+  Nearest-rank percentile
+  """
+  if not durations_sorted: return None
+  return durations_sorted[max(0, -(-len(durations_sorted) * p // 100) - 1)]
+
+histograms = {}
+histograms_lock = threading.Lock()
+
+def get_histogram(name: str) -> Histogram:
+  histogram = histograms.get(name)
+  if not histogram:
+    with histograms_lock:
+      histogram = histograms.setdefault(name, Histogram(name))
+  return histogram
+
+def record(name: str, duration: float, error: bool = False):
+  get_histogram(name).record(duration, error)
+
+class timed():
+  """
+  Context manager timing the block into the named metric. A block raising an exception is recorded as an error.
+  """
+  __slots__ = ('name', 'started')
+
+  def __init__(self, name: str):
+    self.name = name
+
+  def __enter__(self):
+    self.started = time.perf_counter()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    record(self.name, time.perf_counter() - self.started, exc_type is not None)
+    return False
+
+def timed_function(name: str) -> callable:
+  """
+  Decorator timing each call of the function into the named metric
+  """
+  def decorator(function: callable) -> callable:
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+      with timed(name):
+        return function(*args, **kwargs)
+    return wrapper
+  return decorator
+
+def snapshot() -> dict:
+  """
+  @returns dict of metric name -> Histogram.snapshot()
+  """
+  return {name: histogram.snapshot() for name, histogram in sorted(list(histograms.items()))}
+
+def clear():
+  with histograms_lock:
+    histograms.clear()
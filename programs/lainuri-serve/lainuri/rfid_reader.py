@@ -3,68 +3,189 @@ from lainuri.logging_context import logging
 log = logging.getLogger(__name__)
 
 
+import iso15692
 import json
 import serial
+import threading
 import time
-import _thread as thread
 import traceback
 
 from lainuri.constants import Status
 import lainuri.event as le
 import lainuri.event_queue
 import lainuri.exception.rfid as exception_rfid
-from lainuri.RL866.message import Message
+import lainuri.metrics as metrics
+from lainuri.RL866.antenna_scheduler import AntennaScheduler
+import lainuri.RL866.command_scheduler as command_scheduler
+from lainuri.RL866.command_scheduler import CommandScheduler
+import lainuri.RL866.capture as rfid_capture
+from lainuri.RL866.message import Message, Request
 from lainuri.RL866.sblock import SBlock_RESYNC, SBlock_RESYNC_Response
-from lainuri.RL866.iblock import IBlock_ReadSystemConfigurationBlock, IBlock_ReadSystemConfigurationBlock_Response, IBlock_TagInventory, IBlock_TagInventory_Response, IBlock_TagConnect, IBlock_TagConnect_Response, IBlock_TagDisconnect, IBlock_TagDisconnect_Response, IBlock_TagMemoryAccess, IBlock_TagMemoryAccess_Response
+from lainuri.RL866.iblock import IBlock, IAirProtocolInventoryParameter, IBlock_ReadSystemConfigurationBlock, IBlock_ReadSystemConfigurationBlock_Response, IBlock_TagInventory, IBlock_TagInventory_Response, IBlock_TagConnect, IBlock_TagConnect_Response, IBlock_TagDisconnect, IBlock_TagDisconnect_Response, IBlock_TagMemoryAccess, IBlock_TagMemoryAccess_Response
+from lainuri.RL866.inventory import Inventory
+from lainuri.RL866.polling import AdaptivePollingInterval
 from lainuri.RL866.tag import Tag
 from lainuri.RL866.tag_memory_access_command import TagMemoryAccessCommand
 import lainuri.RL866.state as rfid_state
+from lainuri.RL866.state import ProtocolSession
+import lainuri.RL866.tag_cache as tag_cache
+from lainuri.RL866.tag_session import TagSessions
+import lainuri.RL866.transport as rfid_transport
 import lainuri.status
 from lainuri.threadbase import Threadbase
 
 
 rfid_readers = []
 
+INVENTORY_MAX_TRANSMISSIONS = 32 # Guard against a reader which keeps asking to continue the inventory
+POLLING_WAKEUP_CHECK_INTERVAL = 0.1 # How often a backed off poller checks for kiosk activity while sleeping
+RECONNECT_BACKOFF_MAX = 30 # Max seconds to sleep between the attempts to reconnect a failing reader
+SECURITY_WRITE_DEADLINE = 0.5 # Seconds a gate alarm exchange may wait for its turn on the serial line
+INVENTORY_PROFILE_ALL = 'all'
+INVENTORY_PROFILE_LIBRARY = 'library'
+INVENTORY_PROFILE_SECURED = 'secured'
+INVENTORY_PROFILE_UNSECURED = 'unsecured'
+INVENTORY_EMBEDDED_READ_BLOCKS = 9 # Fits the 34 byte ISO 28560-3 basic block on tags with the usual 4 byte blocks. Other tags are read more as needed.
+
+def get_inventory_profile_afis(profile: str) -> list:
+  """
+  Inventory profiles filter the inventory by the ISO 15693 AFI of the tags:
+    all:       every tag in the field
+    library:   the library's tags, with the checkin or the checkout AFI. Eg. patron phones and transit cards are not inventoried at all.
+    secured:   the tags with the checkin AFI, ie. with the gate alarm on
+    unsecured: the tags with the checkout AFI, ie. with the gate alarm off
+
+  The inventory AFI filter takes a single AFI, so the library profile takes an inventory per AFI.
+
+  @returns list of the AFIs to inventory, None for all the tags
+  @throws ValueError if the profile is unknown, or an AFI of the profile is not configured. AFI 0 would inventory all the tags.
+  """
+  if profile == INVENTORY_PROFILE_ALL: return None
+  if profile == INVENTORY_PROFILE_LIBRARY: afi_variables = ['devices.rfid-reader.afi-checkin', 'devices.rfid-reader.afi-checkout']
+  elif profile == INVENTORY_PROFILE_SECURED: afi_variables = ['devices.rfid-reader.afi-checkin']
+  elif profile == INVENTORY_PROFILE_UNSECURED: afi_variables = ['devices.rfid-reader.afi-checkout']
+  else: raise ValueError(f"Unknown inventory profile '{profile}'")
+
+  afis = []
+  for afi_variable in afi_variables:
+    afi = get_config(afi_variable)
+    if not afi: raise ValueError(f"Inventory profile '{profile}' needs the AFI '{afi_variable}', but it is '{afi}'")
+    afis.append(afi)
+  return afis
+
 def get_rfid_reader():
-  if len(rfid_readers) > 0:
-    return rfid_readers[0]
-  else:
-    rfid_readers.append(RFID_Reader())
-  return rfid_readers[0]
+  """
+  @returns the first configured RFID_Reader which is connected
+  @throws exception.rfid.RFIDReaderUnavailable if none of the readers is connected
+  """
+  for rfid_reader in get_rfid_readers():
+    if rfid_reader.serial: return rfid_reader
+  raise exception_rfid.RFIDReaderUnavailable(f"None of the RFID readers '{[f'{r.name}:{r.port}' for r in rfid_readers]}' could be connected to")
 
-class RFID_Reader():
+def get_rfid_readers() -> list:
+  """
+  @returns list of the configured RFID_Readers. A reader failing to connect is in the error status, and its polling
+           thread keeps on reconnecting it. It doesn't keep the other readers from being used.
+  """
+  if not rfid_readers:
+    for reader_config in get_rfid_readers_config():
+      rfid_reader = RFID_Reader(**reader_config, connect=False)
+      try:
+        rfid_reader.connect()
+      except Exception as e:
+        log.exception(f"RFID reader '{rfid_reader.name}' at port '{rfid_reader.port}' failed to connect. Reconnecting from its polling thread.")
+        rfid_reader.status = Status.ERROR
+      rfid_readers.append(rfid_reader)
+    update_rfid_reader_status()
+  return rfid_readers
+
+def get_rfid_readers_config() -> list:
+  """
+  devices.rfid-reader.readers declares the RFID readers connected to this Lainuri. Without it, one reader at /dev/ttyRL866 is used.
 
-  def __init__(self):
-    self.lock = thread.allocate_lock()
-    self.tags_present: Tag = []
+  @returns list of dicts of RFID_Reader constructor parameters
+  """
+  readers_config = get_config('devices.rfid-reader.readers') or [{'name': 'RL866', 'port': '/dev/ttyRL866'}]
+  readers = []
+  for i, reader_config in enumerate(readers_config):
+    if not reader_config.get('port'): raise ValueError(f"devices.rfid-reader.readers[{i}] is missing the 'port'")
+    readers.append({
+      'name': reader_config.get('name') or f"RL866-{i}",
+      'port': reader_config['port'],
+      'antennas': reader_config.get('antennas'),
+    })
+  if len(set(r['name'] for r in readers)) != len(readers): raise ValueError(f"devices.rfid-reader.readers names must be unique, got '{[r['name'] for r in readers]}'")
+  return readers
+
+class RFID_Reader():
+  capture = None
+
+  def __init__(self, name: str = 'RL866', port: str = '/dev/ttyRL866', antennas: list = None, connect: bool = True):
+    """
+    @param name, identifies the reader in the logs and the status surface
+    @param port, serial device the reader is connected to
+    @param antennas, antenna ids to inventory, overrides devices.rfid-reader.antennas
+    @param connect, False to leave connecting to connect(), or to the polling thread
+    """
+    self.name = name
+    self.port = port
+    self.session = ProtocolSession(name)
+    self.status = Status.SUCCESS
+    self.scheduler = CommandScheduler(name)
+    self.inventory_lock = threading.Lock()
+    self.tag_sessions = TagSessions(connect=lambda tag: _tag_connect(self, tag), disconnect=lambda tag: _tag_disconnect(self, tag))
+    self.inventory = Inventory()
+    self.antenna_scheduler = AntennaScheduler(antennas=antennas)
     self.tags_lost: Tag = []
     self.tags_new: Tag = []
+    self.read_timeout = 5
+    self.inventory_statistics = {}
+    self.capture = rfid_capture.open_capture(name)
+    self.serial = None
+    self.polling = AdaptivePollingInterval()
+    self.err_repeated = 0
+
+    if connect: self.connect()
 
+  def connect(self):
     self.reconnect()
     self.reset()
 
-    self.inventory_polling_interval = get_config('devices.rfid-reader.polling_interval')
-    self.err_repeated = 0
-
   def reconnect(self):
-    log.info('reconnect():>')
+    log.info(f"reconnect():> '{self.name}'")
     if getattr(self, 'serial', None): self.serial.close()
+    self.serial = None # Stays disconnected if connecting fails, so the next attempt knows to reconnect
     self.serial = self.connect_serial()
 
   def reset(self):
-    log.info("reset():>")
-    self.write(SBlock_RESYNC())
-    SBlock_RESYNC_Response(self.read(SBlock_RESYNC_Response))
-
-  def access_lock(self) -> thread.LockType:
-    return self.lock
+    log.info(f"reset():> '{self.name}'")
+    self.tag_sessions.forget()
+    SBlock_RESYNC_Response(self.transceive(SBlock_RESYNC(), SBlock_RESYNC_Response))
+
+  @property
+  def tags_present(self) -> list:
+    return self.inventory.tags_present()
+
+  @tags_present.setter
+  def tags_present(self, tags: list):
+    """
+    Only flushing the present tags is supported, eg. to trigger new tags events for tags already present.
+    """
+    if tags: raise ValueError(f"tags_present can only be flushed, not set to '{tags}'")
+    self.inventory.clear()
+
+  def tags_present_at_other_readers(self) -> set:
+    """
+    @returns set of serial numbers of the tags present at the other readers
+    """
+    return set(tag.serial_number() for reader in rfid_readers if reader is not self for tag in reader.tags_present)
 
   def connect_serial(self) -> serial.Serial:
-    log.info("Connecting serial")
+    log.info(f"Connecting serial '{self.port}' for reader '{self.name}'")
     ser = serial.Serial()
     ser.baudrate = 38400
     ser.parity = serial.PARITY_EVEN
-    ser.port = '/dev/ttyRL866'
+    ser.port = self.port
     ser.timeout = 0
     ser.open()
 
@@ -72,59 +193,91 @@ class RFID_Reader():
 
   def write(self, msg: Message):
     log.debug(f"WRITE--> {type(msg)}")
+    if isinstance(msg, IBlock) and isinstance(msg, Request):
+      msg.sequence(self.session.next_transmission_sequence_number())
     data = msg.pack()
-    if log.getEffectiveLevel() == logging.DEBUG:
-      for b in data: print(hex(b), ' ', end='')
-      print()
+    if self.capture: self.capture.record(rfid_capture.DIRECTION_WRITE, data)
+    if log.isEnabledFor(logging.DEBUG): log.debug(f"WRITE--> '{data.hex()}'")
+    self.serial.reset_input_buffer() # Drop leftovers of a previously timed out exchange, so they don't get mistaken as the response to this message
     rv = self.serial.write(data)
     log.debug(f"-->WRITE {type(msg)}")
     return rv
 
   def read(self, msg_class: type):
-    timeout = 5
     log.debug(f"READ WAITING--> {msg_class}")
-    slept = 0
-    while(self.serial.in_waiting == 0):
-      time.sleep(0.1)
-      slept += 0.1
-      if slept > timeout:
-        raise exception_rfid.RFIDTimeout(f"read timeout for message class '{msg_class}'")
-
-    rv_a = bytearray()
-    while self.serial.in_waiting:
-      log.debug(f"READ--> {msg_class}")
-      #rv = ser.read(255)
-      rv = self.serial.readline()
-      rv_a += rv
-      time.sleep(0.1)
-    if log.getEffectiveLevel() == logging.DEBUG:
-      for b in rv_a: print(hex(b), ' ', end='')
-      print()
+    try:
+      rv_a = rfid_transport.read_frame(self.serial, self.read_timeout)
+    except exception_rfid.RFIDTimeout as e:
+      raise exception_rfid.RFIDTimeout(f"read timeout for message class '{msg_class}'. {e}")
+    if self.capture: self.capture.record(rfid_capture.DIRECTION_READ, rv_a)
+    if log.isEnabledFor(logging.DEBUG): log.debug(f"READ--> '{rv_a.hex()}'")
     log.debug(f"-->READ {msg_class}")
     return rv_a
 
+  def transceive(self, msg: Message, response_class: type = '') -> bytes:
+    """
+    Write the message and read its response, once the command scheduler gives the turn to the calling thread's priority class.
+    The serial line is held for this one exchange, unless the calling thread already holds a longer turn, see lainuri.RL866.command_scheduler
+
+    @returns the response frame
+    """
+    with self.scheduler.turn():
+      self.write(msg)
+      return self.read(response_class)
+
   def start_polling_rfid_tags(self):
-    self.daemon = Threadbase(name='RFID-Reader', worker_method=self.rfid_poll_daemon, listen_for_event=False)
+    self.daemon = Threadbase(name=f"RFID-Reader-{self.name}", worker_method=self.rfid_poll_daemon, listen_for_event=False)
     self.daemon.start()
     return self.daemon
 
+  def sleep_until_next_poll(self, interval: float):
+    """
+    Sleep in short slices, so a backed off poller wakes up as soon as somebody starts using the kiosk.
+    """
+    last_activity = lainuri.status.last_activity
+    deadline = time.monotonic() + interval
+    while True:
+      remaining = deadline - time.monotonic()
+      if remaining <= 0 or lainuri.status.last_activity != last_activity: return
+      time.sleep(min(remaining, POLLING_WAKEUP_CHECK_INTERVAL))
+      self.tag_sessions.close_idle()
+
   def stop_polling_rfid_tags(self):
     self.daemon.kill()
     return self.daemon
 
+  def close(self):
+    """
+    Close the serial connection and the frame capture, once the reader is no longer polled
+    """
+    log.info(f"close():> '{self.name}'")
+    if self.serial: self.serial.close()
+    if self.capture: self.capture.close()
+
   def rfid_poll_daemon(self):
     try:
+      if not self.serial: self.connect() # Connecting failed earlier, eg. the reader was unplugged at boot
       self.do_inventory()
-      time.sleep(self.inventory_polling_interval or 1) # TODO: This should be something like 0.1 or maybe even no sleep?
+      interval = self.polling.update(
+        tags_changed=bool(self.tags_new or self.tags_lost or not self.inventory.is_settled()),
+        session_active=lainuri.status.is_session_active(self.polling.idle_after),
+      )
+      lainuri.status.update_statistics('rfid_reader_polling', {reader.name: reader.polling.to_ui() for reader in rfid_readers})
+      lainuri.status.update_statistics('rfid_reader_scheduler', {reader.name: reader.scheduler.to_ui() for reader in rfid_readers})
+      lainuri.status.update_statistics('rfid_reader_tag_sessions', {reader.name: reader.tag_sessions.to_ui() for reader in rfid_readers})
+      self.tag_sessions.close_idle()
+      self.sleep_until_next_poll(interval)
 
       self.err_repeated = 0
-      lainuri.status.update_status('rfid_reader_status', Status.SUCCESS)
+      self.status = Status.SUCCESS
+      update_rfid_reader_status()
     except Exception as e:
       self.err_repeated = self.err_repeated + 1
-      lainuri.status.update_status('rfid_reader_status', Status.ERROR)
+      self.status = Status.ERROR
+      update_rfid_reader_status()
 
       if self.err_repeated < 3:
-        log.warning(f"RFID Reader - Getting inventory failed ({self.err_repeated}). Exception='{str(e)}'")
+        log.warning(f"RFID Reader '{self.name}' - Getting inventory failed ({self.err_repeated}). Exception='{str(e)}'")
         if isinstance(e, lainuri.exception.RFID):
           lainuri.event_queue.push_event(le.LERFIDTagsNew(
             tags_new=[],
@@ -137,7 +290,7 @@ class RFID_Reader():
             }}
           ))
       else:
-        log.exception(f"RFID Reader - Getting inventory failed ({self.err_repeated}). Sleeping for {self.err_repeated}s and resetting connection.")
+        log.exception(f"RFID Reader '{self.name}' - Getting inventory failed ({self.err_repeated}). Sleeping for {min(self.err_repeated, RECONNECT_BACKOFF_MAX)}s and resetting connection.")
         if isinstance(e, lainuri.exception.RFID):
           lainuri.event_queue.push_event(le.LERFIDTagsNew(
             tags_new=[],
@@ -149,109 +302,252 @@ class RFID_Reader():
               'err_repeated': self.err_repeated,
             }}
           ))
-        time.sleep(self.err_repeated)
-
-        if type(e) == exception_rfid.RFIDTimeout:
-          self.reconnect()
+        time.sleep(min(self.err_repeated, RECONNECT_BACKOFF_MAX))
 
-        self.reset()
+        try:
+          if type(e) == exception_rfid.RFIDTimeout or isinstance(e, serial.SerialException) or not self.serial:
+            self.reconnect()
+          self.reset()
+        except Exception as e:
+          log.warning(f"RFID Reader '{self.name}' - Reconnecting failed ({self.err_repeated}). {type(e).__name__}: {e}")
 
   def do_inventory(self, no_events: bool = False):
-    with self.access_lock():
-      self.write(IBlock_TagInventory())
-      resp = IBlock_TagInventory_Response(self.read(IBlock_TagInventory_Response))
+    antennas = self.antenna_scheduler.next_antennas()
+    with metrics.timed('rfid.inventory'):
+      tags = self.query_inventory(antennas, get_inventory_profile_afis(get_config('devices.rfid-reader.inventory-profile')))
+    if self.inventory_statistics['interrupted']: # The tags not drained yet would look lost, inventory again on the next poll
+      self.tags_new, self.tags_lost = [], []
+      return self
 
-    self.tags_lost = []
-    self.tags_new  = []
+    self.tags_new, self.tags_lost = self.inventory.update(tags, flesh=self.flesh_tag_details, antennas=antennas or None)
+    if self.tags_lost: self.tag_sessions.close(self.tags_lost)
 
-    for new_tag in resp.tags:
+    if antennas:
+      self.antenna_scheduler.record(antennas, tags, self.tags_new + self.tags_lost)
+      lainuri.status.update_statistics('rfid_reader_antennas', {reader.name: reader.antenna_scheduler.to_ui() for reader in rfid_readers if reader.antenna_scheduler.antennas})
 
-      new_tag_already_present = 0
-      for tag_old in self.tags_present:
-        if tag_old.serial_number() == new_tag.serial_number():
-          new_tag_already_present = 1
-          break
-      if not new_tag_already_present:
-        self.flesh_tag_details(new_tag)
-        self.tags_new.append(new_tag)
-        self.tags_present.append(new_tag)
-
-    for tag_old in self.tags_present:
-      old_tag_missing = 1
-      for new_tag in resp.tags:
-        if tag_old.serial_number() == new_tag.serial_number():
-          old_tag_missing = 0
-          break
-      if old_tag_missing:
-        self.tags_lost.append(tag_old)
+    if not no_events and (self.tags_new or self.tags_lost):
+      self.push_inventory_events()
 
-    self.tags_present = [tag for tag in self.tags_present if not [tag_lost for tag_lost in self.tags_lost if tag.serial_number() == tag_lost.serial_number()]]
+    return self
 
-    if not no_events:
-      if self.tags_new:
-        lainuri.event_queue.push_event(le.LERFIDTagsNew(self.tags_new, self.tags_present, Status.SUCCESS))
-      if self.tags_lost:
-        lainuri.event_queue.push_event(le.LERFIDTagsLost(self.tags_lost, self.tags_present))
+  def push_inventory_events(self):
+    with metrics.timed('rfid.event_push'):
+      # The UI sees the merged inventory of all the readers. A tag moving between readers is neither new nor lost.
+      tags_elsewhere = self.tags_present_at_other_readers()
+      tags_new = [tag for tag in self.tags_new if tag.serial_number() not in tags_elsewhere]
+      tags_lost = [tag for tag in self.tags_lost if tag.serial_number() not in tags_elsewhere]
 
-      # RFIDTagsNew/Lost-events are fast, and show to the GUI that Items are detected. Schedule ItemBib full data load event after showing to the user the RFID tag detection changes.
-      if self.tags_new:
-        lainuri.event_queue.push_event(le.LEItemBibFullDataRequest([tag.iso25680_get_primary_item_identifier() for tag in self.tags_new]))
+      if tags_new:
+        lainuri.event_queue.push_event(le.LERFIDTagsNew(tags_new, get_current_inventory_status(), Status.SUCCESS))
+      if tags_lost:
+        lainuri.event_queue.push_event(le.LERFIDTagsLost(tags_lost, get_current_inventory_status()))
 
-    return self
+      # RFIDTagsNew/Lost-events are fast, and show to the GUI that Items are detected. Schedule ItemBib full data load event after showing to the user the RFID tag detection changes.
+      if tags_new:
+        lainuri.event_queue.push_event(le.LEItemBibFullDataRequest([tag.iso25680_get_primary_item_identifier() for tag in tags_new]))
+
+  def query_inventory(self, antennas: list = None, afis: list = None) -> list:
+    """
+    Inventory all the tags in the field.
+    If the reader's tag buffer fills up or the inventory times out, the reader reports only a part of the tags found.
+    The rest are drained with continue inventory commands, and all the tag reports are merged into one inventory.
+
+    @param antennas, list of antenna ids to inventory. Empty uses the reader's default antenna.
+    @param afis, list of AFIs to inventory the tags of, one inventory per AFI, see get_inventory_profile_afis().
+                 None inventories all the tags.
+    @returns list of Tags. A tag seen by multiple antennas is reported once per antenna.
+    """
+    embedded_commands = self.get_inventory_embedded_commands()
+
+    tags = {}
+    transmissions = 0
+    interrupted = False
+    started = time.monotonic()
+    for afi in afis or [None]:
+      afi_transmissions, complete = self._query_inventory_afi(antennas, afi, embedded_commands, tags)
+      transmissions += afi_transmissions
+      if not complete:
+        interrupted = True
+        break
+
+    duration = time.monotonic() - started
+    tags_unique = len(set(serial_number for serial_number, antenna_id in tags.keys()))
+    self.inventory_statistics = {
+      'tags': tags_unique,
+      'transmissions': transmissions,
+      'duration': duration,
+      'tags_per_second': tags_unique / duration if duration else 0,
+      'interrupted': interrupted,
+    }
+    if transmissions > 1: log.info(f"Inventory drained in '{transmissions}' transmissions. statistics='{self.inventory_statistics}'")
+    return list(tags.values())
+
+  def _query_inventory_afi(self, antennas: list, afi: int, embedded_commands: list, tags: dict) -> int:
+    """
+    @param afi, only the tags with this AFI answer the inventory. None for all the tags.
+    @param tags, dict of (serial number, antenna id) -> Tag, the tags found are added to
+    @returns tuple (the count of transmissions, False if the drain was given up for a more urgent command)
+    """
+    air_protocol_inventory_parameters = None
+    if embedded_commands or afi is not None:
+      air_protocol_inventory_parameters = [IAirProtocolInventoryParameter(afi=afi, embedded_commands=embedded_commands)]
+
+    tags_received = 0
+    transmissions = 0
+    # The continue inventory frames drain the reader's one tag buffer, so no other command, eg. another inventory or a
+    # tag connect, may go in between. The turn on the serial line is held for the whole drain, and the drain is given
+    # up if a more urgent command is waiting for the turn. The next inventory starts over.
+    with self.inventory_lock, self.scheduler.turn():
+      while True:
+        msg = IBlock_TagInventory(query_multiple_antenna=antennas, air_protocol_inventory_parameters=air_protocol_inventory_parameters, new_inventory=(transmissions == 0))
+        resp = IBlock_TagInventory_Response(self.transceive(msg, IBlock_TagInventory_Response), embedded_commands)
+        transmissions += 1
+        tags_received += resp.tags_transmitted
+        for tag in resp.tags:
+          if afi: tag.afi(afi)
+          tags[(tag.serial_number(), tag._antenna_id)] = tag
+
+        if resp.stop_type != 1 and (tags_received >= resp.tags_buffered or not resp.tags_transmitted): break
+        if transmissions >= INVENTORY_MAX_TRANSMISSIONS:
+          log.warning(f"Inventory still not complete after '{transmissions}' transmissions. Received '{tags_received}' of '{resp.tags_buffered}' buffered tags, stop type '{resp.stop_type}'.")
+          break
+        if self.scheduler.preempted():
+          log.info(f"Inventory interrupted after '{transmissions}' transmissions by a more urgent command. Received '{tags_received}' of '{resp.tags_buffered}' buffered tags.")
+          return (transmissions, False)
+    return (transmissions, True)
+
+  def get_inventory_embedded_commands(self) -> list:
+    """
+    With devices.rfid-reader.inventory-embedded-reads the RL866 reads the system information and the start of the tag memory
+    of every tag found, and returns them in the inventory tag report. So new tags need no connect/read/disconnect round trips.
+    """
+    if not get_config('devices.rfid-reader.inventory-embedded-reads'): return []
+    return [
+      TagMemoryAccessCommand().ISO15693_GetTagSystemInformation(),
+      TagMemoryAccessCommand().ISO15693_ReadMultipleBlocks(
+        read_security_status=0,
+        start_block_address=0,
+        number_of_blocks_to_read=INVENTORY_EMBEDDED_READ_BLOCKS,
+      ),
+    ]
 
   def flesh_tag_details(self, tag: Tag):
-    with self.access_lock():
-      self.write( IBlock_TagConnect(tag) )
-      IBlock_TagConnect_Response(self.read(''), tag)
+    if tag_cache.flesh_from_cache(tag): return tag
+    with metrics.timed('rfid.flesh'), command_scheduler.priority(command_scheduler.PRIORITY_USER):
+      return self._flesh_tag_details(tag)
 
-      tag_memory_access_command = TagMemoryAccessCommand().ISO15693_GetTagSystemInformation()
-      self.write(IBlock_TagMemoryAccess(tag, tag_memory_access_command))
-      IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(self.read(''))
+  def _flesh_tag_details(self, tag: Tag):
+    if tag._tag_memory and tag._block_size: # Already fleshed by the inventory embedded commands
+      try:
+        with metrics.timed('rfid.decode_pii'):
+          tag.decode_primary_item_identifier()
+        tag_cache.put(tag)
+        tag.release_tag_memory()
+        return tag
+      except Exception as e:
+        log.info(f"Decoding tag '{tag.serial_number()}' from the inventory tag report failed, reading the tag. {e}")
+        tag._tag_memory = None
 
-      tag_memory_access_command = TagMemoryAccessCommand().ISO15693_ReadMultipleBlocks(
-        read_security_status=0,
-        start_block_address=0,
-        number_of_blocks_to_read=256
-      )
-      self.write(IBlock_TagMemoryAccess(tag, tag_memory_access_command))
-      IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(self.read(''))
+    with self.tag_sessions.session(tag):
+      if not tag._block_size: # Unless already read by the inventory embedded commands
+        with metrics.timed('rfid.system_information'):
+          tag_memory_access_command = TagMemoryAccessCommand().ISO15693_GetTagSystemInformation()
+          IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(self.transceive(IBlock_TagMemoryAccess(tag, tag_memory_access_command)))
 
-      self.write( IBlock_TagDisconnect(tag) )
-      IBlock_TagDisconnect_Response(self.read(''), tag)
+      self.read_primary_item_identifier(tag)
 
-      return tag
+    tag_cache.put(tag)
+    tag.release_tag_memory()
+    return tag
+
+  def read_primary_item_identifier(self, tag: Tag) -> str:
+    """
+    Read only as much of the tag memory as the tag's data format needs to decode the primary item identifier,
+    and more only if decoding runs past the tag memory read so far.
+    The tag must be connected, and the tag system information known.
+
+    @returns the primary item identifier, or None if decoding fails
+    """
+    block_size = tag.block_size()
+    capacity_blocks = tag.memory_capacity_blocks()
+    try:
+      bytes_needed = tag.get_data_object_format_implementation().min_tag_memory_bytes or capacity_blocks * block_size
+    except Exception as e:
+      log.warning(f"Data format of tag '{tag.serial_number()}' unknown, reading the whole tag memory. {e}")
+      bytes_needed = capacity_blocks * block_size
+
+    blocks_read = 0
+    while True:
+      blocks_to_read = min(-(-bytes_needed // block_size), capacity_blocks) - blocks_read
+      if blocks_to_read > 0:
+        tag_memory_access_command = TagMemoryAccessCommand().ISO15693_ReadMultipleBlocks(
+          tag=tag,
+          read_security_status=0,
+          start_block_address=blocks_read,
+          number_of_blocks_to_read=blocks_to_read,
+        )
+        with metrics.timed('rfid.read_blocks'):
+          IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(self.transceive(IBlock_TagMemoryAccess(tag, tag_memory_access_command)))
+        blocks_read += blocks_to_read
+
+      try:
+        with metrics.timed('rfid.decode_pii'):
+          return tag.decode_primary_item_identifier()
+      except iso15692.EndOfTagMemory as e:
+        if blocks_read >= capacity_blocks:
+          log.error(f"Decoding tag '{tag.serial_number()}' ran past the tag memory capacity '{capacity_blocks}' blocks. {e}")
+          return None
+        bytes_needed = max(e.bytes_needed, 2 * blocks_read * block_size) # Grow geometrically, to keep the round trips few for long data objects
+      except Exception as e:
+        log.exception(f"Decoding the primary item identifier of tag '{tag.serial_number()}' failed.")
+        return None
 
 def get_current_inventory_status():
+  """
+  @returns list of Tags present at any of the readers. A tag in the field of multiple readers is listed once.
+  """
   global rfid_readers
-  tags_present = []
+  tags_present = {}
   for reader in rfid_readers:
-    tags_present += reader.tags_present
-  return tags_present
+    for tag in reader.tags_present:
+      tags_present.setdefault(tag.serial_number(), tag)
+  return list(tags_present.values())
 
+def update_rfid_reader_status():
+  """
+  The RFID reader status is an error, if any of the readers is failing.
+  """
+  lainuri.status.update_status('rfid_reader_status', Status.ERROR if [r for r in rfid_readers if r.status == Status.ERROR] else Status.SUCCESS)
 
+def find_reader_and_tag(item_barcode: str) -> tuple:
+  """
+  @returns tuple (RFID_Reader, Tag) of the reader the tag with the given primary item identifier is present at
+  @throws exception.rfid.TagNotDetected
+  """
+  for reader in rfid_readers:
+    tag = reader.inventory.find_by_primary_item_identifier(item_barcode)
+    if tag: return (reader, tag)
+  raise exception_rfid.TagNotDetected(item_barcode)
+
+
+@metrics.timed_function('rfid.gate_alarm')
 def set_tag_gate_alarm(item_barcode: str, flag_on: bool):
   """
   @throws exception.rfid.TagNotDetected
           exception.rfid.RFIDCommand
   """
-  # Get the rfid_reader instance to write with
-  rfid_reader = rfid_readers[0]
+  for try_count in [1,2,3]:
+    # Find the RFID tag instance, and the reader to write with
+    rfid_reader, tag = find_reader_and_tag(item_barcode)
 
-  with rfid_reader.access_lock():
-    tag = None
-
-    for try_count in [1,2,3]:
+    with command_scheduler.priority(command_scheduler.PRIORITY_SECURITY, deadline=SECURITY_WRITE_DEADLINE):
       try:
-        # Find the RFID tag instance
-        tags = get_current_inventory_status()
-        tags = [t for t in tags if t.iso25680_get_primary_item_identifier() == item_barcode]
-        if not tags: raise exception_rfid.TagNotDetected(item_barcode)
-        tag = tags[0]
-
-        afi = get_config('devices.rfid-reader.afi-checkout') # just checking if AFI is enabled in general
-        if afi: _set_tag_gate_alarm_afi(rfid_reader, tag, flag_on)
-        eas = get_config('devices.rfid-reader.eas')
-        if eas: _set_tag_gate_alarm_eas(rfid_reader, tag, flag_on)
+        with rfid_reader.tag_sessions.session(tag): # The AFI and the EAS writes share the connection
+          afi = get_config('devices.rfid-reader.afi-checkout') # just checking if AFI is enabled in general
+          if afi: _set_tag_gate_alarm_afi(rfid_reader, tag, flag_on)
+          eas = get_config('devices.rfid-reader.eas')
+          if eas: _set_tag_gate_alarm_eas(rfid_reader, tag, flag_on)
 
         return tag # Break away from the retry-loop
 
@@ -261,19 +557,110 @@ def set_tag_gate_alarm(item_barcode: str, flag_on: bool):
           _handle_retriable_exception(e, try_count, rfid_reader, tag)
         elif type(e) == exception_rfid.GateSecurityStatusVerification:
           _handle_retriable_exception(e, try_count, rfid_reader, tag)
-        else:
-          if tag: _finally_tag_disconnect(rfid_reader, tag)
+        else: # The tag session already disconnected the tag, once no other thread is using the connection
           raise e
   return None
 
+GATE_ALARM_RETRIABLE_EXCEPTIONS = (exception_rfid.RFIDCommand, exception_rfid.GateSecurityStatusVerification)
+
+@metrics.timed_function('rfid.gate_alarms')
+def set_tag_gate_alarms(item_barcodes: list, flag_on: bool) -> dict:
+  """
+  Set the gate alarm of many tags at once, eg. all the items of a checkout session.
+
+  The tags of each reader go through the steps together: connect all, write all, verify all, release all.
+  A tag failing a step skips the rest of the steps, except the disconnect, and is retried on the next round,
+  like set_tag_gate_alarm() retries. The RL866 answers one frame at a time, so the steps are still a round trip per tag,
+  but without the inventory scan and the event queue hop per item. Each round trip goes before any queued inventory.
+  The written AFIs are verified for all the tags with one inventory of the tags in the written gate alarm state.
+
+  @returns dict of item_barcode -> {'status': Status, 'states': dict}, in the order of the given item_barcodes
+  """
+  results = {item_barcode: None for item_barcode in item_barcodes}
+  items_by_reader = {}
+  for item_barcode in item_barcodes:
+    try:
+      rfid_reader, tag = find_reader_and_tag(item_barcode)
+      items_by_reader.setdefault(rfid_reader, []).append((item_barcode, tag))
+    except Exception as e:
+      results[item_barcode] = _gate_alarm_result(e)
+
+  for rfid_reader, items in items_by_reader.items():
+    with command_scheduler.priority(command_scheduler.PRIORITY_SECURITY, deadline=SECURITY_WRITE_DEADLINE):
+      for try_count in [1,2,3]:
+        failed = _set_tag_gate_alarms_steps(rfid_reader, items, flag_on)
+        for item_barcode, tag in items:
+          results[item_barcode] = _gate_alarm_result(failed.get(item_barcode))
+
+        items = [(item_barcode, tag) for item_barcode, tag in items if isinstance(failed.get(item_barcode), GATE_ALARM_RETRIABLE_EXCEPTIONS)]
+        if not items or try_count == 3: break
+        log.warning(f"Retrying '{try_count}' gate alarms of '{[item_barcode for item_barcode, tag in items]}'")
+  return results
+
+def _set_tag_gate_alarms_steps(rfid_reader: RFID_Reader, items: list, flag_on: bool) -> dict:
+  """
+  @param items, list of tuples (item_barcode, Tag)
+  @returns dict of item_barcode -> Exception for the failed items
+  """
+  failed = {}
+  def step(step_name: str, step_method: callable, items: list):
+    for item_barcode, tag in items:
+      if item_barcode in failed: continue
+      try:
+        step_method(rfid_reader, tag)
+      except Exception as e:
+        log.warning(f"Gate alarm step '{step_name}' failed for item '{item_barcode}'. {type(e).__name__}: {e}")
+        failed[item_barcode] = e
+
+  def step_together(step_name: str, step_method: callable, items: list):
+    items = [(item_barcode, tag) for item_barcode, tag in items if item_barcode not in failed]
+    if not items: return
+    try:
+      tags_failed = set(tag.serial_number() for tag in step_method(rfid_reader, [tag for item_barcode, tag in items]))
+    except Exception as e:
+      log.warning(f"Gate alarm step '{step_name}' failed. {type(e).__name__}: {e}")
+      for item_barcode, tag in items: failed[item_barcode] = e
+      return
+    for item_barcode, tag in items:
+      if tag.serial_number() not in tags_failed: continue
+      log.warning(f"Gate alarm step '{step_name}' failed for item '{item_barcode}'.")
+      failed[item_barcode] = exception_rfid.GateSecurityStatusVerification(item_barcode)
+
+  for item_barcode, tag in items:
+    tag_cache.invalidate(tag.serial_number()) # The tag is about to change, even if writing fails halfway
+
+  step('connect', lambda rfid_reader, tag: rfid_reader.tag_sessions.open(tag), items)
+  items_connected = [(item_barcode, tag) for item_barcode, tag in items if item_barcode not in failed]
+  if get_config('devices.rfid-reader.afi-checkout'): # just checking if AFI is enabled in general
+    step('write afi', lambda rfid_reader, tag: _tag_write_afi(rfid_reader, tag, flag_on), items)
+    if get_config('devices.rfid-reader.double-check-gate-security'):
+      step_together('verify afi', lambda rfid_reader, tags: _tags_verify_afi(rfid_reader, tags, flag_on), items)
+  if get_config('devices.rfid-reader.eas'):
+    step('write eas', lambda rfid_reader, tag: _tag_write_eas(rfid_reader, tag, flag_on), items)
+
+  # Keep the connections of the written tags open for the next operation, and disconnect the failed ones
+  for item_barcode, tag in items_connected:
+    if item_barcode in failed: rfid_reader.tag_sessions.fail(tag, failed[item_barcode])
+    else: rfid_reader.tag_sessions.release(tag)
+  return failed
+
+def _gate_alarm_result(e: Exception = None) -> dict:
+  if not e: return {'status': Status.SUCCESS, 'states': {}}
+  return {
+    'status': Status.ERROR,
+    'states': {'exception': {
+      'type': type(e).__name__,
+      'trace': str(e)}
+    },
+  }
+
 def _finally_tag_disconnect(rfid_reader: RFID_Reader, tag: Tag) -> Tag:
   """
   @returns Tag on success, None on failure
   """
   try:
     # Disconnect the tag from the reader, so others may connect
-    rfid_reader.write( IBlock_TagDisconnect(tag) )
-    IBlock_TagDisconnect_Response(rfid_reader.read(''), tag)
+    IBlock_TagDisconnect_Response(rfid_reader.transceive(IBlock_TagDisconnect(tag)), tag)
     return tag
   except Exception as e:
     log.exception(f"Finally disconnecting failed '{tag}':>")
@@ -284,112 +671,134 @@ def _handle_retriable_exception(e: Exception, try_count: int, rfid_reader, tag:
     log.warn(f"Retrying '{try_count}'. {str(e)}")
   else:
     log.warn(f"Retries over '{try_count}'. Raising {str(e)}")
-    if tag.get_connection_handle():
-      if tag: _finally_tag_disconnect(rfid_reader, tag)
     raise e
 
 def _set_tag_gate_alarm_direct_memory_access(rfid_reader, tag, flag_on):
-  # Connect to the tag
-  bytes_written = rfid_reader.write( IBlock_TagConnect(tag) )
-  tag_connect_response = IBlock_TagConnect_Response(rfid_reader.read(''), tag)
-
-  # Read tag system information to determine the gate_security_check_block address
-  tag_memory_access_command = TagMemoryAccessCommand().ISO15693_GetTagSystemInformation()
-  bytes_written = rfid_reader.write(IBlock_TagMemoryAccess(tag, tag_memory_access_command))
-  tag_memory_access_response = IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(rfid_reader.read(''))
+  tag_cache.invalidate(tag.serial_number()) # The tag is about to change, even if writing fails halfway
 
-  # Calculate the memory address of the gate security block for this tag type
-  block_address_of_rfid_security_gate_check = rfid_state.get_gate_security_block_address(tag)
+  with rfid_reader.tag_sessions.session(tag):
+    # Read tag system information to determine the gate_security_check_block address, unless already known
+    if not tag._block_size:
+      tag_memory_access_command = TagMemoryAccessCommand().ISO15693_GetTagSystemInformation()
+      tag_memory_access_response = IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(rfid_reader.transceive(IBlock_TagMemoryAccess(tag, tag_memory_access_command)))
 
-  # Write the security block
-  security_block = b'\x36\x37\x38' if flag_on else b'\x00\x00\x00'
-  tag_memory_access_command = TagMemoryAccessCommand().ISO15693_WriteMultipleBlocks(
-    tag=tag,
-    start_block_address=block_address_of_rfid_security_gate_check,
-    number_of_blocks_to_write=1,
-    blocks_data_bytes=security_block,
-  )
-  bytes_written = rfid_reader.write(IBlock_TagMemoryAccess(tag, tag_memory_access_command))
-  tag_memory_access_response = IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(rfid_reader.read(''))
+    # Calculate the memory address of the gate security block for this tag type
+    block_address_of_rfid_security_gate_check = rfid_state.get_gate_security_block_address(tag)
 
-  # Confirm the security block has been written
-  if get_config('devices.rfid-reader.double-check-gate-security'):
-    tag_memory_access_command = TagMemoryAccessCommand().ISO15693_ReadMultipleBlocks(
-      read_security_status=0,
+    # Write the security block
+    security_block = b'\x36\x37\x38' if flag_on else b'\x00\x00\x00'
+    tag_memory_access_command = TagMemoryAccessCommand().ISO15693_WriteMultipleBlocks(
+      tag=tag,
       start_block_address=block_address_of_rfid_security_gate_check,
-      number_of_blocks_to_read=1
+      number_of_blocks_to_write=1,
+      blocks_data_bytes=security_block,
     )
-    bytes_written = rfid_reader.write(IBlock_TagMemoryAccess(tag, tag_memory_access_command))
-    tag_memory_access_response = IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(rfid_reader.read(''))
+    tag_memory_access_response = IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(rfid_reader.transceive(IBlock_TagMemoryAccess(tag, tag_memory_access_command)))
 
-    if tag_memory_access_response.mac_command.response['data_of_blocks_read'] != security_block:
-      raise exception_rfid.GateSecurityStatusVerification(tag.iso25680_get_primary_item_identifier())
+    # Confirm the security block has been written
+    if get_config('devices.rfid-reader.double-check-gate-security'):
+      tag_memory_access_command = TagMemoryAccessCommand().ISO15693_ReadMultipleBlocks(
+        read_security_status=0,
+        start_block_address=block_address_of_rfid_security_gate_check,
+        number_of_blocks_to_read=1
+      )
+      tag_memory_access_response = IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(rfid_reader.transceive(IBlock_TagMemoryAccess(tag, tag_memory_access_command)))
 
-  # Disconnect the tag from the reader, so others may connect
-  bytes_written = rfid_reader.write( IBlock_TagDisconnect(tag) )
-  tag_disconnect_response = IBlock_TagDisconnect_Response(rfid_reader.read(''), tag)
+      if tag_memory_access_response.mac_command.response['data_of_blocks_read'] != security_block:
+        raise exception_rfid.GateSecurityStatusVerification(tag.iso25680_get_primary_item_identifier())
 
 def _set_tag_gate_alarm_afi(rfid_reader, tag, flag_on):
-  # Connect to the tag
-  bytes_written = rfid_reader.write( IBlock_TagConnect(tag) )
-  tag_connect_response = IBlock_TagConnect_Response(rfid_reader.read(''), tag)
+  tag_cache.invalidate(tag.serial_number()) # The tag is about to change, even if writing fails halfway
+
+  with rfid_reader.tag_sessions.session(tag):
+    _tag_write_afi(rfid_reader, tag, flag_on)
+    if get_config('devices.rfid-reader.double-check-gate-security'):
+      _tag_verify_afi(rfid_reader, tag, flag_on)
+
+def _set_tag_gate_alarm_eas(rfid_reader, tag, flag_on):
+  tag_cache.invalidate(tag.serial_number()) # The tag is about to change, even if writing fails halfway
+
+  with rfid_reader.tag_sessions.session(tag):
+    _tag_write_eas(rfid_reader, tag, flag_on)
+
+@metrics.timed_function('rfid.connect')
+def _tag_connect(rfid_reader, tag):
+  tag_connect_response = IBlock_TagConnect_Response(rfid_reader.transceive(IBlock_TagConnect(tag)), tag)
 
+@metrics.timed_function('rfid.disconnect')
+def _tag_disconnect(rfid_reader, tag):
+  """
+  Disconnect the tag from the reader, so others may connect
+  """
+  tag_disconnect_response = IBlock_TagDisconnect_Response(rfid_reader.transceive(IBlock_TagDisconnect(tag)), tag)
+
+def _gate_alarm_afi(flag_on: bool) -> bytes:
+  return bytes([get_config('devices.rfid-reader.afi-checkin')]) if flag_on else bytes([get_config('devices.rfid-reader.afi-checkout')])
+
+@metrics.timed_function('rfid.write_afi')
+def _tag_write_afi(rfid_reader, tag, flag_on):
   # Write the security block
-  security_block = bytes([get_config('devices.rfid-reader.afi-checkin')]) if flag_on else bytes([get_config('devices.rfid-reader.afi-checkout')])
   tag_memory_access_command = TagMemoryAccessCommand().ISO15693_Write_AFI(
     tag=tag,
-    byte=security_block,
+    byte=_gate_alarm_afi(flag_on),
   )
-  bytes_written = rfid_reader.write(IBlock_TagMemoryAccess(tag, tag_memory_access_command))
-  tag_memory_access_response = IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(rfid_reader.read(''))
+  tag_memory_access_response = IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(rfid_reader.transceive(IBlock_TagMemoryAccess(tag, tag_memory_access_command)))
+  tag.afi(_gate_alarm_afi(flag_on)[0]) # Keep the cached tag system information up to date
 
-  # Confirm the security block has been written
-  if get_config('devices.rfid-reader.double-check-gate-security'):
-    tag_memory_access_command = TagMemoryAccessCommand().ISO15693_GetTagSystemInformation()
-    bytes_written = rfid_reader.write(IBlock_TagMemoryAccess(tag, tag_memory_access_command))
-    tag_system_information_response = IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(rfid_reader.read(''))
-    tag_system_info = tag_system_information_response.mac_command.response
+@metrics.timed_function('rfid.verify_afi')
+def _tag_verify_afi(rfid_reader, tag, flag_on):
+  """
+  Confirm the security block has been written
+  @throws exception_rfid.GateSecurityStatusVerification
+  """
+  tag_memory_access_command = TagMemoryAccessCommand().ISO15693_GetTagSystemInformation()
+  tag_system_information_response = IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(rfid_reader.transceive(IBlock_TagMemoryAccess(tag, tag_memory_access_command)))
+  tag_system_info = tag_system_information_response.mac_command.response
 
-    if tag_system_info['afi'] != security_block[0]:
-      raise exception_rfid.GateSecurityStatusVerification(tag.iso25680_get_primary_item_identifier())
+  if tag_system_info['afi'] != _gate_alarm_afi(flag_on)[0]:
+    raise exception_rfid.GateSecurityStatusVerification(tag.iso25680_get_primary_item_identifier())
 
-  # Disconnect the tag from the reader, so others may connect
-  bytes_written = rfid_reader.write( IBlock_TagDisconnect(tag) )
-  tag_disconnect_response = IBlock_TagDisconnect_Response(rfid_reader.read(''), tag)
+@metrics.timed_function('rfid.verify_afis')
+def _tags_verify_afi(rfid_reader, tags: list, flag_on: bool) -> list:
+  """
+  Confirm the AFIs have been written to all of the tags at once, with an inventory of the tags having the written AFI,
+  eg. the unsecured tags after a checkout. Every tag must answer it. The tags not found, eg. missed by the inventory,
+  are verified one by one by reading their system information.
 
-def _set_tag_gate_alarm_eas(rfid_reader, tag, flag_on):
-  # Connect to the tag
-  bytes_written = rfid_reader.write( IBlock_TagConnect(tag) )
-  tag_connect_response = IBlock_TagConnect_Response(rfid_reader.read(''), tag)
+  @returns list of the Tags failing the verification
+  """
+  tags_found = set()
+  try:
+    afis = get_inventory_profile_afis(INVENTORY_PROFILE_SECURED if flag_on else INVENTORY_PROFILE_UNSECURED)
+  except ValueError as e: # Without the AFI the tags can't be told apart by an inventory
+    log.info(f"Verifying the AFIs one tag at a time. {e}")
+    afis = None
+  if afis:
+    tags_found = set(tag.serial_number() for tag in rfid_reader.query_inventory(rfid_reader.antenna_scheduler.antennas, afis))
+
+  tags_failed = []
+  for tag in tags:
+    if tag.serial_number() in tags_found: continue
+    try:
+      _tag_verify_afi(rfid_reader, tag, flag_on)
+    except Exception as e:
+      log.warning(f"Verifying the AFI of tag '{tag.serial_number()}' failed. {type(e).__name__}: {e}")
+      tags_failed.append(tag)
+  return tags_failed
 
+@metrics.timed_function('rfid.write_eas')
+def _tag_write_eas(rfid_reader, tag, flag_on):
+  # Write the security block
   if flag_on:
-    # Write the security block
     tag_memory_access_command = TagMemoryAccessCommand().ISO15693_Enable_EAS(tag=tag)
-    bytes_written = rfid_reader.write(IBlock_TagMemoryAccess(tag, tag_memory_access_command))
-    tag_memory_access_response = IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(rfid_reader.read(''))
-
-    # Confirm the security block has been written
-    ## TODO: EAS_Alarm doesnt work?
-    #if get_config('devices.rfid-reader.double-check-gate-security'):
-    #tag_memory_access_command = TagMemoryAccessCommand().ISO15693_EAS_Alarm(tag=tag)
-    #bytes_written = rfid_reader.write(IBlock_TagMemoryAccess(tag, tag_memory_access_command))
-    #eas_alarm = IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(rfid_reader.read(''))
-    ## TODO: eas_alarm.mac_command.response.alarm == 1
-
   else:
-    # Write the security block
     tag_memory_access_command = TagMemoryAccessCommand().ISO15693_Disable_EAS(tag=tag)
-    bytes_written = rfid_reader.write(IBlock_TagMemoryAccess(tag, tag_memory_access_command))
-    tag_memory_access_response = IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(rfid_reader.read(''))
+  tag_memory_access_response = IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(rfid_reader.transceive(IBlock_TagMemoryAccess(tag, tag_memory_access_command)))
 
-    # Confirm the security block has been written
-    ## TODO: EAS_Alarm doesnt work?
-    #if get_config('devices.rfid-reader.double-check-gate-security'):
-    #tag_memory_access_command = TagMemoryAccessCommand().ISO15693_EAS_Alarm(tag=tag)
-    #bytes_written = rfid_reader.write(IBlock_TagMemoryAccess(tag, tag_memory_access_command))
-    #eas_alarm = IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(rfid_reader.read(''))
-    ## TODO: eas_alarm.mac_command.response.alarm == 0
-
-  # Disconnect the tag from the reader, so others may connect
-  bytes_written = rfid_reader.write( IBlock_TagDisconnect(tag) )
-  tag_disconnect_response = IBlock_TagDisconnect_Response(rfid_reader.read(''), tag)
+  # Confirm the security block has been written
+  ## TODO: EAS_Alarm doesnt work?
+  #if get_config('devices.rfid-reader.double-check-gate-security'):
+  #tag_memory_access_command = TagMemoryAccessCommand().ISO15693_EAS_Alarm(tag=tag)
+  #bytes_written = rfid_reader.write(IBlock_TagMemoryAccess(tag, tag_memory_access_command))
+  #eas_alarm = IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(rfid_reader.read(''))
+  ## TODO: eas_alarm.mac_command.response.alarm == flag_on
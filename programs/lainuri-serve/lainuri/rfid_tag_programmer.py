@@ -0,0 +1,250 @@
+from lainuri.config import get_config
+from lainuri.logging_context import logging
+log = logging.getLogger(__name__)
+
+import concurrent.futures
+import csv
+import iso15692
+import queue
+import time
+
+from lainuri.constants import Status
+import lainuri.exception.rfid as exception_rfid
+import lainuri.metrics as metrics
+import lainuri.RL866.command_scheduler as command_scheduler
+from lainuri.RL866.iblock import IBlock_TagMemoryAccess, IBlock_TagMemoryAccess_Response
+from lainuri.RL866.tag import Tag
+from lainuri.RL866.tag_memory_access_command import TagMemoryAccessCommand
+import lainuri.RL866.tag_cache as tag_cache
+import lainuri.rfid_reader
+
+
+DSFID_ISO28560_2 = 0x06
+PRIMARY_ITEM_IDENTIFIER_OID = 1
+WRITE_BYTES_PER_COMMAND = 128 # Keeps the WriteMultipleBlocks request well within the 255 byte RL866 frame
+BLANK_TAG_POLL_INTERVAL = 0.05
+
+class TagProgrammer():
+  """
+  Bulk tagging mode, for retagging a collection.
+
+  Programs a queue of item barcodes, one item to each blank tag placed on the RFID reader, in the order they appear.
+  Each item barcode is encoded as the ISO 28560-2 primary item identifier, with the ISO 15962 compaction which encodes it
+  into the fewest bytes. The tag memory is written, the DSFID and the AFI set, and then read back to verify.
+
+  Pulling the next item barcode from the queue and encoding it happens in a background thread,
+  while the current tag is being written. A tag already holding data is never overwritten.
+  """
+
+  def __init__(self, rfid_reader: 'lainuri.rfid_reader.RFID_Reader', afi: int = None, verify: bool = True, tag_timeout: float = 30):
+    """
+    @param afi, the AFI to set to the programmed tags, None to use devices.rfid-reader.afi-checkin
+    @param verify, read back the tag memory, the DSFID and the AFI after writing
+    @param tag_timeout, seconds to wait for a blank tag for an item, before giving up the item
+    """
+    self.rfid_reader = rfid_reader
+    self.afi = afi if afi is not None else get_config('devices.rfid-reader.afi-checkin')
+    self.verify = verify
+    self.tag_timeout = tag_timeout
+    self.tags_seen = set() # Serial numbers of the tags programmed, or found not blank
+    self.tags_pending = [] # Tags of the latest inventory not checked yet
+    self.results = []
+    self.statistics = {}
+
+  def program(self, item_barcodes) -> list:
+    """
+    @param item_barcodes, iterable of item barcodes, eg. read_item_barcodes_csv() or queue_item_barcodes().
+                          Pulling the next item barcode may block, until the next barcode is read.
+    @returns list of dicts {'item_barcode', 'serial_number', 'status', 'states'}, in the order of the item barcodes
+    """
+    item_barcodes = iter(item_barcodes)
+    started = time.monotonic()
+    encoder = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='TagProgrammer-encoder')
+    interrupted = True
+    try:
+      encoding = encoder.submit(self._next_item, item_barcodes)
+      while True:
+        item_barcode, tag_memory, e = encoding.result()
+        if item_barcode is None: break
+        encoding = encoder.submit(self._next_item, item_barcodes) # Encode the next item while this one is on the wire
+
+        tag = None
+        try:
+          if e: raise e
+          tag = self.wait_for_blank_tag()
+          with metrics.timed('rfid.program_tag'):
+            self.program_tag(tag, item_barcode, tag_memory)
+          self.results.append(_result(item_barcode, tag))
+          log.info(f"Programmed item '{item_barcode}' to tag '{tag.serial_number()}'")
+        except Exception as e:
+          log.warning(f"Programming item '{item_barcode}' failed. {type(e).__name__}: {e}")
+          self.results.append(_result(item_barcode, tag, e))
+        self._update_statistics(started)
+      interrupted = False
+    finally:
+      # If interrupted, the encoder might be blocked pulling the next item barcode, eg. from the barcode reader.
+      # Don't wait for it, the feeder of the item barcodes ends it, see queue_item_barcodes().
+      encoder.shutdown(wait=not interrupted, cancel_futures=True)
+      self.rfid_reader.tag_sessions.close([Tag(serial_number) for serial_number in self.tags_seen]) # Done with the tags
+      self._update_statistics(started)
+    return self.results
+
+  def _next_item(self, item_barcodes) -> tuple:
+    """
+    @returns tuple (item barcode, tag memory, exception if encoding failed), or (None, None, None) once the item barcodes run out
+    """
+    item_barcode = next(item_barcodes, None)
+    if item_barcode is None: return (None, None, None)
+    try:
+      with metrics.timed('rfid.encode'):
+        return (item_barcode, encode_tag_memory(item_barcode), None)
+    except Exception as e:
+      return (item_barcode, None, e)
+
+  def _update_statistics(self, started: float):
+    duration = time.monotonic() - started
+    programmed = len([r for r in self.results if r['status'] == Status.SUCCESS])
+    self.statistics = {
+      'tags_programmed': programmed,
+      'tags_failed': len(self.results) - programmed,
+      'duration': duration,
+      'tags_per_minute': programmed * 60 / duration if duration else 0,
+    }
+
+  def wait_for_blank_tag(self) -> Tag:
+    """
+    Inventory until a tag not seen before appears, and check if it is blank.
+
+    @returns the blank Tag, with a tag session open and the tag system information known. program_tag() closes the session.
+    @throws exception.rfid.TagNotDetected if no blank tag appears in the tag_timeout
+    """
+    deadline = time.monotonic() + self.tag_timeout
+    while True:
+      # Tags left over from the previous inventory are tried first, so a stack of blank tags is inventoried only once
+      if not self.tags_pending: self.tags_pending = self.rfid_reader.query_inventory()
+      while self.tags_pending:
+        tag = self.tags_pending.pop(0)
+        if tag.serial_number() in self.tags_seen: continue
+        self.tags_seen.add(tag.serial_number())
+        if self._connect_if_blank(tag): return tag
+      if time.monotonic() >= deadline: raise exception_rfid.TagNotDetected('blank tag')
+      self.rfid_reader.tag_sessions.close_idle()
+      time.sleep(BLANK_TAG_POLL_INTERVAL)
+
+  def _connect_if_blank(self, tag: Tag) -> bool:
+    reader = self.rfid_reader
+    try:
+      reader.tag_sessions.open(tag)
+    except Exception as e:
+      log.warning(f"Connecting to tag '{tag.serial_number()}' failed. {type(e).__name__}: {e}")
+      self.tags_seen.discard(tag.serial_number()) # Check again on the next inventory
+      return False
+    try:
+      if not tag._block_size: # Unless already read by the inventory embedded commands
+        _tag_memory_access(reader, tag, TagMemoryAccessCommand().ISO15693_GetTagSystemInformation())
+      if not tag._tag_memory:
+        _tag_memory_access(reader, tag, TagMemoryAccessCommand().ISO15693_ReadMultipleBlocks(tag=tag, read_security_status=0, start_block_address=0, number_of_blocks_to_read=1))
+      if not any(tag.tag_memory()[0:tag.block_size()]): return True
+      log.info(f"Tag '{tag.serial_number()}' is not blank, not programming it")
+    except Exception as e:
+      log.warning(f"Checking if tag '{tag.serial_number()}' is blank failed. {type(e).__name__}: {e}")
+      self.tags_seen.discard(tag.serial_number()) # Check again on the next inventory
+      reader.tag_sessions.fail(tag, e)
+      return False
+    reader.tag_sessions.release(tag)
+    return False
+
+  def program_tag(self, tag: Tag, item_barcode: str, tag_memory: bytes):
+    """
+    Write the tag memory, the DSFID and the AFI to the tag of the session opened by wait_for_blank_tag(), verify them
+    and close the session.
+
+    @throws exception.rfid.TagProgrammingVerification
+            exception.rfid.RFIDCommand
+    """
+    reader = self.rfid_reader
+    tag_cache.invalidate(tag.serial_number()) # The tag is about to change, even if writing fails halfway
+
+    with command_scheduler.priority(command_scheduler.PRIORITY_USER): # The operator is waiting on every tag
+      try:
+        block_size = tag.block_size()
+        tag_memory = tag_memory + bytes(-len(tag_memory) % block_size)
+        blocks = len(tag_memory) // block_size
+        if blocks > tag.memory_capacity_blocks(): raise ValueError(f"Item '{item_barcode}' needs '{blocks}' blocks, tag '{tag.serial_number()}' has '{tag.memory_capacity_blocks()}'")
+
+        blocks_per_command = max(1, WRITE_BYTES_PER_COMMAND // block_size)
+        for start_block_address in range(0, blocks, blocks_per_command):
+          number_of_blocks = min(blocks_per_command, blocks - start_block_address)
+          _tag_memory_access(reader, tag, TagMemoryAccessCommand().ISO15693_WriteMultipleBlocks(
+            tag=tag,
+            start_block_address=start_block_address,
+            number_of_blocks_to_write=number_of_blocks,
+            blocks_data_bytes=tag_memory[start_block_address*block_size:(start_block_address+number_of_blocks)*block_size],
+          ))
+        if tag.dsfid() != DSFID_ISO28560_2:
+          _tag_memory_access(reader, tag, TagMemoryAccessCommand().ISO15693_Write_DSFID(tag=tag, byte=bytes([DSFID_ISO28560_2])))
+        if self.afi is not None and tag.afi() != self.afi:
+          _tag_memory_access(reader, tag, TagMemoryAccessCommand().ISO15693_Write_AFI(tag=tag, byte=bytes([self.afi])))
+
+        if self.verify:
+          tag._tag_memory = None
+          _tag_memory_access(reader, tag, TagMemoryAccessCommand().ISO15693_ReadMultipleBlocks(tag=tag, read_security_status=0, start_block_address=0, number_of_blocks_to_read=blocks))
+          system_information = _tag_memory_access(reader, tag, TagMemoryAccessCommand().ISO15693_GetTagSystemInformation())
+          if bytes(tag.tag_memory()[0:len(tag_memory)]) != tag_memory:
+            raise exception_rfid.TagProgrammingVerification(item_barcode, f"Tag memory read back '{bytes(tag.tag_memory()).hex()}' is not the tag memory written '{tag_memory.hex()}'")
+          if system_information['dsfid'] != DSFID_ISO28560_2 or (self.afi is not None and system_information['afi'] != self.afi):
+            raise exception_rfid.TagProgrammingVerification(item_barcode, f"DSFID '{system_information['dsfid']}' or AFI '{system_information['afi']}' read back is not the DSFID '{DSFID_ISO28560_2}' and AFI '{self.afi}' written")
+        else:
+          tag._tag_memory = tag_memory
+          tag.dsfid(DSFID_ISO28560_2)
+          if self.afi is not None: tag.afi(self.afi)
+        tag._primary_item_identifier = item_barcode
+      except Exception as e:
+        reader.tag_sessions.fail(tag, e)
+        raise
+      reader.tag_sessions.release(tag)
+
+def encode_tag_memory(item_barcode: str) -> bytes:
+  """
+  @returns the ISO 28560-2 tag memory with the item barcode as the primary item identifier, with the best ISO 15962 compaction
+  """
+  return iso15692.encode_data_object([(PRIMARY_ITEM_IDENTIFIER_OID, item_barcode)])
+
+def read_item_barcodes_csv(path: str, column: int = 0):
+  """
+  @returns generator of the item barcodes in the column of the CSV file, skipping empty cells
+  """
+  with open(path, 'r', newline='') as f:
+    for row in csv.reader(f):
+      if len(row) > column and row[column].strip(): yield row[column].strip()
+
+def queue_item_barcodes(item_barcodes: queue.Queue):
+  """
+  Feed the item barcodes from a queue, eg. filled by the barcode reader's barcode_read_handler. None ends the queue.
+  Put None also when the programming is interrupted, so the thread pulling the item barcodes is released.
+
+  @returns generator of the item barcodes, blocking until the next one is put to the queue
+  """
+  return iter(item_barcodes.get, None)
+
+def _tag_memory_access(rfid_reader, tag: Tag, tag_memory_access_command: TagMemoryAccessCommand) -> dict:
+  """
+  @returns the parsed response of the tag memory access command
+  """
+  IBlock_TagMemoryAccess_Response(tag, tag_memory_access_command).receive(rfid_reader.transceive(IBlock_TagMemoryAccess(tag, tag_memory_access_command)))
+  return tag_memory_access_command.response
+
+def _result(item_barcode: str, tag: Tag = None, e: Exception = None) -> dict:
+  result = {
+    'item_barcode': item_barcode,
+    'serial_number': tag.serial_number() if tag else None,
+    'status': Status.SUCCESS,
+    'states': {},
+  }
+  if e:
+    result['status'] = Status.ERROR
+    result['states'] = {'exception': {
+      'type': type(e).__name__,
+      'trace': str(e)},
+    }
+  return result
@@ -12,6 +12,7 @@ import lainuri.event
 import lainuri.event_queue
 
 import subprocess
+import time
 
 """
 lainuri_states:
@@ -33,6 +34,22 @@ def set_lainuri_state(new_state: str, context=None):
 
   log.info(f"New Lainuri state '{new_state}'")
   lainuri_state = new_state
+  notify_activity()
+
+"""
+When somebody last used the kiosk, eg. read a barcode or touched the UI
+"""
+last_activity = 0.0
+def notify_activity():
+  global last_activity
+  last_activity = time.time()
+
+def is_session_active(within: float) -> bool:
+  """
+  @param within, seconds since the last activity the session is considered active
+  @returns True if a patron is logging in, the admin mode is on, or the kiosk has been used recently
+  """
+  return lainuri_state != 'get_items' or time.time() - last_activity < within
 
 
 def update_status(status: str, value: Status):
@@ -44,10 +61,19 @@ def update_status(status: str, value: Status):
     lainuri.status.poll_software_version()
     lainuri.event_queue.push_event(
       lainuri.event.LEServerStatusResponse(
-        statuses=statuses
+        statuses=statuses,
+        statistics=statistics,
       )
     )
 
+def update_statistics(name: str, value: dict):
+  """
+  Statistics change all the time, eg. on every RFID inventory, so they are not pushed on change.
+  They are delivered with the next status response.
+  """
+  global statistics
+  statistics[name] = value
+
 software_version_check_countdown = 0 # Don't check for version every time status is updated
 def poll_software_version():
   global software_version_check_countdown
@@ -74,3 +100,8 @@ statuses = {
   'ils_credentials_status': Status.SUCCESS,
   'software_version': get_software_version(),
 }
+
+"""
+Device statistics, eg. per-antenna RFID inventory statistics
+"""
+statistics = {}
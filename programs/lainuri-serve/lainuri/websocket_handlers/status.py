@@ -6,6 +6,7 @@ from lainuri.constants import Status
 import lainuri.event
 import lainuri.event_queue
 import lainuri.koha_api as koha_api
+import lainuri.metrics
 import lainuri.status
 import lainuri.rfid_reader
 
@@ -39,7 +40,8 @@ def status_request(event = None):
     lainuri.status.poll_software_version()
     lainuri.event_queue.push_event(
       lainuri.event.LEServerStatusResponse(
-        statuses=lainuri.status.statuses
+        statuses=lainuri.status.statuses,
+        statistics=lainuri.status.statistics,
       )
     )
   except Exception as e:
@@ -54,3 +56,6 @@ def status_request(event = None):
         },
       )
     )
+
+def metrics_request(event = None):
+  lainuri.event_queue.push_event(lainuri.event.LEMetricsResponse(metrics=lainuri.metrics.snapshot()))
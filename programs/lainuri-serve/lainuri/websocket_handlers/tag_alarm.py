@@ -35,3 +35,28 @@ def set_tag_alarm(event):
         },
       )
     )
+
+def set_tag_alarms(event):
+
+  try:
+    items = lainuri.rfid_reader.set_tag_gate_alarms(event.item_barcodes, event.on)
+    lainuri.event_queue.push_event(
+      lainuri.event.LESetTagAlarmsComplete(
+        items=items,
+        on=event.on,
+        status=Status.SUCCESS if all(item['status'] == Status.SUCCESS for item in items.values()) else Status.ERROR,
+      )
+    )
+  except Exception as e:
+    log.exception(f"Exception at {__name__}")
+    lainuri.event_queue.push_event(
+      lainuri.event.LESetTagAlarmsComplete(
+        items={item_barcode: {'status': Status.ERROR, 'states': {}} for item_barcode in event.item_barcodes},
+        on=event.on,
+        status=Status.ERROR,
+        states={'exception': {
+          'type': type(e).__name__,
+          'trace': str(e)}
+        },
+      )
+    )
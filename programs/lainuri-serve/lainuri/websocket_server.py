@@ -59,6 +59,7 @@ def handle_one_event(timeout: int = None, event: lainuri.event.LEvent = None) ->
 
   # Messages originating from the Lainuri UI
   if event.recipient == 'server' or (not(event.recipient) and event.default_recipient == 'server'):
+    if type(event) != lainuri.event.LELogSend: lainuri.status.notify_activity()
     if event.default_handler: eval(event.default_handler)(event)
     elif event.event == 'user-logging-in':
       lainuri.status.set_lainuri_state('user-logging-in')
@@ -168,7 +169,8 @@ def start(ws_daemon: bool = False) -> bool:
 
   try:
     if get_config('devices.rfid-reader.enabled'):
-      lainuri.rfid_reader.get_rfid_reader().start_polling_rfid_tags()
+      for rfid_reader in lainuri.rfid_reader.get_rfid_readers():
+        rfid_reader.start_polling_rfid_tags()
     else:
       log.info("RFID reader is disabled by config")
   except Exception as e:
@@ -199,7 +201,8 @@ def start(ws_daemon: bool = False) -> bool:
   return True
 
 def stop() -> bool:
-  lainuri.rfid_reader.get_rfid_reader().stop_polling_rfid_tags()
+  for rfid_reader in lainuri.rfid_reader.rfid_readers:
+    if getattr(rfid_reader, 'daemon', None): rfid_reader.stop_polling_rfid_tags() # Never started if the boot failed
   lainuri.barcode_reader.get_BarcodeReader().stop_polling_barcodes()
   lainuri.event_queue.get_daemon().kill()
   lainuri.rpc_daemon.stop_daemon()
@@ -209,7 +212,9 @@ def stop() -> bool:
     pass
   if 'server' in subthreads: subthreads['server'].kill()
 
-  lainuri.rfid_reader.get_rfid_reader().daemon.join(10)
+  for rfid_reader in lainuri.rfid_reader.rfid_readers:
+    if getattr(rfid_reader, 'daemon', None): rfid_reader.daemon.join(10)
+    rfid_reader.close()
   lainuri.barcode_reader.get_BarcodeReader().daemon.join(10)
   lainuri.event_queue.get_daemon().join(10)
   if lainuri.rpc_daemon.get_daemon(): lainuri.rpc_daemon.get_daemon().join(10)
@@ -221,6 +226,7 @@ def stop() -> bool:
   return True
 
 def handle_barcode_read(bcr: lainuri.barcode_reader.BarcodeReader, barcode: str):
+  lainuri.status.notify_activity()
   if get_config('admin.master-barcode') == barcode:
     lainuri.status.set_lainuri_state('admin', barcode)
   elif (lainuri.status.lainuri_state == 'user-logging-in'):
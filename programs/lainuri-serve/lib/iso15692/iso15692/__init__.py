@@ -48,9 +48,21 @@ def set_application_defined_compaction_scheme(compaction_func: callable, decompa
 
 
 
+class EndOfTagMemory(IndexError):
+  """
+  Decoding ran past the end of the given tag memory.
+  Tag memory is often read only partially, so read more of it and decode again.
+  """
+  def __init__(self, bytes_needed: int, message: str):
+    super().__init__(message)
+    self.bytes_needed = bytes_needed
+
+
+
 class ByteStream():
   def __init__(self, byttes: bytes):
     self.byttes = byttes
+    self.view = memoryview(byttes)
     self.i = -1
 
   def __repr__(self):
@@ -59,7 +71,14 @@ class ByteStream():
       byttes = f"'||{self.byttes.hex()}'"
     else:
       byttes = f"'{self.byttes[0:self.i].hex()}|{self.byttes[self.i:self.i+1].hex()}|{self.byttes[self.i+1:].hex()}'"
-    return yaml.dump({'!type': self.__class__, '!id': hex(id(self)), **self.__dict__, 'byttes': byttes})
+    return yaml.dump({'!type': self.__class__, '!id': hex(id(self)), **self.__getstate__(), 'byttes': byttes})
+
+  def __getstate__(self):
+    return {'byttes': self.byttes, 'i': self.i} # memoryviews cannot be serialized
+
+  def __setstate__(self, state: dict):
+    self.__init__(state['byttes'])
+    self.i = state['i']
 
   def current(self):
     return self.byttes[self.i]
@@ -68,10 +87,12 @@ class ByteStream():
     return True if len(self.byttes) > self.i+1 else False
 
   def next(self):
+    self._assert_available(1)
     self.i = self.i + 1
     return self.byttes[self.i]
 
   def peek(self):
+    self._assert_available(1)
     return self.byttes[self.i+1]
 
   def previous(self):
@@ -79,10 +100,15 @@ class ByteStream():
     return self.byttes[self.i]
 
   def slurp(self, n: int):
+    self._assert_available(n)
     byttes = self.byttes[self.i+1 : self.i+n+1]
     self.i = self.i + n
     return byttes
 
+  def _assert_available(self, n: int):
+    if self.i+n+1 > len(self.byttes):
+      raise EndOfTagMemory(self.i+n+1, f"Reading '{n}' bytes past the end of the tag memory. Need '{self.i+n+1}' bytes, have '{len(self.byttes)}'")
+
 
 
 class DataElement():
@@ -97,11 +123,42 @@ class DataElement():
   def __repr__(self):
     return yaml.dump({'!type': self.__class__, '!id': hex(id(self)), **self.__dict__})
 
+def encode_data_element(object_identifier: int, data: str, compaction_type_code: int = None) -> bytes:
+  """
+  Encode a data element without an offset: the precursor, the compacted object length and the compacted data.
+
+  @param compaction_type_code, None picks the compaction which encodes the data into the fewest bytes
+  """
+  if compaction_type_code is None: compaction_type_code = iso15692.compaction.select_compaction_type_code(data)
+  compacted_data = iso15692.compaction.get_compaction_scheme(compaction_type_code)(data)
+  if object_identifier < 0b1111:
+    precursor = bytes([compaction_type_code << 4 | object_identifier])
+  else:
+    precursor = bytes([compaction_type_code << 4 | 0b1111, object_identifier - 0b1111])
+  return precursor + iso15692.compaction.encode_compacted_object_length(compacted_data) + compacted_data
+
+def encode_data_object(data_elements: list) -> bytes:
+  """
+  @param data_elements, list of tuples (object identifier, data)
+  @returns the data elements, each with the best compaction, followed by the terminator precursor
+  """
+  return b''.join([encode_data_element(object_identifier, data) for object_identifier, data in data_elements]) + b'\x00'
+
 
 
 class DataObject():
+  """
+  Decodes the data elements lazily, only as far into the tag memory as the data elements asked for are found.
+  get_data_element() looks up the decoded data elements by their OID, and decodes more of the tag memory only
+  if the OID hasn't been decoded yet. decode() decodes all of the data elements, eg. for diagnostics.
+
+  The precursors, the lengths and the offsets are read with an integer offset over a memoryview of the tag memory.
+  Only the compacted data of each data element is copied out of it.
+  """
   def __init__(self, tag_memory: bytes = None):
     self.data_elements = []
+    self._data_elements_by_oid = {}
+    self._decoded_all = False
     self._tag_memory = ByteStream(tag_memory) if tag_memory else None
 
   def __repr__(self):
@@ -110,59 +167,118 @@ class DataObject():
   def add_data_element(self, data_element: DataElement):
     self.data_elements.append(data_element)
     data_element.sequence = len(self.data_elements)
+    self._data_elements_by_oid.setdefault(data_element.object_identifier, data_element)
     return data_element
 
   def get_data_element(self, oid: int) -> DataElement:
-    for de in self.data_elements:
-      if de.object_identifier == oid:
-        return de
-    return None
+    """
+    @returns the first DataElement with the given OID, decoding the tag memory until it is found, or None if the tag memory doesn't have it
+    @throws EndOfTagMemory if the tag memory ends before the terminator precursor, without the OID found
+    """
+    de = self._data_elements_by_oid.get(oid)
+    if de or self._decoded_all or not self._tag_memory: return de
+    return self.find_data_elements([oid]).get(oid)
+
+  def find_data_elements(self, oids: list) -> dict:
+    """
+    Decode the tag memory until all of the given OIDs are found, or the tag memory ends.
+
+    @returns dict of OID -> DataElement of the OIDs found
+    @throws EndOfTagMemory if the tag memory ends before the terminator precursor, with some of the OIDs not found
+    """
+    missing = set(oid for oid in oids if oid not in self._data_elements_by_oid)
+    while missing and not self._decoded_all and self._tag_memory:
+      de = self._decode_next()
+      if de: missing.discard(de.object_identifier)
+    return {oid: self._data_elements_by_oid[oid] for oid in oids if oid in self._data_elements_by_oid}
 
   def decode(self, tag_memory: bytes = None):
-    self._tag_memory = ByteStream(tag_memory) if tag_memory else self._tag_memory
-
-    while (self._tag_memory.has_next()):
-      # Skip null precursors
-      while (self._tag_memory.peek() == 0x80):
-        self._tag_memory.next()
-
-      # Terminator precursor
-      if self._tag_memory.peek() == 0x00:
-        return self
-
-      self.decode_next_data_element()
-
+    """
+    Decode all of the data elements, up to the terminator precursor or the end of the tag memory.
+    """
+    if tag_memory:
+      self.__init__(tag_memory)
+    while self._tag_memory and not self._decoded_all:
+      self._decode_next(partial_ok=True)
     return self
 
   def decode_next_data_element(self) -> DataElement:
-    # Skip null precursors
-    if (self._tag_memory.peek() == 0x80):
-      raise Exception(f"Decoding next data element failed, precursor is NULL! tag_memory='{self._tag_memory}', dob='{self}'")
-
-    # Terminator precursor
-    if self._tag_memory.peek() == 0x00:
-      raise Exception(f"Decoding next data element failed, precursor is TERMINATOR! tag_memory='{self._tag_memory}', dob='{self}'")
-
-    precursor = self.get_precursor()
-
-    if precursor['offset']:
-      offset_length = self._tag_memory.next()
-    else:
-      offset_length = None
-
-    length_of_compacted_data = iso15692.compaction.decode_compacted_object_length(self._tag_memory)
-    compacted_data = self._tag_memory.slurp(length_of_compacted_data)
+    view = self._tag_memory.view
+    i = self._tag_memory.i + 1
+    if i < len(view):
+      # Skip null precursors
+      if view[i] == 0x80:
+        raise Exception(f"Decoding next data element failed, precursor is NULL! tag_memory='{self._tag_memory}', dob='{self}'")
 
-    if offset_length:
-      offset_bytes = self._tag_memory.slurp(offset_length)
-    else:
-      offset_bytes = None
+      # Terminator precursor
+      if view[i] == 0x00:
+        raise Exception(f"Decoding next data element failed, precursor is TERMINATOR! tag_memory='{self._tag_memory}', dob='{self}'")
+
+    return self._decode_next()
+
+  def _decode_next(self, partial_ok: bool = False) -> DataElement:
+    """
+    Decode the data element after the null precursors, if any.
+
+    @param partial_ok, if the tag memory ending without the terminator precursor is not an error, eg. when decoding everything there is
+    @returns DataElement, or None if the terminator precursor or the end of the tag memory was reached
+    """
+    stream = self._tag_memory
+    view = stream.view
+    length = len(view)
+    i = stream.i + 1
+    try:
+      while i < length and view[i] == 0x80: # Skip null precursors
+        i += 1
+      if i >= length:
+        stream.i = length - 1
+        self._decoded_all = True
+        if partial_ok: return None
+        raise EndOfTagMemory(length+1, f"Reading past the end of the tag memory looking for the next data element. Need '{length+1}' bytes, have '{length}'")
+      precursor_byte = view[i]
+      if precursor_byte == 0x00: # Terminator precursor
+        stream.i = i
+        self._decoded_all = True
+        return None
+      i += 1
+
+      compaction_type_code = (precursor_byte & 0b01110000) >> 4
+      object_identifier = precursor_byte & 0b00001111
+      if object_identifier == 0b1111:
+        object_identifier += view[i]
+        i += 1
+
+      offset_length = 0
+      if precursor_byte & 0b10000000:
+        offset_length = view[i]
+        i += 1
+
+      # Compacted object length, see iso15692.compaction.decode_compacted_object_length()
+      length_of_compacted_data = view[i]
+      i += 1
+      if length_of_compacted_data & 0b10000000:
+        while view[i] & 0b10000000:
+          length_of_compacted_data = (length_of_compacted_data << 8) | view[i]
+          i += 1
+        length_of_compacted_data = (length_of_compacted_data << 8) | view[i]
+        i += 1
+    except IndexError:
+      raise EndOfTagMemory(i+1, f"Reading past the end of the tag memory decoding a precursor. Need '{i+1}' bytes, have '{length}'")
+
+    end = i + length_of_compacted_data
+    if end > length:
+      raise EndOfTagMemory(end, f"Reading '{length_of_compacted_data}' bytes past the end of the tag memory. Need '{end}' bytes, have '{length}'")
+    if end + offset_length > length:
+      raise EndOfTagMemory(end + offset_length, f"Reading '{length_of_compacted_data + offset_length}' bytes past the end of the tag memory. Need '{end + offset_length}' bytes, have '{length}'")
+    compacted_data = bytes(view[i:end])
+    offset_bytes = bytes(view[end:end+offset_length]) if offset_length else None
+    stream.i = end + offset_length - 1
 
     return self.add_data_element(DataElement(
       offset_bytes=offset_bytes,
-      compaction_type_code=precursor['compaction_type_code'],
-      object_identifier=precursor['object_identifier'],
-      data=iso15692.compaction.get_decompaction_scheme(precursor['compaction_type_code'])(compacted_data),
+      compaction_type_code=compaction_type_code,
+      object_identifier=object_identifier,
+      data=iso15692.compaction.get_decompaction_scheme(compaction_type_code)(compacted_data),
       compacted_data=compacted_data,
       length_of_compacted_data=length_of_compacted_data,
     ))
@@ -177,4 +293,3 @@ class DataObject():
     if precursor['object_identifier'] == 0b1111:
       precursor['object_identifier'] = precursor['object_identifier'] + self._tag_memory.next()
     return precursor
-
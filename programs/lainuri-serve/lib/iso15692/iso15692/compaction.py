@@ -226,12 +226,125 @@ def compact_utf8_string(octets: str) -> bytes:
 def decompact_utf8_string(octets: bytes) -> str:
   return octets.decode('utf8')
 
+"""
+Table-driven codecs. These pack and unpack whole strings with integer arithmetic and lookup tables, instead of bit by bit.
+They produce the same compacted bytes as the bitarray implementations above.
+Unpacking also decodes the last character of 5-bit and 6-bit data which fills the last byte exactly.
+"""
+_FIVE_BIT_CHARS = ''.join(chr(0x40 | value) for value in range(0, 32)) # 5-bit value -> character
+_SIX_BIT_CHARS = ''.join(chr(value) if value & 0b100000 else chr(0x40 | value) for value in range(0, 64)) # 6-bit value -> character
+_FIVE_BIT_VALUES = bytes.maketrans(bytes(range(0x40, 0x60)), bytes(range(0, 32))) # character -> 5-bit value
+_SIX_BIT_VALUES = bytes.maketrans(bytes(range(0x20, 0x60)), bytes([byte & 0b111111 for byte in range(0x20, 0x60)])) # character -> 6-bit value
+
+# Which compactions each ISO/IEC 8859-1 character can be compacted with, as the bits of the compaction type codes
+_CHARACTER_CLASSES = bytes(
+  (1 << 0b011 if 0x41 <= byte <= 0x5F else 0) |
+  (1 << 0b100 if 0x20 <= byte <= 0x5F else 0)
+  for byte in range(0, 256)
+)
+
+def _pack(values: bytes, bits_per_value: int, padding_bits: int, padding: int) -> bytes:
+  integer = 0
+  for value in values:
+    integer = (integer << bits_per_value) | value
+  integer = (integer << padding_bits) | padding
+  return integer.to_bytes((len(values) * bits_per_value + padding_bits) // 8, byteorder='big')
+
+def _unpack(byttes: bytes, bits_per_value: int, chars: str, padding: int) -> str:
+  integer = int.from_bytes(byttes, byteorder='big')
+  count = len(byttes) * 8 // bits_per_value
+  shift = len(byttes) * 8 - bits_per_value
+  mask = (1 << bits_per_value) - 1
+  values = [(integer >> (shift - i * bits_per_value)) & mask for i in range(0, count)]
+  if values and values[-1] == padding: values.pop() # A whole value of padding
+  return ''.join([chars[value] for value in values])
+
+def pack_numeric(numeric: str) -> bytes:
+  validate_compaction_numeric(numeric)
+  return bytes.fromhex(numeric + 'f' if len(numeric) % 2 else numeric)
+
+def unpack_numeric(byttes: bytes) -> str:
+  numeric = byttes.hex()
+  if numeric.endswith('f'): numeric = numeric[:-1]
+  return validate_compaction_numeric(numeric)
+
+def pack_5_bit(string: str) -> bytes:
+  validate_compaction_5_bit_table(string)
+  padding_bits = -len(string) * 5 % 8
+  return _pack(string.encode(default_encoding).translate(_FIVE_BIT_VALUES), 5, padding_bits, 0)
+
+def unpack_5_bit(byttes: bytes) -> str:
+  return validate_compaction_5_bit_table(_unpack(byttes, 5, _FIVE_BIT_CHARS, 0))
+
+def pack_6_bit(string: str) -> bytes:
+  validate_compaction_6_bit(string)
+  padding_bits = -len(string) * 6 % 8
+  return _pack(string.encode(default_encoding).translate(_SIX_BIT_VALUES), 6, padding_bits, 1 << (padding_bits - 1) if padding_bits else 0)
+
+def unpack_6_bit(byttes: bytes) -> str:
+  return validate_compaction_6_bit(_unpack(byttes, 6, _SIX_BIT_CHARS, 0b100000))
+
+def validate_compaction_5_bit_table(string: str) -> str:
+  if not validate_compaction_5_bit_regex.search(string):
+    raise ValueError(f"String '{string}' hex='{string.encode(default_encoding, errors='replace').hex()}' cannot be 5_bit compacted.")
+  return string
+
+def select_compaction_type_code(data: str) -> int:
+  """
+  Pick the compaction which encodes the data into the fewest bytes, without trying the compactions.
+  The characters are classified in one pass, and ties go to the lower compaction type code.
+  """
+  if data.isdigit() and data.isascii():
+    # An integer never takes more bytes than the numeric, 5-bit or 6-bit compactions of the same digits
+    if 2 <= len(data) <= 19 and data[0] != '0': return 0b001
+    return 0b010 if len(data) >= 2 else 0b110
+
+  try:
+    encoded = data.encode(default_encoding)
+  except UnicodeEncodeError:
+    return 0b111
+
+  classes = 0xFF
+  for byte in set(encoded):
+    classes &= _CHARACTER_CLASSES[byte]
+  length = len(encoded)
+
+  best_code, best_size = 0b110, length
+  if classes & 1 << 0b011 and length >= 3:
+    best_code, best_size = 0b011, (length * 5 + 7) // 8
+  elif classes & 1 << 0b100 and length >= 4 and encoded[-1] != 0x20:
+    size = (length * 6 + 7) // 8
+    if size < best_size: best_code, best_size = 0b100, size
+  return best_code
+
+def select_compaction_scheme(data: str) -> callable:
+  return get_compaction_scheme(select_compaction_type_code(data))
+
+def compact_many(datas: list) -> list:
+  """
+  Compact many strings, eg. the primary item identifiers of a batch of tags to program.
+
+  @returns list of tuples (compaction type code, compacted bytes)
+  """
+  compacted = []
+  for data in datas:
+    compaction_type_code = select_compaction_type_code(data)
+    compacted.append((compaction_type_code, iso_15962_compaction_schemes[compaction_type_code][0](data)))
+  return compacted
+
+def decompact_many(compacteds: list) -> list:
+  """
+  @param compacteds, list of tuples (compaction type code, compacted bytes)
+  @returns list of the decompacted strings
+  """
+  return [iso_15962_compaction_schemes[compaction_type_code][1](byttes) for compaction_type_code, byttes in compacteds]
+
 iso_15962_compaction_schemes = {
   0b000: [compact_application_defined, decompact_application_defined], #As presented by the application
   0b001: [compact_integer, decompact_integer], #Integer
-  0b010: [compact_numeric, decompact_numeric], #Numeric string (from “0” to “9”)
-  0b011: [compact_5_bit, decompact_5_bit], #Uppercase alphabetic
-  0b100: [compact_6_bit, decompact_6_bit], #Uppercase, numeric, etc.
+  0b010: [pack_numeric, unpack_numeric], #Numeric string (from “0” to “9”)
+  0b011: [pack_5_bit, unpack_5_bit], #Uppercase alphabetic
+  0b100: [pack_6_bit, unpack_6_bit], #Uppercase, numeric, etc.
   0b101: '7-bit code', #US ASCII
   0b110: [compact_octet_string, decompact_octet_string], #Unaltered 8 bit (default = ISO/IEC 8859-1)
   0b111: [compact_utf8_string, decompact_utf8_string], #External compaction to ISO/IEC 10646
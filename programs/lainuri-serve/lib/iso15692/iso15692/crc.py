@@ -0,0 +1,55 @@
+"""
+Table-driven CRC-16 checksums, one table lookup per byte instead of eight shifts.
+
+  crc_16_ccitt()     CRC-16/CCITT-FALSE, polynomial 0x1021 most significant bit first, initial value 0xFFFF.
+                     Protects the ISO 28560-3 basic block.
+  crc_16_reflected() Polynomial 0x1021 reflected as 0x8408 least significant bit first, initial value 0xFFFF, no final XOR.
+                     Protects the frames of the RL866 RFID reader.
+
+The *_many() variants checksum a batch of buffers, eg. a whole inventory of tag memories.
+"""
+
+def _make_table_msb_first(polynomial: int) -> tuple:
+  table = []
+  for byte in range(0, 256):
+    crc = byte << 8
+    for _ in range(0, 8):
+      crc = ((crc << 1) ^ polynomial) if crc & 0x8000 else (crc << 1)
+    table.append(crc & 0xFFFF)
+  return tuple(table)
+
+def _make_table_lsb_first(polynomial: int) -> tuple:
+  table = []
+  for byte in range(0, 256):
+    crc = byte
+    for _ in range(0, 8):
+      crc = ((crc >> 1) ^ polynomial) if crc & 0x0001 else (crc >> 1)
+    table.append(crc)
+  return tuple(table)
+
+CCITT_TABLE = _make_table_msb_first(0x1021)
+REFLECTED_TABLE = _make_table_lsb_first(0x8408)
+
+def crc_16_ccitt(data: bytes, crc: int = 0xFFFF) -> int:
+  table = CCITT_TABLE
+  for byte in data:
+    crc = ((crc << 8) & 0xFF00) ^ table[(crc >> 8) ^ byte]
+  return crc
+
+def crc_16_reflected(data: bytes, crc: int = 0xFFFF) -> int:
+  table = REFLECTED_TABLE
+  for byte in data:
+    crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+  return crc
+
+def crc_16_ccitt_many(buffers: list, crc: int = 0xFFFF) -> list:
+  """
+  @returns list of the checksum of each buffer
+  """
+  return [crc_16_ccitt(data, crc) for data in buffers]
+
+def crc_16_reflected_many(buffers: list, crc: int = 0xFFFF) -> list:
+  """
+  @returns list of the checksum of each buffer
+  """
+  return [crc_16_reflected(data, crc) for data in buffers]
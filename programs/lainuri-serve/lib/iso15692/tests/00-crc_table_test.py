@@ -0,0 +1,53 @@
+import context
+import iso15692.crc
+
+import random
+
+def crc_16_ccitt_bitwise(bytess):
+  """
+  The bit-by-bit implementation iso28560 used before the table-driven one
+  """
+  crc_sum = 0xFFFF
+  for c in bytess:
+    c <<= 8
+    for _ in range(0,8):
+      xor_flag = ((crc_sum ^ c) & 0x8000) != 0
+      crc_sum = crc_sum << 1
+      if (xor_flag):
+        crc_sum = crc_sum ^ 0x1021
+      c = c << 1
+    crc_sum &= 0xffff
+  return crc_sum
+
+def crc_16_reflected_bitwise(bytess):
+  """
+  The bit-by-bit implementation the RL866 reader used before the table-driven one
+  """
+  crc = 0xFFFF
+  for val in bytess:
+    crc ^= val
+    for _ in range(0,8):
+      crc = (crc >> 1) ^ 0x8408 if crc & 0x0001 else crc >> 1
+  return crc
+
+def random_buffers():
+  rand = random.Random(15692)
+  return [bytes(rand.getrandbits(8) for _ in range(0, rand.randint(0, 64))) for _ in range(0, 200)]
+
+def test_crc_16_ccitt():
+  assert iso15692.crc.crc_16_ccitt(b'RFID tag data model') == 0x1AEE
+  assert iso15692.crc.crc_16_ccitt(b'123456789') == 0x29B1
+  assert iso15692.crc.crc_16_ccitt(b'') == 0xFFFF
+
+def test_crc_16_reflected():
+  assert iso15692.crc.crc_16_reflected(bytes([0x08, 0xFF, 0x00, 0x01, 0x01, 0x01])).to_bytes(2, 'little') == b'\xFF\x8E'
+  assert iso15692.crc.crc_16_reflected(bytes([0x05, 0xFF, 0xC0])).to_bytes(2, 'little') == b'\x42\x39'
+
+def test_crc_16_pinned_to_bitwise():
+  buffers = random_buffers()
+  assert iso15692.crc.crc_16_ccitt_many(buffers) == [crc_16_ccitt_bitwise(b) for b in buffers]
+  assert iso15692.crc.crc_16_reflected_many(buffers) == [crc_16_reflected_bitwise(b) for b in buffers]
+
+def test_crc_16_buffer_types():
+  assert iso15692.crc.crc_16_ccitt(bytearray(b'RFID tag data model')) == 0x1AEE
+  assert iso15692.crc.crc_16_ccitt(memoryview(b'xRFID tag data model')[1:]) == 0x1AEE
@@ -34,3 +34,35 @@ def test_iso15690_example_annex_p_primary_item_identifier():
   assert type(dob) == DataObject
   assert dob.get_data_element(1).data == '12345678912345678'
   assert len(dob.data_elements) == 1, "Only one data element decoded"
+
+def test_iso15690_decoding_past_partially_read_tag_memory():
+  dob = DataObject(
+    tag_memory=bytes(
+      b'\x91\x05\x08\x00\x2B\xDC\x54\x5E\x14\xD6'
+    )
+  )
+  try:
+    dob.decode_next_data_element()
+    assert False, "EndOfTagMemory expected"
+  except iso15692.EndOfTagMemory as e:
+    assert e.bytes_needed == 11
+
+  dob = DataObject(
+    tag_memory=bytes(
+      b'\x91\x05\x08\x00\x2B\xDC\x54\x5E\x14\xD6\x4E\x80\x80\x80\x80\x80'
+    )
+  )
+  dob.decode_next_data_element()
+  assert dob.get_data_element(1).data == '12345678912345678'
+
+def test_iso15692_encode_data_object():
+  tag_memory = iso15692.encode_data_object([(1, '1620168259'), (7, 'AB12XY'), (9, '20091231'), (17, 'JPN')])
+  assert tag_memory[0:6] == b'\x11\x04\x60\x91\xce\x43'
+  assert tag_memory[-1:] == b'\x00'
+  dob = DataObject(tag_memory=tag_memory).decode()
+  assert [(de.object_identifier, de.compaction_type_code, de.data) for de in dob.data_elements] == [
+    (1, 0b001, '1620168259'),
+    (7, 0b100, 'AB12XY'),
+    (9, 0b001, '20091231'),
+    (17, 0b011, 'JPN'),
+  ]
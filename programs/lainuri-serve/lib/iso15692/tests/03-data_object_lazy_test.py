@@ -0,0 +1,48 @@
+import context
+import iso15692
+import iso15692.compaction
+from iso15692 import DataObject
+
+# Primary item identifier, then an application defined data element nothing can decompact, then the terminator
+tag_memory = bytes(
+  b'\x91\x01\x04\x60\x91\xce\x43\x80\x02\x01\xa8\x05\x01\x10\x67\x02'
+  b'\x42\x41\x03\x07\x32\x40\xde\x05\xab\x07\x5b\x00\x00\x00\x00\x00'
+)
+
+def test_lazy_decoding_stops_at_the_oid():
+  iso15692.set_application_defined_compaction_scheme(
+    compaction_func=lambda data: (_ for _ in ()).throw(ValueError("not defined")),
+    decompaction_func=lambda data: (_ for _ in ()).throw(ValueError("not defined")),
+  )
+  dob = DataObject(tag_memory=tag_memory)
+  assert dob.get_data_element(1).data == '1620168259'
+  assert len(dob.data_elements) == 1, "Only the primary item identifier decoded"
+  assert dob.get_data_element(1) is dob.data_elements[0]
+
+def test_lazy_decoding_indexes_by_oid():
+  iso15692.set_application_defined_compaction_scheme(
+    compaction_func=iso15692.compaction.compact_octet_string,
+    decompaction_func=iso15692.compaction.decompact_octet_string,
+  )
+  dob = DataObject(tag_memory=tag_memory)
+  found = dob.find_data_elements([7, 1])
+  assert found[1].data == '1620168259'
+  assert found[7].data == 'BA'
+  assert len(dob.data_elements) == 4, "Decoded up to the OID 7"
+
+  assert dob.get_data_element(9) == None
+  assert len(dob.data_elements) == 5, "Decoded to the terminator looking for OID 9"
+
+  full = DataObject(tag_memory=tag_memory).decode()
+  assert [(de.object_identifier, de.data) for de in full.data_elements] == [(de.object_identifier, de.data) for de in dob.data_elements]
+
+def test_lazy_decoding_past_partially_read_tag_memory():
+  dob = DataObject(tag_memory=tag_memory[0:16])
+  assert dob.get_data_element(1).data == '1620168259'
+  try:
+    dob.get_data_element(3)
+    assert False, "EndOfTagMemory expected"
+  except iso15692.EndOfTagMemory as e:
+    assert e.bytes_needed == 18
+
+  assert repr(dob)
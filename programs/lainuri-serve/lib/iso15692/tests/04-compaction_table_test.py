@@ -0,0 +1,60 @@
+import context
+import iso15692.compaction as compaction
+
+import random
+
+rand = random.Random(20)
+numerics = ['10', '410', '0201', '0000'] + [str(rand.randrange(0, 10**n)).zfill(n) for n in range(2, 40) for _ in range(0, 3)]
+five_bits = ['JPN', 'ABCD', 'XYZ_^'] + [''.join(chr(rand.randint(0x41, 0x5F)) for _ in range(0, n)) for n in range(3, 40) for _ in range(0, 3)]
+six_bits = ['ABC123456', 'FI-JYVA', 'A B?'] + [''.join(chr(rand.randint(0x20, 0x5F)) for _ in range(0, n)).rstrip(' ') + 'Z' for n in range(3, 40) for _ in range(0, 3)]
+
+def test_pack_equals_compact():
+  for s in numerics: assert compaction.pack_numeric(s) == compaction.compact_numeric(s), s
+  for s in five_bits: assert compaction.pack_5_bit(s) == compaction.compact_5_bit(s), s
+  for s in six_bits: assert compaction.pack_6_bit(s) == compaction.compact_6_bit(s), s
+
+def test_unpack_equals_decompact():
+  for s in numerics: assert compaction.unpack_numeric(compaction.compact_numeric(s)) == compaction.decompact_numeric(compaction.compact_numeric(s)) == s
+  # The bitarray decoders lose the last character when it fills the last byte exactly
+  for s in five_bits:
+    if len(s) * 5 % 8: assert compaction.decompact_5_bit(compaction.compact_5_bit(s)) == s
+    assert compaction.unpack_5_bit(compaction.compact_5_bit(s)) == s
+  for s in six_bits:
+    if len(s) * 6 % 8: assert compaction.decompact_6_bit(compaction.compact_6_bit(s)) == s
+    assert compaction.unpack_6_bit(compaction.compact_6_bit(s)) == s
+
+def test_pack_rejects_what_it_cannot_compact():
+  for pack, string in [(compaction.pack_numeric, '12a'), (compaction.pack_numeric, '1'), (compaction.pack_5_bit, 'AB1'), (compaction.pack_5_bit, 'AB'), (compaction.pack_6_bit, 'ABC '), (compaction.pack_6_bit, 'abcd')]:
+    try:
+      pack(string)
+      assert False, f"{pack.__name__}('{string}') should raise"
+    except ValueError:
+      pass
+
+def test_select_compaction_type_code():
+  assert compaction.select_compaction_type_code('1620168259') == 0b001
+  assert compaction.select_compaction_type_code('0201') == 0b010
+  assert compaction.select_compaction_type_code('12345678901234567890') == 0b010 # Too long for an integer
+  assert compaction.select_compaction_type_code('JPNX') == 0b011
+  assert compaction.select_compaction_type_code('ABC123456') == 0b100
+  assert compaction.select_compaction_type_code('FI-Jyva') == 0b110
+  assert compaction.select_compaction_type_code('Jyväskylä') == 0b110
+  assert compaction.select_compaction_type_code('€uro') == 0b111
+  for s in ['1620168259', '0201', '410']:
+    assert compaction.select_compaction_scheme(s)(s) == compaction.detect_best_compaction_scheme(s)(s)
+
+def test_select_picks_the_smallest():
+  for s in numerics + five_bits + six_bits + ['FI-Jyva', 'x', '']:
+    code = compaction.select_compaction_type_code(s)
+    size = len(compaction.get_compaction_scheme(code)(s))
+    for other in [0b001, 0b010, 0b011, 0b100, 0b110]:
+      try:
+        assert size <= len(compaction.get_compaction_scheme(other)(s)), f"'{s}' compacts smaller with {other:03b} than {code:03b}"
+      except ValueError:
+        pass
+
+def test_compact_many_round_trips():
+  datas = numerics + five_bits + six_bits + ['FI-Jyva', 'Jyväskylä', '€uro']
+  compacted = compaction.compact_many(datas)
+  assert [code for code, _ in compacted] == [compaction.select_compaction_type_code(s) for s in datas]
+  assert compaction.decompact_many(compacted) == datas
@@ -1,6 +1,8 @@
 import iso15692
+import iso15692.crc
 import iso15692.format
 
+import collections
 import logging
 import yaml
 
@@ -56,6 +58,13 @@ def _get_data_object_class(dsfid: int):
 
 
 class ISO28560_Object():
+  """
+  min_tag_memory_bytes, How many bytes of tag memory are at least needed to decode the primary item identifier.
+                        Readers can use this to read only the start of the tag memory.
+                        If decoding needs more, iso15692.EndOfTagMemory is raised. None means the whole tag memory is needed.
+  """
+  min_tag_memory_bytes = None
+
   def get_primary_item_identifier(self):
     raise Exception(f"Overload missing from class '{self}'. Overload this for your implementation!")
 
@@ -70,6 +79,7 @@ class ISO28560_3_Object(ISO28560_Object):
   """
   Only basic block handling implemented.
   """
+  min_tag_memory_bytes = 34
   def __init__(self, afi: int, dsfid: int, block_size: int, memory_capacity_blocks: int, tag_memory: bytes = None):
     self._tag_memory = tag_memory
     self.primary_item_identifier = None
@@ -90,7 +100,9 @@ class ISO28560_3_Object(ISO28560_Object):
     return self
 
   def get_basic_block(self):
-    if len(self._tag_memory) < 32 or len(self._tag_memory) == 33:
+    if len(self._tag_memory) < 32:
+      raise iso15692.EndOfTagMemory(32, f"tag memory length '{len(self._tag_memory)}' must be 32 or 34 or more. tag_memory='{self._tag_memory}'")
+    if len(self._tag_memory) == 33:
       raise Exception(f"tag memory length '{len(self._tag_memory)}' must be 32 or 34 or more. tag_memory='{self._tag_memory}'")
     self.content_parameter = self._tag_memory[0] & 0b00001111
     self.type_of_usage = self._tag_memory[0] & 0b11110000
@@ -167,32 +179,176 @@ class ISO28560_2_Object(iso15692.DataObject, ISO28560_Object):
   """
   TODO
   """
+  min_tag_memory_bytes = 16
   def __init__(self, afi: int, dsfid: int, block_size: int, memory_capacity_blocks: int, tag_memory: bytes = None):
     super().__init__(tag_memory=tag_memory)
 
   def get_primary_item_identifier(self) -> str:
+    """
+    Decodes the tag memory only until the primary item identifier is found, which is normally the first data element.
+    """
     de = self.get_data_element(1)
     if not de:
-      de = self.decode_next_data_element()
-    if de.object_identifier != 1:
-      raise Exception(f"Data Object is missing primary item identifier!: dob='{self.dob}'")
+      raise Exception(f"Data Object is missing primary item identifier!: dob='{self}'")
     return de.data
 
 
 
 def crc_16_ccitt(bytess):
-  crc_poly = 0x1021
-  crc_sum = 0xFFFF
-  for c in bytess:
-    i = 0
-    xor_flag = False
-    c <<= 8
-    for _ in range(0,8):
-      xor_flag = ((crc_sum ^ c) & 0x8000) != 0
-      crc_sum = crc_sum << 1
-      if (xor_flag):
-        crc_sum = crc_sum ^ crc_poly
-      c = c << 1
-    crc_sum &= 0xffff
-
-  return crc_sum
+  return iso15692.crc.crc_16_ccitt(bytess)
+
+
+
+"""
+Bulk decoding of whole inventories of tags, without building the ISO28560_Object for each tag.
+"""
+DecodedTag = collections.namedtuple('DecodedTag', ['primary_item_identifier', 'isil', 'set_information', 'crc_valid', 'error'])
+DecodedTag.__doc__ = """
+primary_item_identifier, str or None if decoding failed
+isil, str of the owner institution, or None if the tag doesn't carry it
+set_information, dict with 'numbers_of_parts_in_item' and 'ordinal_part_number', or None if the tag doesn't carry it
+crc_valid, bool, or None if the data format has no CRC
+error, the Exception decoding the primary item identifier failed with, or None
+"""
+
+OID_PRIMARY_ITEM_IDENTIFIER = 1
+OID_OWNER_INSTITUTION = 3
+OID_SET_INFORMATION = 4
+
+def decode_many(tags: list, overloads: list = None) -> list:
+  """
+  Decode the primary item identifier, the owner institution ISIL, the set information and the CRC validity of many tags.
+
+  The data format of each distinct DSFID and AFI -pair is resolved only once per batch.
+
+  @param tags, list of tuples (dsfid, afi, tag_memory)
+  @param overloads, list of dicts, eg. {'!class': 'ISO28560_3_Object', 'dsfid': 0}.
+                    The first overload whose 'dsfid' and 'afi' keys all match the tag, picks the data format '!class'.
+                    Overloads with other keys never match.
+  @returns list of DecodedTag, in the order of the given tags
+  """
+  decoders = {}
+  decoded = []
+  for dsfid, afi, tag_memory in tags:
+    decoder = decoders.get((dsfid, afi))
+    if not decoder:
+      decoder = decoders[(dsfid, afi)] = _get_bulk_decoder(dsfid, afi, overloads)
+    try:
+      decoded.append(decoder(tag_memory))
+    except Exception as e:
+      decoded.append(DecodedTag(None, None, None, None, e))
+  return decoded
+
+def _get_bulk_decoder(dsfid: int, afi: int, overloads: list) -> callable:
+  try:
+    object_class = None
+    for ol in overloads or []:
+      keys = [key for key in ol.keys() if key != '!class']
+      if keys and all(key in ('dsfid', 'afi') and {'dsfid': dsfid, 'afi': afi}[key] == ol[key] for key in keys):
+        object_class = ol['!class']
+        break
+    if object_class is None: object_class = _get_data_object_class(dsfid).__name__
+    return bulk_decoders[object_class]
+  except Exception as e:
+    error = e if not isinstance(e, KeyError) else ValueError(f"No bulk decoder for the data format '{e.args[0]}'")
+    def _decode_error(tag_memory: bytes) -> DecodedTag:
+      raise error
+    return _decode_error
+
+def _decode_iso28560_3(tag_memory: bytes) -> DecodedTag:
+  """
+  Decodes the basic block like ISO28560_3_Object.decode() does
+  """
+  length = len(tag_memory)
+  if length < 32:
+    raise iso15692.EndOfTagMemory(32, f"tag memory length '{length}' must be 32 or 34 or more")
+  if length == 33:
+    raise ValueError(f"tag memory length '{length}' must be 32 or 34 or more")
+  isil = _string_from_fixed_field(tag_memory, 21, 32 if length == 32 else 34)
+  return DecodedTag(
+    primary_item_identifier=_string_from_fixed_field(tag_memory, 3, 19),
+    isil=isil[0:2] + '-' + isil[2:],
+    set_information={
+      'numbers_of_parts_in_item': tag_memory[2],
+      'ordinal_part_number': tag_memory[1],
+    },
+    crc_valid=crc_16_ccitt(bytes(tag_memory[0:19]) + bytes(tag_memory[21:34])) == tag_memory[19] | (tag_memory[20] << 8),
+    error=None,
+  )
+
+def _string_from_fixed_field(tag_memory: bytes, start: int, end: int) -> str:
+  field = bytes(tag_memory[start:end])
+  terminator = field.find(0x00)
+  return (field if terminator == -1 else field[0:terminator]).decode('utf8')
+
+def _decode_iso28560_2(tag_memory: bytes) -> DecodedTag:
+  """
+  Walks the data elements with an integer offset, decompacting only the data elements needed.
+  The primary item identifier must decode, the owner institution and the set information are left None if they don't.
+  """
+  data = {}
+  i = 0
+  length = len(tag_memory)
+  try:
+    while i < length:
+      precursor = tag_memory[i]
+      i += 1
+      if precursor == 0x80: continue # Null precursor
+      if precursor == 0x00: break # Terminator precursor
+      oid = precursor & 0b00001111
+      if oid == 0b1111:
+        oid += tag_memory[i]
+        i += 1
+      offset_length = 0
+      if precursor & 0b10000000:
+        offset_length = tag_memory[i]
+        i += 1
+      # The compacted object length, decoded like iso15692.compaction.decode_compacted_object_length()
+      length_of_compacted_data = tag_memory[i]
+      i += 1
+      if length_of_compacted_data & 0b10000000:
+        while tag_memory[i] & 0b10000000:
+          length_of_compacted_data = (length_of_compacted_data << 8) | tag_memory[i]
+          i += 1
+        length_of_compacted_data = (length_of_compacted_data << 8) | tag_memory[i]
+        i += 1
+      if i + length_of_compacted_data > length:
+        raise iso15692.EndOfTagMemory(i + length_of_compacted_data, f"Data element OID '{oid}' runs past the end of the tag memory")
+      if oid in (OID_PRIMARY_ITEM_IDENTIFIER, OID_OWNER_INSTITUTION, OID_SET_INFORMATION) and oid not in data:
+        compacted_data = bytes(tag_memory[i:i+length_of_compacted_data])
+        try:
+          data[oid] = iso15692.compaction.get_decompaction_scheme((precursor & 0b01110000) >> 4)(compacted_data)
+        except Exception:
+          if oid == OID_PRIMARY_ITEM_IDENTIFIER: raise
+      i += length_of_compacted_data + offset_length
+  except IndexError as e:
+    # Tag memory is often read only partially. What was decoded so far is enough, if it has the primary item identifier.
+    if OID_PRIMARY_ITEM_IDENTIFIER not in data:
+      if isinstance(e, iso15692.EndOfTagMemory): raise
+      raise iso15692.EndOfTagMemory(i + 1, f"Reading past the end of the tag memory of '{length}' bytes")
+
+  if OID_PRIMARY_ITEM_IDENTIFIER not in data:
+    raise ValueError("Data Object is missing primary item identifier!")
+  return DecodedTag(
+    primary_item_identifier=data[OID_PRIMARY_ITEM_IDENTIFIER],
+    isil=data.get(OID_OWNER_INSTITUTION),
+    set_information=_parse_set_information(data.get(OID_SET_INFORMATION)),
+    crc_valid=None,
+    error=None,
+  )
+
+def _parse_set_information(set_information: str) -> dict:
+  """
+  ISO 28560-2 set information is a numeric string, the first half is the number of parts in the item and the second half the ordinal part number.
+  """
+  if not set_information or len(set_information) % 2: return None
+  half = len(set_information) // 2
+  return {
+    'numbers_of_parts_in_item': int(set_information[0:half]),
+    'ordinal_part_number': int(set_information[half:]),
+  }
+
+bulk_decoders = {
+  'ISO28560_2_Object': _decode_iso28560_2,
+  'ISO28560_3_Object': _decode_iso28560_3,
+}
@@ -0,0 +1,52 @@
+import context
+
+import iso15692
+import iso15692.compaction
+import iso28560
+
+def iso28560_2_tag_memory(primary_item_identifier: str, isil: str = None, set_information: str = None) -> bytes:
+  pii = iso15692.compaction.compact_integer(primary_item_identifier)
+  tag_memory = bytes([0x11, len(pii)]) + pii
+  if set_information: tag_memory += bytes([0x24, len(set_information) // 2]) + iso15692.compaction.compact_numeric(set_information)
+  if isil: tag_memory += bytes([0x63, len(isil)]) + isil.encode('iso-8859-1')
+  return tag_memory + b'\x00'
+
+def iso28560_3_tag_memory(primary_item_identifier: str) -> bytes:
+  return bytes(iso28560.ISO28560_3_Object(afi=0x07, dsfid=0x3E, block_size=4, memory_capacity_blocks=28, tag_memory=bytearray(34)).encode(
+    content_parameter=0, type_of_usage=1, numbers_of_parts_in_item=2, ordinal_part_number=1, primary_item_identifier=primary_item_identifier, isil=None,
+  ).tag_memory())
+
+def test_decode_many():
+  corrupted = bytearray(iso28560_3_tag_memory('1620168262'))
+  corrupted[1] ^= 0xFF
+  decoded = iso28560.decode_many([
+    (0x06, 0x07, iso28560_2_tag_memory('1620168259', isil='FI-Jyva', set_information='0201')),
+    (0x3E, 0xC2, iso28560_3_tag_memory('1620168260')),
+    (0x06, 0x07, iso28560_2_tag_memory('1620168261')),
+    (0x3E, 0x07, bytes(corrupted)),
+    (0x06, 0x07, iso28560_2_tag_memory('1620168263')[0:4]),
+    (0x99, 0x07, b'\x00' * 32),
+  ])
+
+  assert decoded[0] == ('1620168259', 'FI-Jyva', {'numbers_of_parts_in_item': 2, 'ordinal_part_number': 1}, None, None)
+  assert decoded[1] == ('1620168260', '-', {'numbers_of_parts_in_item': 2, 'ordinal_part_number': 1}, True, None)
+  assert decoded[2] == ('1620168261', None, None, None, None)
+  assert decoded[3].crc_valid == False and decoded[3].primary_item_identifier == '1620168262'
+  assert type(decoded[4].error) == iso15692.EndOfTagMemory
+  assert decoded[5].primary_item_identifier == None and 'is not known' in str(decoded[5].error)
+
+def test_decode_many_equals_data_objects():
+  tag_memory = bytes(
+    b'\x91\x01\x04\x60\x91\xce\x43\x80\x02\x01\xa8\x05\x01\x10\x67\x02'
+    b'\x42\x41\x03\x07\x32\x40\xde\x05\xab\x07\x5b\x00\x00\x00\x00\x00'
+  )
+  tags = [(0x06, 0x07, tag_memory), (0x3E, 0x07, iso28560_3_tag_memory('1620168260'))]
+  for (dsfid, afi, tag_memory), decoded in zip(tags, iso28560.decode_many(tags)):
+    dob = iso28560.new_data_object(afi=afi, dsfid=dsfid, block_size=4, memory_capacity_blocks=28, tag_memory=tag_memory)
+    assert decoded.primary_item_identifier == dob.get_primary_item_identifier()
+
+def test_decode_many_overloads():
+  tag_memory = iso28560_3_tag_memory('1620168260')
+  overloads = [{'!class': 'ISO28560_3_Object', 'dsfid': 0}, {'!class': 'ISO28560_3_Object', 'afi': 0x07, 'dsfid': 0x06}]
+  decoded = iso28560.decode_many([(0x00, 0x07, tag_memory), (0x06, 0x07, tag_memory), (0x06, 0xC2, iso28560_2_tag_memory('1620168259'))], overloads)
+  assert [d.primary_item_identifier for d in decoded] == ['1620168260', '1620168260', '1620168259']
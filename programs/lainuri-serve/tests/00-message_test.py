@@ -25,3 +25,10 @@ def test_lower_byte_first_out_to_int():
   assert helpers.word_to_int(b'\xFF\x00') == 255
   assert helpers.dword_to_int(b'\x01\x02\x03\x04') == 67305985
   assert helpers.lower_byte_fo_to_int(b'\x01\x02\x03') == 197121
+
+def test_ebv():
+  for intgr, ebv in [(0, b'\x00'), (0x7F, b'\x7F'), (0x80, b'\x81\x00'), (0x3FFF, b'\xFF\x7F'), (0x4000, b'\x81\x80\x00')]:
+    assert helpers.int_to_ebv(intgr) == ebv
+    i = [0]
+    assert helpers.shift_ebv(ebv + b'\x55', i) == intgr
+    assert i[0] == len(ebv)
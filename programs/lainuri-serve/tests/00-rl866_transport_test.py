@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+
+import context
+
+import lainuri.exception.rfid as exception_rfid
+import lainuri.RL866.transport as transport
+
+import os
+import pty
+import serial
+import threading
+import time
+
+inventory_response = b'\xfa\x33\x01\x00\x31\x00\x00\x00\x03\x00\x03\x0e\x01\x01\x09\xa7\x27\x38\x3f\x00\x01\x04\xe0\x00\x0e\x01\x01\x09\x24\x26\x38\x3f\x00\x01\x04\xe0\x00\x0e\x01\x01\x09\xa4\x25\x38\x3f\x00\x01\x04\xe0\x00\x97\xff'
+resync_response = b'\xFA\x05\x01\xE0\x58\xFE'
+
+class FakeReader():
+  """
+  Plays the RL866 end of a pseudo-terminal. Writes the given chunks with the given delays in between.
+  """
+  def __init__(self):
+    self.master, self.slave = pty.openpty()
+    self.serial = serial.Serial()
+    self.serial.baudrate = 38400
+    self.serial.parity = serial.PARITY_EVEN
+    self.serial.port = os.ttyname(self.slave)
+    self.serial.timeout = 1
+    self.serial.open()
+
+  def respond(self, *chunks_and_delays):
+    def worker():
+      for chunk, delay in chunks_and_delays:
+        time.sleep(delay)
+        os.write(self.master, chunk)
+        self.written_at = time.monotonic()
+    self.written_at = None
+    self.thread = threading.Thread(target=worker)
+    self.thread.start()
+
+  def close(self):
+    self.serial.close()
+    os.close(self.slave)
+    os.close(self.master)
+
+def test_read_frame_wakes_up_on_data(subtests):
+  fake = FakeReader()
+  try:
+    with subtests.test("Given a reader which responds after 50ms"):
+      fake.respond((resync_response, 0.05))
+
+    with subtests.test("When a frame is read"):
+      frame = transport.read_frame(fake.serial, timeout=1)
+      received_at = time.monotonic()
+
+    with subtests.test("Then the complete frame is received"):
+      assert frame == resync_response
+
+    with subtests.test("And it is received without polling delays"):
+      fake.thread.join()
+      assert received_at - fake.written_at < 0.02
+  finally:
+    fake.close()
+
+def test_read_frame_in_chunks(subtests):
+  fake = FakeReader()
+  try:
+    with subtests.test("Given a reader which sends the frame in chunks"):
+      fake.respond(
+        (inventory_response[0:1], 0.01),
+        (inventory_response[1:10], 0.02),
+        (inventory_response[10:], 0.02),
+      )
+
+    with subtests.test("Then the whole frame is received as indicated by LEN"):
+      started_at = time.monotonic()
+      assert transport.read_frame(fake.serial, timeout=1) == inventory_response
+      assert time.monotonic() - started_at < 0.1
+  finally:
+    fake.close()
+
+def test_read_frame_consecutive_frames_are_not_mixed(subtests):
+  fake = FakeReader()
+  try:
+    with subtests.test("Given a reader which sends two frames back to back"):
+      fake.respond((resync_response + inventory_response, 0))
+
+    with subtests.test("Then frames are read one at a time"):
+      assert transport.read_frame(fake.serial, timeout=1) == resync_response
+      assert transport.read_frame(fake.serial, timeout=1) == inventory_response
+  finally:
+    fake.close()
+
+def test_read_frame_skips_garbage_before_sof():
+  fake = FakeReader()
+  try:
+    fake.respond((b'\x00\x13\x37' + resync_response, 0))
+    assert transport.read_frame(fake.serial, timeout=1) == resync_response
+  finally:
+    fake.close()
+
+def test_read_frame_crc_mismatch():
+  fake = FakeReader()
+  try:
+    fake.respond((resync_response[0:-1] + b'\x00', 0))
+    context.assert_raises('CRC mismatch', exception_rfid.RFIDCommand, '', lambda: transport.read_frame(fake.serial, timeout=1))
+  finally:
+    fake.close()
+
+def test_read_frame_timeout(subtests):
+  fake = FakeReader()
+  try:
+    with subtests.test("Given a reader which sends only a partial frame"):
+      fake.respond((resync_response[0:3], 0))
+
+    with subtests.test("Then the read times out in the given time"):
+      started_at = time.monotonic()
+      context.assert_raises('Partial frame', exception_rfid.RFIDTimeout, 'received', lambda: transport.read_frame(fake.serial, timeout=0.2))
+      assert time.monotonic() - started_at < 0.5
+  finally:
+    fake.close()
@@ -2,7 +2,8 @@
 
 import context
 
-from lainuri.RL866.iblock import IBlock_ReadSystemConfigurationBlock, IBlock_ReadSystemConfigurationBlock_Response, IBlock_TagInventory, IBlock_TagInventory_Response, IBlock_TagConnect, IBlock_TagConnect_Response, IBlock_TagDisconnect, IBlock_TagDisconnect_Response, IBlock_TagMemoryAccess, IBlock_TagMemoryAccess_Response
+from lainuri.RL866.iblock import IAirProtocolInventoryParameter, IBlock_ReadSystemConfigurationBlock, IBlock_ReadSystemConfigurationBlock_Response, IBlock_TagInventory, IBlock_TagInventory_Response, IBlock_TagConnect, IBlock_TagConnect_Response, IBlock_TagDisconnect, IBlock_TagDisconnect_Response, IBlock_TagMemoryAccess, IBlock_TagMemoryAccess_Response
+import lainuri.RL866.CRC16
 import lainuri.RL866.state as state
 from lainuri.RL866.tag_memory_access_command import TagMemoryAccessCommand
 
@@ -22,6 +23,7 @@ def test_IBlock_ReadSystemConfigurationBlock():
   res = IBlock_ReadSystemConfigurationBlock_Response(msg_response)
   assert res.pack() == msg_response
 
+  state.transmission_sequence_number = 1
   req = IBlock_ReadSystemConfigurationBlock(read_ROM=1, read_blocks=15)
   assert req.sof() == b'\xFA'
   assert req.len() == b'\x08'
@@ -53,6 +55,11 @@ def test_IBlock_TagInventory():
   global tag
   tag = res.tags[0]
 
+def test_IBlock_TagInventory__query_multiple_antenna():
+  assert IBlock_TagInventory(query_multiple_antenna=[1]).inf() == b'\x31\x01\x01\x01'
+  assert IBlock_TagInventory(query_multiple_antenna=[1, 3]).inf() == b'\x31\x01\x03\x05'
+  assert IBlock_TagInventory(query_multiple_antenna=[2, 9]).inf() == b'\x31\x01\x09\x02\x01'
+
 def test_IBlock_TagConnect():
   state.transmission_sequence_number = 1
   req = IBlock_TagConnect(tag)
@@ -115,3 +122,72 @@ def test_IBlock_TagDisconnect():
   assert res.pack() == msg_response
 
   state.transmission_sequence_number = 0 # Prevent leaking bad test context status to next tests
+
+def response_frame(inf: bytes) -> bytes:
+  len_rid_pcb_inf = bytes([len(inf) + 5]) + b'\x01\x00' + inf
+  return b'\xfa' + len_rid_pcb_inf + lainuri.RL866.CRC16.crc16(len_rid_pcb_inf)
+
+def test_IBlock_TagInventory__embedded_commands(subtests):
+  embedded_commands = None
+
+  with subtests.test("Given an inventory with embedded commands"):
+    state.transmission_sequence_number = 0
+    embedded_commands = [
+      TagMemoryAccessCommand().ISO15693_GetTagSystemInformation(),
+      TagMemoryAccessCommand().ISO15693_ReadMultipleBlocks(read_security_status=0, start_block_address=0, number_of_blocks_to_read=3),
+    ]
+    req = IBlock_TagInventory(air_protocol_inventory_parameters=[IAirProtocolInventoryParameter(embedded_commands=embedded_commands)])
+
+  with subtests.test("Then the air protocol inventory parameter is packed"):
+    assert req.inf() == b'\x31\x02' + \
+      b'\x01' + b'\x01\x00' + b'\x0d' + \
+      b'\x80\x02' + b'\x02\x0a\x00' + b'\x07\x03\x00\x00\x00\x00\x03\x00'
+
+  with subtests.test("When the tag report contains the embedded command results"):
+    system_information = b'\x0a\x00\x01' + b'\x0f\xa7\x27\x38\x3f\x00\x01\x04\xe0\x06\x07\x1b\x03\x01'
+    read_multiple_blocks = b'\x03\x00\x01' + b'\x03\x00' + b'\x91\x01\x04\x60\x91\xce\x43\x80\x02'
+    embedded = bytes([len(system_information)]) + system_information + bytes([len(read_multiple_blocks)]) + read_multiple_blocks
+    tag_report = b'\x8f\x01\x01\x01\x09\xa7\x27\x38\x3f\x00\x01\x04\xe0\x00' + bytes([len(embedded)]) + embedded
+    msg_response = response_frame(b'\x31\x00\x00' + b'\x00\x01\x00\x01' + tag_report)
+    res = IBlock_TagInventory_Response(msg_response, embedded_commands)
+    assert res.pack() == msg_response
+
+  with subtests.test("Then the tag arrives fleshed"):
+    tag = res.tags[0]
+    assert tag.serial_number() == 'e00401003f3827a7'
+    assert tag.dsfid() == 0x06
+    assert tag.afi() == 0x07
+    assert tag.memory_capacity_blocks() == 27
+    assert tag.block_size() == 3
+    assert tag.tag_memory() == b'\x91\x01\x04\x60\x91\xce\x43\x80\x02'
+    assert tag.decode_primary_item_identifier() == '1620168259'
+
+  with subtests.test("When the embedded command reading the tag memory fails for one of the tags"):
+    read_multiple_blocks_failed = b'\x03\x00\x00' + b'\x1c\x04' # ERR_RFID_TAG_INVALID_BLK_ADDR, eg. the tag has less blocks
+    embedded_failed = bytes([len(system_information)]) + system_information + bytes([len(read_multiple_blocks_failed)]) + read_multiple_blocks_failed
+    tag_report_failed = b'\x8f\x01\x01\x01\x09\xa8\x27\x38\x3f\x00\x01\x04\xe0\x00' + bytes([len(embedded_failed)]) + embedded_failed
+    msg_response = response_frame(b'\x31\x00\x00' + b'\x00\x02\x00\x02' + tag_report_failed + tag_report)
+    res = IBlock_TagInventory_Response(msg_response, embedded_commands)
+
+  with subtests.test("Then both tags are inventoried"):
+    assert [tag.serial_number() for tag in res.tags] == ['e00401003f3827a8', 'e00401003f3827a7']
+
+  with subtests.test("And the failure is recorded on the failed tag, which is left to be fleshed by connecting to it"):
+    tag_failed = res.tags[0]
+    assert tag_failed.embedded_command_results[1].exception.id == 'ERR_RFID_TAG_INVALID_BLK_ADDR'
+    assert tag_failed._tag_memory is None
+    assert tag_failed.block_size() == 3
+
+  with subtests.test("And the other tag arrives fleshed"):
+    assert res.tags[1].embedded_command_results[1].exception is None
+    assert res.tags[1].decode_primary_item_identifier() == '1620168259'
+
+  with subtests.test("When the tag report contains tag memory data"):
+    tag_report = b'\x1f\x01\x01\x01\x09\xa7\x27\x38\x3f\x00\x01\x04\xe0\x00' + b'\x48\x00' + b'\x91\x01\x04\x60\x91\xce\x43\x80\x02'
+    res = IBlock_TagInventory_Response(response_frame(b'\x31\x00\x00' + b'\x00\x01\x00\x01' + tag_report))
+
+  with subtests.test("Then the tag memory is received"):
+    assert res.tags[0].number_of_tag_memory_bits == 72
+    assert res.tags[0].tag_memory() == b'\x91\x01\x04\x60\x91\xce\x43\x80\x02'
+
+  state.transmission_sequence_number = 0 # Prevent leaking bad test context status to next tests
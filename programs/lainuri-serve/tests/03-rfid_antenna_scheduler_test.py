@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+
+import context
+
+from lainuri.RL866.antenna_scheduler import AntennaScheduler
+from lainuri.RL866.tag import Tag
+
+import time
+
+def tag_at(antenna_id, serial_number):
+  tag = Tag(serial_number)
+  tag.antenna_id(antenna_id)
+  return tag
+
+def test_antenna_scheduler_default_antenna():
+  assert AntennaScheduler(antennas=[]).next_antennas() == []
+
+def test_antenna_scheduler_round_robin():
+  scheduler = AntennaScheduler(antennas=[3, 1, 2], scheduling='round-robin')
+  assert [scheduler.next_antennas() for i in range(0,4)] == [[1], [2], [3], [1]]
+
+def test_antenna_scheduler_activity(subtests):
+  scheduler = None
+
+  with subtests.test("Given an activity weighted scheduler"):
+    scheduler = AntennaScheduler(antennas=[1, 2, 3], scheduling='activity', activity_window=60)
+
+  with subtests.test("When no antenna has activity, the antennas take turns"):
+    assert scheduler.next_antennas() == [1]
+    assert scheduler.next_antennas() == [2]
+
+  with subtests.test("When a tag appears at an antenna"):
+    tag = tag_at(2, 'e004010000000001')
+    scheduler.record([2], [tag], [tag])
+
+  with subtests.test("Then the active antenna is inventoried every round, and the idle antennas still take turns"):
+    assert scheduler.next_antennas() == [2, 3]
+    assert scheduler.next_antennas() == [1, 2]
+
+  with subtests.test("When the activity window has passed, the antenna is idle again"):
+    scheduler.statistics[2].last_activity = time.time() - 61
+    assert len(scheduler.next_antennas()) == 1
+
+def test_antenna_scheduler_statistics():
+  scheduler = AntennaScheduler(antennas=[1, 2])
+  scheduler.record([1, 2], [tag_at(1, 'a'), tag_at(1, 'b'), tag_at(2, 'b')])
+  scheduler.record([1], [tag_at(1, 'a')])
+
+  statistics = scheduler.to_ui()
+  assert statistics['1']['inventories'] == 2
+  assert statistics['1']['tags'] == 1
+  assert statistics['1']['tags_seen_total'] == 3
+  assert statistics['2']['inventories'] == 1
+  assert statistics['2']['tags'] == 1
+  assert statistics['2']['last_seen']
+  assert not statistics['2']['last_activity']
@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+
+import context
+
+import lainuri.db
+from lainuri.rfid_reader import RFID_Reader
+import lainuri.RL866.capture as rfid_capture
+import lainuri.RL866.simulator as simulator
+import lainuri.RL866.tag_cache as tag_cache
+
+import os
+import unittest.mock
+
+def test_db_init():
+  lainuri.db.init()
+  lainuri.db.upgrade_database_schema()
+  tag_cache.clear()
+
+def test_capture_and_replay(subtests, tmp_path):
+  path = str(tmp_path / 'RL866.rl866cap')
+  records = None
+
+  with subtests.test("Given a RFID reader capturing its frames"):
+    sim = simulator.Simulator(tags=[
+      simulator.iso28560_2_tag(0xe004010000000031, '1620000031'),
+      simulator.iso28560_3_tag(0xe004010000000032, '1620000032'),
+    ]).start()
+    reader = RFID_Reader(name='simulator', port=sim.port)
+    reader.capture = rfid_capture.Capture(path)
+
+  with subtests.test("When the tags are inventoried and fleshed"):
+    try:
+      tags = reader.query_inventory()
+      for tag in tags:
+        tag_cache.invalidate(tag.serial_number())
+        reader.flesh_tag_details(tag)
+      reader.tag_sessions.close(tags)
+    finally:
+      reader.close()
+      sim.stop()
+
+  with subtests.test("Then every frame written and read is captured in order"):
+    started, records = rfid_capture.read_capture(path)
+    assert [direction for direction, timestamp, frame in records] == [b'>', b'<'] * 9
+    assert [timestamp for direction, timestamp, frame in records] == sorted(timestamp for direction, timestamp, frame in records)
+
+  with subtests.test("And the captured responses replay through the message parsers"):
+    stats = rfid_capture.replay(records, rounds=2)
+    assert stats['responses'] == 18
+    assert stats['errors'] == {}
+    assert {name: rt['count'] for name, rt in stats['round_trips'].items()} == {'inventory': 1, 'connect': 2, 'memory_access': 4, 'disconnect': 2}
+
+  with subtests.test("And a capture cut short is read up to the last complete record"):
+    with open(path, 'rb') as f: data = f.read()
+    with open(path, 'wb') as f: f.write(data[:-3])
+    started, cut_records = rfid_capture.read_capture(path)
+    assert cut_records == records[:-1]
+
+def test_capture_flushes_on_a_timer(subtests, tmp_path):
+  path = str(tmp_path / 'RL866.rl866cap')
+  capture = None
+
+  with subtests.test("Given a capture"):
+    capture = rfid_capture.Capture(path)
+    header_size = os.path.getsize(path)
+
+  with subtests.test("When a frame is recorded"):
+    with unittest.mock.patch.object(rfid_capture, 'FLUSH_INTERVAL', 0.05):
+      capture.record(rfid_capture.DIRECTION_WRITE, b'\xfa\x05\x00\xc0\x00\x00')
+      flush_timer = capture.flush_timer
+
+  with subtests.test("Then it is buffered instead of written right away"):
+    assert os.path.getsize(path) == header_size
+
+  with subtests.test("And it is flushed after the flush interval"):
+    flush_timer.join(1)
+    assert capture.flush_timer is None
+    assert os.path.getsize(path) > header_size
+    assert len(rfid_capture.read_capture(path)[1]) == 1
+
+  with subtests.test("And closing flushes the rest"):
+    capture.record(rfid_capture.DIRECTION_READ, b'\xfa\x05\x01\xe0\x00\x00')
+    capture.close()
+    assert len(rfid_capture.read_capture(path)[1]) == 2
+    capture.record(rfid_capture.DIRECTION_READ, b'\xfa\x05\x01\xe0\x00\x00')
+    assert len(rfid_capture.read_capture(path)[1]) == 2
@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+
+import context
+
+import lainuri.metrics as metrics
+import lainuri.RL866.command_scheduler as command_scheduler
+from lainuri.RL866.command_scheduler import CommandScheduler, PRIORITY_SECURITY, PRIORITY_USER, PRIORITY_BACKGROUND
+
+import threading
+import time
+import unittest.mock
+
+def queue_waiter(scheduler: CommandScheduler, turns: list, priority_class: int, deadline: float = None) -> threading.Thread:
+  def wait_for_turn():
+    with command_scheduler.priority(priority_class, deadline=deadline), scheduler.turn():
+      turns.append(priority_class)
+  waiter = threading.Thread(target=wait_for_turn)
+  waiter.start()
+  return waiter
+
+def wait_until_waiting(scheduler: CommandScheduler, count: int):
+  started = time.monotonic()
+  while len(scheduler.waiting) < count:
+    assert time.monotonic() - started < 5, f"'{count}' waiters never queued up"
+    time.sleep(0.001)
+
+def test_priority_classes(subtests):
+  metrics.clear()
+  scheduler = CommandScheduler('test')
+  turns = []
+
+  with subtests.test("Given an exchange on the wire"):
+    scheduler.acquire(PRIORITY_BACKGROUND)
+
+  with subtests.test("And background, user and security exchanges queued up behind it, in that order"):
+    waiters = []
+    for i, priority_class in enumerate([PRIORITY_BACKGROUND, PRIORITY_BACKGROUND, PRIORITY_USER, PRIORITY_SECURITY]):
+      waiters.append(queue_waiter(scheduler, turns, priority_class))
+      wait_until_waiting(scheduler, i+1)
+
+  with subtests.test("When the exchange on the wire completes"):
+    scheduler.release()
+    for waiter in waiters: waiter.join(5)
+
+  with subtests.test("Then the security exchange goes first, then the user exchange, then the background exchanges"):
+    assert turns == [PRIORITY_SECURITY, PRIORITY_USER, PRIORITY_BACKGROUND, PRIORITY_BACKGROUND]
+    assert scheduler.to_ui()['exchanges'] == {'security': 1, 'user': 1, 'background': 3}
+    assert scheduler.to_ui()['waiting'] == 0
+
+  with subtests.test("And the queue wait of each priority class is recorded"):
+    snapshot = metrics.snapshot()
+    assert snapshot['rfid.queue_wait.security']['count'] == 1
+    assert snapshot['rfid.queue_wait.background']['count'] == 3
+    assert snapshot['rfid.queue_wait.background']['max'] >= snapshot['rfid.queue_wait.security']['max']
+
+def test_deadline(subtests):
+  metrics.clear()
+  scheduler = CommandScheduler('test')
+  turns = []
+
+  with subtests.test("Given a security exchange with a short deadline queued behind a slow exchange"):
+    scheduler.acquire(PRIORITY_BACKGROUND)
+    waiter = queue_waiter(scheduler, turns, PRIORITY_SECURITY, deadline=0.01)
+    wait_until_waiting(scheduler, 1)
+    time.sleep(0.02)
+
+  with subtests.test("When the security exchange gets its turn past its deadline"):
+    scheduler.release()
+    waiter.join(5)
+
+  with subtests.test("Then the missed deadline is recorded"):
+    assert turns == [PRIORITY_SECURITY]
+    assert scheduler.to_ui()['deadlines_missed'] == 1
+    assert metrics.snapshot()['rfid.deadline_missed']['count'] == 1
+
+def test_nested_priorities():
+  assert command_scheduler.current_priority() == (PRIORITY_BACKGROUND, None)
+  with command_scheduler.priority(PRIORITY_SECURITY, deadline=0.5):
+    with command_scheduler.priority(PRIORITY_USER, deadline=2):
+      assert command_scheduler.current_priority() == (PRIORITY_SECURITY, 0.5)
+    with command_scheduler.priority(PRIORITY_USER, deadline=0.1):
+      assert command_scheduler.current_priority() == (PRIORITY_SECURITY, 0.1)
+    assert command_scheduler.current_priority() == (PRIORITY_SECURITY, 0.5)
+  assert command_scheduler.current_priority() == (PRIORITY_BACKGROUND, None)
+
+def test_turn_held_for_many_exchanges(subtests):
+  scheduler = CommandScheduler('test')
+  turns = []
+
+  with subtests.test("Given a multi-frame operation holding the turn, eg. an inventory drain"):
+    drain = scheduler.turn(PRIORITY_BACKGROUND)
+    drain.__enter__()
+
+  with subtests.test("And a security exchange queued behind it"):
+    waiter = queue_waiter(scheduler, turns, PRIORITY_SECURITY)
+    wait_until_waiting(scheduler, 1)
+
+  with subtests.test("When the operation sends its frames"):
+    for i in range(0, 3):
+      with scheduler.turn(PRIORITY_BACKGROUND): turns.append(PRIORITY_BACKGROUND)
+
+  with subtests.test("Then the frames don't queue behind the security exchange, nor let it in between"):
+    assert turns == [PRIORITY_BACKGROUND] * 3
+    assert scheduler.to_ui()['waiting'] == 1
+
+  with subtests.test("When the operation completes, the security exchange gets its turn"):
+    drain.__exit__(None, None, None)
+    waiter.join(5)
+    assert turns == [PRIORITY_BACKGROUND] * 3 + [PRIORITY_SECURITY]
+
+def test_preempted(subtests):
+  scheduler = CommandScheduler('test')
+  turns = []
+
+  with subtests.test("Given a background operation holding the turn"):
+    scheduler.acquire(PRIORITY_BACKGROUND)
+
+  with subtests.test("When another background exchange is waiting, the operation is not preempted"):
+    waiters = [queue_waiter(scheduler, turns, PRIORITY_BACKGROUND)]
+    wait_until_waiting(scheduler, 1)
+    assert not scheduler.preempted()
+
+  with subtests.test("When a security exchange is waiting, the operation is preempted"):
+    waiters.append(queue_waiter(scheduler, turns, PRIORITY_SECURITY))
+    wait_until_waiting(scheduler, 2)
+    assert scheduler.preempted()
+
+  scheduler.release()
+  for waiter in waiters: waiter.join(5)
+  assert turns == [PRIORITY_SECURITY, PRIORITY_BACKGROUND]
+
+def test_interrupted_wait(subtests):
+  scheduler = CommandScheduler('test')
+  holding = threading.Event()
+  may_release = threading.Event()
+
+  def hold_turn():
+    with scheduler.turn(PRIORITY_BACKGROUND):
+      holding.set()
+      may_release.wait(5)
+
+  with subtests.test("Given an exchange on the wire"):
+    holder = threading.Thread(target=hold_turn)
+    holder.start()
+    holding.wait(5)
+
+  with subtests.test("When an exchange waiting for its turn is interrupted"):
+    with unittest.mock.patch.object(scheduler.condition, 'wait', side_effect=RuntimeError('interrupted')):
+      context.assert_raises('interrupted', RuntimeError, 'interrupted', lambda: scheduler.acquire(PRIORITY_SECURITY))
+
+  with subtests.test("Then it is no longer waiting, and doesn't block the exchanges after it"):
+    assert scheduler.waiting == []
+    may_release.set()
+    holder.join(5)
+    turns = []
+    queue_waiter(scheduler, turns, PRIORITY_USER).join(5)
+    assert turns == [PRIORITY_USER]
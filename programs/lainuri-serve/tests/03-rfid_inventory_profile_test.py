@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+
+import context
+
+import lainuri.config
+from lainuri.constants import Status
+import lainuri.db
+import lainuri.rfid_reader
+from lainuri.rfid_reader import RFID_Reader
+from lainuri.RL866.inventory import Inventory
+import lainuri.RL866.simulator as simulator
+import lainuri.RL866.tag_cache as tag_cache
+
+def test_db_init():
+  lainuri.db.init()
+  lainuri.db.upgrade_database_schema()
+  tag_cache.clear()
+
+def test_library_inventory_profile(subtests):
+  with simulator.Simulator(tags=[
+    simulator.iso28560_2_tag(0xe004010000000051, '1620000051', afi=0x07),
+    simulator.iso28560_2_tag(0xe004010000000052, '1620000052', afi=0xC2),
+    simulator.SimulatedTag(0xe004010000000053, afi=0x00), # eg. a transit card
+  ]) as sim:
+    reader = RFID_Reader(name='simulator', port=sim.port)
+
+    with subtests.test("When the tags are inventoried with the library profile"):
+      tags = reader.query_inventory(afis=lainuri.rfid_reader.get_inventory_profile_afis('library'))
+
+    with subtests.test("Then only the library's tags are found, with an inventory per AFI"):
+      assert sorted(tag.serial_number() for tag in tags) == ['e004010000000051', 'e004010000000052']
+      assert sim.commands['inventory'] == 2
+
+    with subtests.test("And the AFI of the tags is known without reading the tag system information"):
+      assert {tag.serial_number(): tag.afi() for tag in tags} == {'e004010000000051': 0x07, 'e004010000000052': 0xC2}
+
+    with subtests.test("When the tags still secured are inventoried"):
+      tags = reader.query_inventory(afis=lainuri.rfid_reader.get_inventory_profile_afis('secured'))
+
+    with subtests.test("Then only the tags with the checkin AFI are found"):
+      assert [tag.serial_number() for tag in tags] == ['e004010000000051']
+
+def test_gate_alarms_verified_with_one_inventory(subtests):
+  sim = simulator.Simulator(tags=[simulator.iso28560_2_tag(0xe004010000000060 + i, str(1620000060 + i), afi=0x07) for i in range(0, 4)]).start()
+  reader = RFID_Reader(name='simulator', port=sim.port)
+  reader.inventory = Inventory(appear_hysteresis=1, disappear_hysteresis=1)
+  lainuri.rfid_reader.rfid_readers.append(reader)
+  item_barcodes = [str(1620000060 + i) for i in range(0, 4)]
+  try:
+    with subtests.test("Given a stack of items on the reader"):
+      reader.do_inventory(no_events=True)
+      commands = dict(sim.commands)
+
+    with subtests.test("When the stack is checked out"):
+      results = lainuri.rfid_reader.set_tag_gate_alarms(item_barcodes, False)
+
+    with subtests.test("Then the AFI writes of the whole stack are verified with one inventory"):
+      assert [result['status'] for result in results.values()] == [Status.SUCCESS] * 4
+      assert sim.commands['inventory'] - commands['inventory'] == 1
+      assert sim.commands['memory_access'] - commands['memory_access'] == 4
+
+    with subtests.test("When a tag of the stack is still secured, and another one is missed by the inventory"):
+      sim.tags[2].afi = 0x07
+      sim.tags[3].antenna_id = 2
+      reader.antenna_scheduler.antennas = [1]
+      tags = [reader.inventory.find_by_primary_item_identifier(item_barcode) for item_barcode in item_barcodes]
+      for tag in tags: reader.tag_sessions.open(tag)
+      commands = dict(sim.commands)
+      tags_failed = lainuri.rfid_reader._tags_verify_afi(reader, tags, False)
+      for tag in tags: reader.tag_sessions.release(tag)
+
+    with subtests.test("Then the verification fails the still secured tag"):
+      assert [tag.iso25680_get_primary_item_identifier() for tag in tags_failed] == ['1620000062']
+
+    with subtests.test("And the tags not found by the inventory are verified by reading their AFI"):
+      assert sim.commands['inventory'] - commands['inventory'] == 1
+      assert sim.commands['memory_access'] - commands['memory_access'] == 2
+  finally:
+    lainuri.rfid_reader.rfid_readers.remove(reader)
+    reader.tag_sessions.close(reader.tags_present)
+    sim.stop()
+
+def test_inventory_profile_without_afis(subtests):
+  with subtests.test("Given the checkout AFI is not configured"):
+    afi_checkout = lainuri.config.get_config('devices.rfid-reader.afi-checkout')
+    lainuri.config.write_config('devices.rfid-reader.afi-checkout', 0)
+
+  try:
+    with subtests.test("Then the profiles needing it are rejected, as the AFI 0 inventories all the tags"):
+      context.assert_raises('library profile', ValueError, 'afi-checkout', lambda: lainuri.rfid_reader.get_inventory_profile_afis('library'))
+      context.assert_raises('unsecured profile', ValueError, 'afi-checkout', lambda: lainuri.rfid_reader.get_inventory_profile_afis('unsecured'))
+
+    with subtests.test("And the other profiles still work"):
+      assert lainuri.rfid_reader.get_inventory_profile_afis('secured') == [0x07]
+      assert lainuri.rfid_reader.get_inventory_profile_afis('all') is None
+  finally:
+    lainuri.config.write_config('devices.rfid-reader.afi-checkout', afi_checkout)
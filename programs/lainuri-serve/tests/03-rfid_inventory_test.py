@@ -0,0 +1,274 @@
+#!/usr/bin/python3
+
+import context
+
+import lainuri.helpers as helpers
+from lainuri.rfid_reader import RFID_Reader
+import lainuri.RL866.CRC16
+import lainuri.RL866.command_scheduler as command_scheduler
+from lainuri.RL866.command_scheduler import CommandScheduler
+from lainuri.RL866.inventory import Inventory
+from lainuri.RL866.tag import Tag
+
+import threading
+import time
+
+def tags(*serial_numbers):
+  return [Tag(sn) for sn in serial_numbers]
+
+def tags_at(antenna_id, *serial_numbers):
+  tags = [Tag(sn) for sn in serial_numbers]
+  for tag in tags: tag.antenna_id(antenna_id)
+  return tags
+
+def serials(tags):
+  return sorted([tag.serial_number() for tag in tags])
+
+def test_inventory_presence_debouncing(subtests):
+  inventory = None
+  fleshed = []
+
+  with subtests.test("Given an inventory which announces tags immediately and loses them after two missed inventories"):
+    inventory = Inventory(appear_hysteresis=1, disappear_hysteresis=2)
+
+  with subtests.test("When tags enter the field, they are fleshed and announced as new"):
+    tags_new, tags_lost = inventory.update(tags('a', 'b', 'c'), flesh=lambda tag: fleshed.append(tag.serial_number()))
+    assert serials(tags_new) == ['a', 'b', 'c']
+    assert tags_lost == []
+    assert fleshed == ['a', 'b', 'c']
+
+  with subtests.test("When a tag flickers out of the field for one inventory, it is not lost"):
+    tags_new, tags_lost = inventory.update(tags('a', 'c'), flesh=lambda tag: fleshed.append(tag.serial_number()))
+    assert tags_new == []
+    assert tags_lost == []
+    assert serials(inventory.tags_present()) == ['a', 'b', 'c']
+
+  with subtests.test("And when it reappears, it is not fleshed or announced again"):
+    tags_new, tags_lost = inventory.update(tags('a', 'b', 'c'), flesh=lambda tag: fleshed.append(tag.serial_number()))
+    assert tags_new == []
+    assert tags_lost == []
+    assert fleshed == ['a', 'b', 'c']
+
+  with subtests.test("When a tag is missing from consecutive inventories, it is lost"):
+    inventory.update(tags('a', 'c'))
+    tags_new, tags_lost = inventory.update(tags('a', 'c'))
+    assert tags_new == []
+    assert serials(tags_lost) == ['b']
+    assert serials(inventory.tags_present()) == ['a', 'c']
+
+def test_inventory_appear_hysteresis(subtests):
+  inventory = Inventory(appear_hysteresis=2, disappear_hysteresis=1)
+
+  with subtests.test("When a tag is seen only once, it is not announced"):
+    assert inventory.update(tags('a')) == ([], [])
+    assert inventory.tags_present() == []
+
+  with subtests.test("And when the tag is missed, it is forgotten without being lost"):
+    assert inventory.update(tags()) == ([], [])
+
+  with subtests.test("When a tag is seen in consecutive inventories, it is announced"):
+    inventory.update(tags('a'))
+    tags_new, tags_lost = inventory.update(tags('a'))
+    assert serials(tags_new) == ['a']
+
+def test_inventory_flesh_failure_is_retried(subtests):
+  inventory = Inventory(appear_hysteresis=1, disappear_hysteresis=1)
+
+  def flesh_fails(tag):
+    raise Exception('flesh failed')
+
+  with subtests.test("When fleshing a new tag fails, the inventory is left untouched"):
+    inventory.update(tags('a'))
+    context.assert_raises('flesh fails', Exception, 'flesh failed', lambda: inventory.update(tags('b'), flesh=flesh_fails))
+    assert serials(inventory.tags_present()) == ['a']
+
+  with subtests.test("Then the tag is fleshed and announced on the next inventory"):
+    tags_new, tags_lost = inventory.update(tags('b'))
+    assert serials(tags_new) == ['b']
+    assert serials(tags_lost) == ['a']
+
+def test_inventory_multiple_antennas(subtests):
+  inventory = Inventory(appear_hysteresis=1, disappear_hysteresis=1)
+
+  with subtests.test("Given tags are seen at two antennas, one of them at both"):
+    tags_new, tags_lost = inventory.update(tags_at(1, 'a', 'b') + tags_at(2, 'b', 'c'), antennas=[1, 2])
+    assert serials(tags_new) == ['a', 'b', 'c']
+    assert inventory.tags['b'].antennas == {1, 2}
+    assert sorted(inventory.tags['b'].last_seen.keys()) == [1, 2]
+
+  with subtests.test("When only antenna 1 is inventoried"):
+    tags_new, tags_lost = inventory.update(tags_at(1, 'a'), antennas=[1])
+
+  with subtests.test("Then the tags at antenna 1 are missed, but the tags only at antenna 2 are not"):
+    assert serials(tags_lost) == ['b']
+    assert serials(inventory.tags_present()) == ['a', 'c']
+
+  with subtests.test("When antenna 2 is inventoried and the tag is not there"):
+    tags_new, tags_lost = inventory.update([], antennas=[2])
+
+  with subtests.test("Then it is lost"):
+    assert serials(tags_lost) == ['c']
+    assert serials(inventory.tags_present()) == ['a']
+
+def inventory_response(stop_type: int, tags_buffered: int, serial_numbers: list, antenna_id: int = None) -> bytes:
+  inf = b'\x31\x00\x00' + bytes([stop_type]) + helpers.int_to_word(tags_buffered) + bytes([len(serial_numbers)])
+  for serial_number in serial_numbers:
+    if antenna_id: inf += b'\x0f' + bytes([antenna_id])
+    else:          inf += b'\x0e'
+    inf += b'\x01\x01\x09' + serial_number.to_bytes(8, byteorder='little') + b'\x00'
+  len_rid_pcb_inf = bytes([len(inf) + 5]) + b'\x01\x00' + inf
+  return b'\xfa' + len_rid_pcb_inf + lainuri.RL866.CRC16.crc16(len_rid_pcb_inf)
+
+class FakeInventoryReader():
+  def __init__(self, *responses):
+    self.responses = list(responses)
+    self.requests = []
+
+  def write(self, msg):
+    self.requests.append(msg)
+
+  def read(self, msg_class):
+    return self.responses.pop(0)
+
+def test_query_inventory_continues_until_drained(subtests):
+  fake = None
+  tags = None
+
+  with subtests.test("Given a reader whose tag buffer fills up"):
+    fake = FakeInventoryReader(
+      inventory_response(1, 5, [0xe004010000000001, 0xe004010000000002]),
+      inventory_response(1, 5, [0xe004010000000003, 0xe004010000000002]),
+      inventory_response(0, 5, [0xe004010000000004, 0xe004010000000005]),
+    )
+    rfid_reader = RFID_Reader.__new__(RFID_Reader) # Skip connecting to the serial port
+    rfid_reader.scheduler = CommandScheduler()
+    rfid_reader.inventory_lock = threading.Lock()
+    rfid_reader.write = fake.write
+    rfid_reader.read = fake.read
+
+  with subtests.test("When the tags are inventoried"):
+    tags = rfid_reader.query_inventory()
+
+  with subtests.test("Then the inventory is continued until all the buffered tags are received"):
+    assert [req.field1[0] & 1<<3 for req in fake.requests] == [0, 1<<3, 1<<3]
+    assert fake.responses == []
+
+  with subtests.test("And the tag reports are merged by serial number"):
+    assert sorted([tag.serial_number() for tag in tags]) == ['e00401000000000' + str(i) for i in range(1,6)]
+    assert rfid_reader.inventory_statistics['tags'] == 5
+    assert rfid_reader.inventory_statistics['transmissions'] == 3
+
+def test_query_inventory_single_transmission():
+  fake = FakeInventoryReader(inventory_response(0, 1, [0xe004010000000001]))
+  rfid_reader = RFID_Reader.__new__(RFID_Reader)
+  rfid_reader.scheduler = CommandScheduler()
+  rfid_reader.inventory_lock = threading.Lock()
+  rfid_reader.write = fake.write
+  rfid_reader.read = fake.read
+
+  assert len(rfid_reader.query_inventory()) == 1
+  assert len(fake.requests) == 1
+
+def test_query_inventory_antennas(subtests):
+  fake = FakeInventoryReader(inventory_response(0, 1, [0xe004010000000001], antenna_id=3))
+  rfid_reader = RFID_Reader.__new__(RFID_Reader)
+  rfid_reader.scheduler = CommandScheduler()
+  rfid_reader.inventory_lock = threading.Lock()
+  rfid_reader.write = fake.write
+  rfid_reader.read = fake.read
+
+  tags = rfid_reader.query_inventory([1, 3])
+  assert fake.requests[0].field2 == b'\x03\x05'
+  assert tags[0].antenna_id() == 3
+
+def test_inventory_indexes(subtests):
+  inventory = Inventory(appear_hysteresis=2, disappear_hysteresis=1)
+  def flesh(tag):
+    tag._primary_item_identifier = 'pii-' + tag.serial_number()
+
+  with subtests.test("Tags which are only appearing are not indexed"):
+    inventory.update(tags('a', 'b'), flesh=flesh)
+    assert not inventory.find_by_serial_number('a')
+    assert not inventory.find_by_primary_item_identifier('pii-a')
+
+  with subtests.test("Present tags are found by their serial number and primary item identifier"):
+    inventory.update(tags('a', 'b'), flesh=flesh)
+    assert inventory.find_by_serial_number('a').serial_number() == 'a'
+    assert inventory.find_by_primary_item_identifier('pii-b').serial_number() == 'b'
+
+  with subtests.test("Lost tags are dropped from the indexes"):
+    inventory.update(tags('a'), flesh=flesh)
+    assert not inventory.find_by_serial_number('b')
+    assert not inventory.find_by_primary_item_identifier('pii-b')
+    assert inventory.find_by_primary_item_identifier('pii-a')
+
+  with subtests.test("Tags without decodable tag memory are indexed only by their serial number"):
+    inventory.update(tags('a', 'c'))
+    inventory.update(tags('a', 'c'))
+    assert inventory.find_by_serial_number('c')
+    assert list(inventory.tags_by_primary_item_identifier.keys()) == ['pii-a']
+
+  with subtests.test("Flushing the inventory empties the indexes"):
+    inventory.clear()
+    assert not inventory.find_by_primary_item_identifier('pii-a')
+    assert inventory.tags_present() == []
+
+def test_inventory_decodes_outside_the_lock(subtests):
+  inventory = Inventory(appear_hysteresis=1, disappear_hysteresis=1)
+  locked_while_decoding = []
+
+  with subtests.test("Given a tag whose primary item identifier is decoded from its tag memory"):
+    class DecodedTag(Tag):
+      def iso25680_get_primary_item_identifier(self):
+        locked_while_decoding.append(inventory.lock.locked())
+        return 'pii-' + self.serial_number()
+    tag = DecodedTag('a')
+    tag._tag_memory = b'\x00'
+
+  with subtests.test("When the tag becomes present"):
+    inventory.update([tag])
+
+  with subtests.test("Then it is decoded without holding the lock, and indexed"):
+    assert locked_while_decoding == [False]
+    assert inventory.find_by_primary_item_identifier('pii-a') is tag
+
+  with subtests.test("And losing it doesn't decode it again"):
+    inventory.update([])
+    assert locked_while_decoding == [False]
+    assert not inventory.find_by_primary_item_identifier('pii-a')
+
+def test_query_inventory_preempted(subtests):
+  fake = None
+  turns = []
+
+  with subtests.test("Given a reader whose tag buffer fills up"):
+    fake = FakeInventoryReader(
+      inventory_response(1, 5, [0xe004010000000001, 0xe004010000000002]),
+      inventory_response(1, 5, [0xe004010000000003, 0xe004010000000004]),
+    )
+    rfid_reader = RFID_Reader.__new__(RFID_Reader) # Skip connecting to the serial port
+    rfid_reader.scheduler = CommandScheduler()
+    rfid_reader.inventory_lock = threading.Lock()
+    rfid_reader.write = fake.write
+    rfid_reader.read = fake.read
+
+  with subtests.test("And a gate alarm write queued up while the inventory is being drained"):
+    def read(msg_class):
+      def write_gate_alarm():
+        with command_scheduler.priority(command_scheduler.PRIORITY_SECURITY), rfid_reader.scheduler.turn():
+          turns.append('gate alarm')
+      threading.Thread(target=write_gate_alarm).start()
+      while not rfid_reader.scheduler.waiting: time.sleep(0.001)
+      return fake.read(msg_class)
+    rfid_reader.read = read
+
+  with subtests.test("When the tags are inventoried"):
+    tags = rfid_reader.query_inventory()
+    turns.append('inventory done')
+
+  with subtests.test("Then the drain is given up after the frame on the wire, and the gate alarm write goes first"):
+    assert len(fake.requests) == 1
+    assert rfid_reader.inventory_statistics['interrupted']
+    started = time.monotonic()
+    while len(turns) < 2 and time.monotonic() - started < 5: time.sleep(0.001)
+    assert 'gate alarm' in turns
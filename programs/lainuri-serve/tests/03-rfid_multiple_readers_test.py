@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+
+import context
+
+import lainuri.exception.rfid
+import lainuri.rfid_reader
+from lainuri.rfid_reader import RFID_Reader
+from lainuri.RL866.command_scheduler import CommandScheduler
+from lainuri.RL866.iblock import IBlock_TagInventory
+from lainuri.RL866.inventory import Inventory
+from lainuri.RL866.sblock import SBlock_RESYNC
+from lainuri.RL866.state import ProtocolSession
+from lainuri.RL866.tag import Tag
+
+import threading
+import unittest.mock
+
+class FakeSerial():
+  def __init__(self):
+    self.written = []
+
+  def reset_input_buffer(self):
+    pass
+
+  def write(self, data):
+    self.written.append(data)
+    return len(data)
+
+  def close(self):
+    pass
+
+def new_reader(name: str) -> RFID_Reader:
+  reader = RFID_Reader.__new__(RFID_Reader) # Skip connecting to the serial port
+  reader.name = name
+  reader.serial = FakeSerial()
+  reader.session = ProtocolSession(name)
+  reader.scheduler = CommandScheduler()
+  reader.inventory_lock = threading.Lock()
+  reader.inventory = Inventory(appear_hysteresis=1, disappear_hysteresis=1)
+  return reader
+
+def present(reader: RFID_Reader, *serial_numbers):
+  tags = [Tag(sn) for sn in serial_numbers]
+  for tag in tags: tag._primary_item_identifier = reader.name + '-' + tag.serial_number()
+  reader.inventory.update(tags)
+
+def test_protocol_session_per_reader(subtests):
+  reader_a = None
+  reader_b = None
+
+  with subtests.test("Given two readers"):
+    reader_a = new_reader('a')
+    reader_b = new_reader('b')
+
+  with subtests.test("When the readers write interleaved"):
+    reader_a.write(IBlock_TagInventory())
+    reader_b.write(IBlock_TagInventory())
+    reader_b.write(IBlock_TagInventory())
+    reader_a.write(SBlock_RESYNC())
+    reader_a.write(IBlock_TagInventory())
+
+  with subtests.test("Then each reader toggles its own I-block sequence number"):
+    assert [data[3] for data in reader_a.serial.written] == [0x00, 0xC0, 0x40]
+    assert [data[3] for data in reader_b.serial.written] == [0x00, 0x40]
+
+def test_readers_config(subtests):
+  with subtests.test("Without configured readers, the default reader is used"):
+    with unittest.mock.patch.object(lainuri.rfid_reader, 'get_config', return_value=None):
+      assert lainuri.rfid_reader.get_rfid_readers_config() == [{'name': 'RL866', 'port': '/dev/ttyRL866', 'antennas': None}]
+
+  with subtests.test("Configured readers are named"):
+    with unittest.mock.patch.object(lainuri.rfid_reader, 'get_config', return_value=[{'name': 'checkin', 'port': '/dev/ttyUSB0'}, {'port': '/dev/ttyUSB1', 'antennas': [1,2]}]):
+      assert lainuri.rfid_reader.get_rfid_readers_config() == [
+        {'name': 'checkin', 'port': '/dev/ttyUSB0', 'antennas': None},
+        {'name': 'RL866-1', 'port': '/dev/ttyUSB1', 'antennas': [1,2]},
+      ]
+
+  with subtests.test("Reader names must be unique"):
+    with unittest.mock.patch.object(lainuri.rfid_reader, 'get_config', return_value=[{'name': 'a', 'port': '/dev/ttyUSB0'}, {'name': 'a', 'port': '/dev/ttyUSB1'}]):
+      context.assert_raises('duplicate names', ValueError, 'must be unique', lambda: lainuri.rfid_reader.get_rfid_readers_config())
+
+def test_reader_failing_to_connect(subtests):
+  unplugged = {'/dev/ttyUSB0'}
+  def connect_serial(self):
+    if self.port in unplugged: raise FileNotFoundError(f"could not open port {self.port}")
+    return FakeSerial()
+
+  with subtests.test("Given two configured readers, of which the first one fails to connect"):
+    readers_config = [{'name': 'checkin', 'port': '/dev/ttyUSB0', 'antennas': None}, {'name': 'checkout', 'port': '/dev/ttyUSB1', 'antennas': None}]
+
+  with unittest.mock.patch.object(lainuri.rfid_reader, 'rfid_readers', []), \
+       unittest.mock.patch.object(lainuri.rfid_reader, 'get_rfid_readers_config', return_value=readers_config), \
+       unittest.mock.patch.object(lainuri.rfid_reader, 'update_rfid_reader_status'), \
+       unittest.mock.patch.object(RFID_Reader, 'connect_serial', connect_serial), \
+       unittest.mock.patch.object(RFID_Reader, 'reset'):
+
+    with subtests.test("Then the failed reader is kept in the error status"):
+      readers = lainuri.rfid_reader.get_rfid_readers()
+      assert [reader.name for reader in readers] == ['checkin', 'checkout']
+      assert [reader.status for reader in readers] == [lainuri.rfid_reader.Status.ERROR, lainuri.rfid_reader.Status.SUCCESS]
+
+    with subtests.test("And the other reader is still used"):
+      assert lainuri.rfid_reader.get_rfid_reader().name == 'checkout'
+
+    with subtests.test("When the failed reader is plugged in"):
+      unplugged.clear()
+      with unittest.mock.patch.object(RFID_Reader, 'do_inventory'), \
+           unittest.mock.patch.object(RFID_Reader, 'sleep_until_next_poll'), \
+           unittest.mock.patch.object(lainuri.rfid_reader.lainuri.status, 'update_statistics'):
+        readers[0].rfid_poll_daemon()
+
+    with subtests.test("Then its polling thread reconnects it"):
+      assert readers[0].serial
+      assert readers[0].status == lainuri.rfid_reader.Status.SUCCESS
+      assert lainuri.rfid_reader.get_rfid_reader().name == 'checkin'
+
+def test_no_reader_connecting(subtests):
+  def connect_serial(self):
+    raise FileNotFoundError(f"could not open port {self.port}")
+
+  with subtests.test("Given a configured reader failing to connect"):
+    readers_config = [{'name': 'checkin', 'port': '/dev/ttyUSB0', 'antennas': None}]
+
+  with subtests.test("Then asking for a reader tells none is available"):
+    with unittest.mock.patch.object(lainuri.rfid_reader, 'rfid_readers', []), \
+         unittest.mock.patch.object(lainuri.rfid_reader, 'get_rfid_readers_config', return_value=readers_config), \
+         unittest.mock.patch.object(lainuri.rfid_reader, 'update_rfid_reader_status'), \
+         unittest.mock.patch.object(RFID_Reader, 'connect_serial', connect_serial):
+      context.assert_raises('no reader', lainuri.exception.rfid.RFIDReaderUnavailable, "checkin:/dev/ttyUSB0", lambda: lainuri.rfid_reader.get_rfid_reader())
+
+def test_merged_inventory(subtests):
+  reader_a = new_reader('a')
+  reader_b = new_reader('b')
+
+  with unittest.mock.patch.object(lainuri.rfid_reader, 'rfid_readers', [reader_a, reader_b]):
+    with subtests.test("Given a tag is in the field of both readers"):
+      present(reader_a, '1', '2')
+      present(reader_b, '2', '3')
+
+    with subtests.test("Then the merged inventory lists it once"):
+      assert sorted([tag.serial_number() for tag in lainuri.rfid_reader.get_current_inventory_status()]) == ['1', '2', '3']
+
+    with subtests.test("And tags are found at the reader they are present at"):
+      reader, tag = lainuri.rfid_reader.find_reader_and_tag('b-3')
+      assert reader is reader_b
+      assert reader_a.tags_present_at_other_readers() == {'2', '3'}
@@ -0,0 +1,49 @@
+#!/usr/bin/python3
+
+import context
+
+from lainuri.RL866.inventory import Inventory
+from lainuri.RL866.polling import AdaptivePollingInterval, ACTIVE, IDLE
+from lainuri.RL866.tag import Tag
+
+def test_adaptive_polling_interval(subtests):
+  polling = None
+
+  with subtests.test("Given a poller which backs off after 10 seconds of inactivity"):
+    polling = AdaptivePollingInterval(min_interval=0, max_interval=2, idle_after=10)
+    polling.last_activity = 0
+
+  with subtests.test("While tags are changing, it polls as fast as possible"):
+    assert polling.update(tags_changed=True, session_active=False, now=1) == 0
+    assert polling.update(tags_changed=False, session_active=False, now=5) == 0
+    assert polling.state == ACTIVE
+
+  with subtests.test("When the field has been stable, it backs off exponentially up to the ceiling"):
+    assert [polling.update(tags_changed=False, session_active=False, now=t) for t in range(11, 16)] == [0.25, 0.5, 1, 2, 2]
+    assert polling.state == IDLE
+    assert polling.transitions_to_idle == 1
+
+  with subtests.test("When a patron starts using the kiosk, it polls fast again"):
+    assert polling.update(tags_changed=False, session_active=True, now=20) == 0
+    assert polling.state == ACTIVE
+    assert polling.transitions_to_active == 1
+    assert polling.to_ui()['polls'] == 8
+
+def test_adaptive_polling_interval_min_over_ceiling():
+  polling = AdaptivePollingInterval(min_interval=1, max_interval=0.5, idle_after=0)
+  assert polling.update(tags_changed=False, session_active=False, now=polling.last_activity + 1) == 1
+
+def test_inventory_is_settled(subtests):
+  inventory = Inventory(appear_hysteresis=2, disappear_hysteresis=2)
+
+  with subtests.test("A tag being debounced keeps the inventory unsettled"):
+    inventory.update([Tag('a')])
+    assert not inventory.is_settled()
+    inventory.update([Tag('a')])
+    assert inventory.is_settled()
+
+  with subtests.test("A missed tag keeps the inventory unsettled, until it is lost"):
+    inventory.update([])
+    assert not inventory.is_settled()
+    inventory.update([])
+    assert inventory.is_settled()
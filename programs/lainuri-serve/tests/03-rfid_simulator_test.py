@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+
+import context
+
+from lainuri.constants import Status
+import lainuri.db
+import lainuri.exception.rfid as exception_rfid
+import lainuri.rfid_reader
+from lainuri.rfid_reader import RFID_Reader
+from lainuri.RL866.inventory import Inventory
+import lainuri.RL866.simulator as simulator
+import lainuri.RL866.tag_cache as tag_cache
+
+def test_db_init():
+  lainuri.db.init()
+  lainuri.db.upgrade_database_schema()
+  tag_cache.clear()
+
+def test_simulator_inventory_and_flesh(subtests):
+  with simulator.scenario({
+    'tags': [
+      {'serial_number': 'e004010000000001', 'format': 'iso28560-2', 'primary_item_identifier': '1620168259'},
+      {'serial_number': 'e004010000000002', 'format': 'iso28560-3', 'primary_item_identifier': '1620168260'},
+      {'serial_number': 'e004010000000003', 'format': 'iso28560-2', 'primary_item_identifier': '1620168261', 'arrives': 3600},
+    ],
+    'generate': {'count': 30},
+  }) as sim:
+    reader = None
+    tags = None
+
+    with subtests.test("Given a RFID reader connected to the simulator"):
+      reader = RFID_Reader(name='simulator', port=sim.port)
+      assert sim.commands['resync'] == 1
+
+    with subtests.test("When the tags are inventoried"):
+      tags = reader.query_inventory()
+
+    with subtests.test("Then the tags in the field are found, draining the tag reports from multiple transmissions"):
+      assert len(tags) == 32
+      assert reader.inventory_statistics['transmissions'] > 1
+      assert 'e004010000000003' not in [tag.serial_number() for tag in tags]
+
+    with subtests.test("And the tags are fleshed by reading the tag memory"):
+      tags = {tag.serial_number(): tag for tag in tags}
+      assert reader.flesh_tag_details(tags['e004010000000001']).iso25680_get_primary_item_identifier() == '1620168259'
+      assert reader.flesh_tag_details(tags['e004010000000002']).iso25680_get_primary_item_identifier() == '1620168260'
+      assert sim.commands['connect'] == 2
+      assert 'disconnect' not in sim.commands
+
+    with subtests.test("And the tags stay connected until they leave the field"):
+      reader.tag_sessions.close(tags.values())
+      assert sim.commands['disconnect'] == 2
+      assert sim.handles == {}
+
+    with subtests.test("And the fleshed tags keep only the decoded details"):
+      tag = tags['e004010000000001']
+      assert tag._tag_memory == None
+      assert tag.iso25680_get_primary_item_identifier() == '1620168259'
+      assert tag.ui_snapshot() is tag.ui_snapshot()
+      assert tag.ui_snapshot()['item_barcode'] == '1620168259'
+
+def test_simulator_gate_alarm(subtests):
+  sim = simulator.Simulator(tags=[simulator.iso28560_2_tag(0xe004010000000011, '1620000011', afi=0x07)]).start()
+  reader = RFID_Reader(name='simulator', port=sim.port)
+  reader.inventory = Inventory(appear_hysteresis=1, disappear_hysteresis=1)
+  lainuri.rfid_reader.rfid_readers.append(reader)
+  try:
+    with subtests.test("Given an item is on the reader"):
+      reader.do_inventory(no_events=True)
+      assert reader.inventory.find_by_primary_item_identifier('1620000011')
+
+    with subtests.test("When the item is checked out, the gate alarm is turned off by writing the AFI"):
+      results = lainuri.rfid_reader.set_tag_gate_alarms(['1620000011'], False)
+      assert results['1620000011']['status'] == Status.SUCCESS
+      assert sim.tags[0].afi == 194
+
+    with subtests.test("When the item is checked in, the gate alarm is turned on again"):
+      results = lainuri.rfid_reader.set_tag_gate_alarms(['1620000011'], True)
+      assert sim.tags[0].afi == 0x07
+  finally:
+    lainuri.rfid_reader.rfid_readers.remove(reader)
+    sim.stop()
+
+def test_simulator_error_injection(subtests):
+  with simulator.Simulator(tags=[simulator.iso28560_3_tag(0xe004010000000021, '1620000021')], errors={'connect': 1}) as sim:
+    reader = RFID_Reader(name='simulator', port=sim.port)
+    tag = reader.query_inventory()[0]
+    tag_cache.invalidate(tag.serial_number())
+
+    with subtests.test("When a command fails in the reader, the reader's error code is raised"):
+      context.assert_raises('connect fails', exception_rfid.RFIDCommand, '', lambda: reader.flesh_tag_details(tag))
+
+    with subtests.test("And the protocol continues"):
+      assert len(reader.query_inventory()) == 1
+
+def test_simulator_gate_alarm_failing_on_a_shared_connection(subtests):
+  sim = simulator.Simulator(tags=[simulator.iso28560_2_tag(0xe004010000000031, '1620000031', afi=0x07)]).start()
+  reader = RFID_Reader(name='simulator', port=sim.port)
+  reader.inventory = Inventory(appear_hysteresis=1, disappear_hysteresis=1)
+  lainuri.rfid_reader.rfid_readers.append(reader)
+  try:
+    with subtests.test("Given another operation using the connection to the tag"):
+      reader.do_inventory(no_events=True)
+      tag = reader.inventory.find_by_primary_item_identifier('1620000031')
+      reader.tag_sessions.open(tag)
+
+    with subtests.test("When setting the gate alarm of the tag fails every time"):
+      sim.errors = {'memory_access': 1}
+      context.assert_raises('writes fail', exception_rfid.RFIDCommand, '', lambda: lainuri.rfid_reader.set_tag_gate_alarm('1620000031', False))
+
+    with subtests.test("Then the connection is kept for the other operation"):
+      assert 'disconnect' not in sim.commands
+      assert tag.get_connection_handle() in [bytes([handle]) for handle in sim.handles]
+
+    with subtests.test("And it is disconnected once the other operation is done with it"):
+      reader.tag_sessions.release(tag)
+      assert sim.handles == {}
+  finally:
+    lainuri.rfid_reader.rfid_readers.remove(reader)
+    reader.tag_sessions.close(reader.tags_present)
+    sim.stop()
@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+
+import context
+
+from lainuri.constants import Status
+import lainuri.exception.rfid as exception_rfid
+import lainuri.rfid_reader
+from lainuri.rfid_reader import RFID_Reader
+from lainuri.RL866.command_scheduler import CommandScheduler
+from lainuri.RL866.inventory import Inventory
+from lainuri.RL866.tag import Tag
+from lainuri.RL866.tag_session import TagSessions
+
+import unittest.mock
+
+def new_reader_with_items(*item_barcodes) -> RFID_Reader:
+  reader = RFID_Reader.__new__(RFID_Reader) # Skip connecting to the serial port
+  reader.scheduler = CommandScheduler()
+  reader.tag_sessions = TagSessions(
+    connect=lambda tag: lainuri.rfid_reader._tag_connect(reader, tag),
+    disconnect=lambda tag: lainuri.rfid_reader._tag_disconnect(reader, tag),
+    idle_timeout=3,
+  )
+  reader.inventory = Inventory(appear_hysteresis=1, disappear_hysteresis=1)
+  tags = []
+  for item_barcode in item_barcodes:
+    tag = Tag('e00401000000' + item_barcode)
+    tag._primary_item_identifier = item_barcode
+    tags.append(tag)
+  reader.inventory.update(tags)
+  return reader
+
+class FakeTagSteps():
+  """
+  Records the gate alarm steps taken, and fails the steps as rigged.
+  """
+  def __init__(self, failures: dict):
+    self.failures = failures # (step, item_barcode) -> list of exceptions to throw, one per attempt
+    self.steps = []
+
+  def step(self, step_name: str):
+    def step_method(rfid_reader, tag, flag_on=None):
+      item_barcode = tag.iso25680_get_primary_item_identifier()
+      self.steps.append((step_name, item_barcode))
+      failures = self.failures.get((step_name, item_barcode))
+      if failures: raise failures.pop(0)
+      if step_name == 'connect': tag.connect(b'\x01')
+      if step_name == 'disconnect': tag.disconnect()
+    return step_method
+
+  def step_together(self, step_name: str):
+    def step_method(rfid_reader, tags, flag_on=None):
+      tags_failed = []
+      for tag in tags:
+        item_barcode = tag.iso25680_get_primary_item_identifier()
+        self.steps.append((step_name, item_barcode))
+        failures = self.failures.get((step_name, item_barcode))
+        if failures:
+          failures.pop(0)
+          tags_failed.append(tag)
+      return tags_failed
+    return step_method
+
+  def patch(self):
+    return unittest.mock.patch.multiple(lainuri.rfid_reader,
+      _tag_connect=self.step('connect'),
+      _tag_write_afi=self.step('write'),
+      _tags_verify_afi=self.step_together('verify'),
+      _tag_disconnect=self.step('disconnect'),
+    )
+
+def test_set_tag_gate_alarms(subtests):
+  reader = None
+  fake = None
+  results = None
+
+  with subtests.test("Given three items on the reader, one failing once to be written, and one failing to connect for good"):
+    reader = new_reader_with_items('0001', '0002', '0003')
+    fake = FakeTagSteps({
+      ('write', '0002'): [exception_rfid.RFIDCommand('ERR_WRITE', 'rigged to fail')],
+      ('connect', '0003'): [Exception('not retriable')],
+    })
+
+  with subtests.test("When the gate alarms are set in a batch, with one item not present at all"):
+    with fake.patch(), unittest.mock.patch.object(lainuri.rfid_reader, 'rfid_readers', [reader]):
+      results = lainuri.rfid_reader.set_tag_gate_alarms(['0001', '0002', '0003', '0004'], False)
+
+  with subtests.test("Then the tags go through each step together"):
+    assert fake.steps[0:7] == [
+      ('connect', '0001'), ('connect', '0002'), ('connect', '0003'),
+      ('write', '0001'), ('write', '0002'),
+      ('verify', '0001'),
+      ('disconnect', '0002'),
+    ]
+
+  with subtests.test("And only the item failing with a retriable error is retried"):
+    assert fake.steps[7:] == [('connect', '0002'), ('write', '0002'), ('verify', '0002')]
+
+  with subtests.test("And the written tags stay connected for the next operation"):
+    assert sorted(reader.tag_sessions.sessions.keys()) == ['e004010000000001', 'e004010000000002']
+    with fake.patch():
+      reader.tag_sessions.close(reader.tags_present)
+    assert fake.steps[-2:] == [('disconnect', '0001'), ('disconnect', '0002')]
+
+  with subtests.test("And the status of each item is reported"):
+    assert list(results.keys()) == ['0001', '0002', '0003', '0004']
+    assert results['0001']['status'] == Status.SUCCESS
+    assert results['0002']['status'] == Status.SUCCESS
+    assert results['0003']['status'] == Status.ERROR
+    assert results['0003']['states']['exception']['type'] == 'Exception'
+    assert results['0004']['states']['exception']['type'] == 'TagNotDetected'
+
+def test_set_tag_gate_alarms_retries_are_limited():
+  reader = new_reader_with_items('0001')
+  fake = FakeTagSteps({('verify', '0001'): [exception_rfid.GateSecurityStatusVerification('0001') for i in range(0,3)]})
+
+  with fake.patch(), unittest.mock.patch.object(lainuri.rfid_reader, 'rfid_readers', [reader]):
+    results = lainuri.rfid_reader.set_tag_gate_alarms(['0001'], True)
+
+  assert [step for step in fake.steps if step[0] == 'verify'] == [('verify', '0001')] * 3
+  assert results['0001']['states']['exception']['type'] == 'GateSecurityStatusVerification'
+  assert not reader.tags_present[0].get_connection_handle()
@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+
+import context
+
+import lainuri.db
+import lainuri.RL866.tag_cache as tag_cache
+from lainuri.RL866.tag import Tag
+
+import time
+import unittest.mock
+
+def fleshed_tag(serial_number: str, pii: str) -> Tag:
+  tag = Tag(serial_number)
+  tag.afi(0x07)
+  tag.dsfid(0x3E)
+  tag.block_size(4)
+  tag.memory_capacity_blocks(28)
+  tag._primary_item_identifier = pii
+  return tag
+
+def test_db_init():
+  lainuri.db.init()
+  lainuri.db.upgrade_database_schema()
+  tag_cache.clear()
+
+def test_tag_cache_flesh_from_cache(subtests):
+  tag = None
+
+  with subtests.test("Given a fleshed tag is cached"):
+    assert tag_cache.put(fleshed_tag('e004010000000001', '1620000001'))
+
+  with subtests.test("When the same tag is inventoried again"):
+    tag = Tag('e004010000000001')
+
+  with subtests.test("Then it is fleshed from the cache"):
+    assert tag_cache.flesh_from_cache(tag)
+    assert tag.afi() == 0x07
+    assert tag.dsfid() == 0x3E
+    assert tag.block_size() == 4
+    assert tag.memory_capacity_blocks() == 28
+    assert tag.iso25680_get_primary_item_identifier() == '1620000001'
+
+  with subtests.test("And unknown tags are not"):
+    assert not tag_cache.flesh_from_cache(Tag('e004010000000002'))
+
+def test_tag_cache_not_caching_undecodable_tags():
+  assert not tag_cache.put(fleshed_tag('e004010000000003', ''))
+  assert not tag_cache.put(Tag('e004010000000003'))
+  assert not tag_cache.get('e004010000000003')
+
+def test_tag_cache_persistent_tier(subtests):
+  with subtests.test("Given a cached tag"):
+    tag_cache.put(fleshed_tag('e004010000000004', '1620000004'))
+
+  with subtests.test("When the in-memory tier is lost, eg. due to a restart"):
+    tag_cache.lru.clear()
+
+  with subtests.test("Then the tag is found from the on-disk tier"):
+    assert tag_cache.get('e004010000000004')['primary_item_identifier'] == '1620000004'
+
+  with subtests.test("When the tag is written to"):
+    tag_cache.invalidate('e004010000000004')
+
+  with subtests.test("Then the tag is gone from both tiers"):
+    assert not tag_cache.get('e004010000000004')
+    assert not lainuri.db.rfid_tag_cache.get('e004010000000004')
+
+def test_tag_cache_lru_eviction(subtests):
+  with unittest.mock.patch.object(tag_cache, 'get_max_size', return_value=2):
+    with unittest.mock.patch.object(tag_cache, 'is_persistent', return_value=False):
+      tag_cache.clear()
+
+      with subtests.test("Given a full cache"):
+        tag_cache.put(fleshed_tag('1', '1'))
+        tag_cache.put(fleshed_tag('2', '2'))
+
+      with subtests.test("When the oldest tag is used and a new tag is cached"):
+        assert tag_cache.get('1')
+        tag_cache.put(fleshed_tag('3', '3'))
+
+      with subtests.test("Then the least recently used tag is evicted"):
+        assert list(tag_cache.lru.keys()) == ['1', '3']
+
+def test_tag_cache_ttl(subtests):
+  with subtests.test("Given a tag cached long ago, in both tiers"):
+    tag_cache.put(fleshed_tag('e004010000000005', '1620000005'))
+    lainuri.db.rfid_tag_cache.put(dict(tag_cache.lru['e004010000000005'], cached_date=time.time() - 3600))
+    tag_cache.lru['e004010000000005']['cached_date'] = time.time() - 3600
+
+  with subtests.test("When the cached tags are trusted for less time than that"):
+    with unittest.mock.patch.object(tag_cache, 'get_config', return_value=60):
+      entry = tag_cache.get('e004010000000005')
+
+  with subtests.test("Then the tag is not found, and is dropped from both tiers"):
+    assert not entry
+    assert 'e004010000000005' not in tag_cache.lru
+    assert not lainuri.db.rfid_tag_cache.get('e004010000000005')
+
+def test_tag_cache_revalidated_by_inventory(subtests):
+  with subtests.test("Given a cached tag"):
+    tag_cache.put(fleshed_tag('e004010000000006', '1620000006'))
+    tag_cache.lru.clear() # Found from the on-disk tier
+
+  with subtests.test("When the inventory reports the tag with the cached AFI"):
+    tag = Tag('e004010000000006')
+    tag.afi(0x07)
+
+  with subtests.test("Then it is fleshed from the cache"):
+    assert tag_cache.flesh_from_cache(tag)
+
+  with subtests.test("When the inventory reports the tag with another DSFID, eg. it has been reprogrammed elsewhere"):
+    tag = Tag('e004010000000006')
+    tag.dsfid(0x06)
+
+  with subtests.test("Then the cached tag is not trusted, and is dropped"):
+    assert not tag_cache.flesh_from_cache(tag)
+    assert not tag_cache.get('e004010000000006')
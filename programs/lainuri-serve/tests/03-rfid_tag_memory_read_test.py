@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+
+import context
+
+import lainuri.helpers as helpers
+import lainuri.RL866.CRC16
+from lainuri.rfid_reader import RFID_Reader
+from lainuri.RL866.command_scheduler import CommandScheduler
+from lainuri.RL866.tag import Tag
+
+import iso28560
+import unittest.mock
+
+iso28560_2_tag_memory = bytes(
+  b'\x91\x01\x04\x60\x91\xce\x43\x80\x02\x01\xa8\x05\x01\x10\x67\x02'
+  b'\x42\x41\x03\x07\x32\x40\xde\x05\xab\x07\x5b\x00\x00\x00\x00\x00'
+  b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+  b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+  b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+)
+
+class FakeTagMemory():
+  """
+  Answers ISO15693_ReadMultipleBlocks commands from the given tag memory, and records which blocks were read.
+  """
+  def __init__(self, tag_memory: bytes, block_size: int):
+    self.tag_memory = tag_memory
+    self.block_size = block_size
+    self.reads = []
+
+  def write(self, msg):
+    start_block_address = helpers.word_to_int(msg.mac_command.parameter[1:3])
+    number_of_blocks = helpers.word_to_int(msg.mac_command.parameter[3:5])
+    self.reads.append((start_block_address, number_of_blocks))
+
+    data = self.tag_memory[start_block_address*self.block_size : (start_block_address+number_of_blocks)*self.block_size]
+    access_result = msg.mac_command.command + b'\x01' + helpers.int_to_word(number_of_blocks) + data
+    inf = b'\x34\x00\x00' + bytes([len(access_result)]) + access_result
+    len_rid_pcb_inf = bytes([len(inf) + 5]) + b'\x01\x00' + inf
+    self.response = b'\xfa' + len_rid_pcb_inf + lainuri.RL866.CRC16.crc16(len_rid_pcb_inf)
+
+  def read(self, msg_class):
+    return self.response
+
+def new_reader_and_tag(fake: FakeTagMemory):
+  reader = RFID_Reader.__new__(RFID_Reader) # Skip connecting to the serial port
+  reader.scheduler = CommandScheduler()
+  reader.write = fake.write
+  reader.read = fake.read
+
+  tag = Tag('e004010000000001')
+  tag.afi(0x07)
+  tag.dsfid(0x06)
+  tag.block_size(fake.block_size)
+  tag.memory_capacity_blocks(len(fake.tag_memory) // fake.block_size)
+  tag.connect(b'\x01')
+  return (reader, tag)
+
+def test_read_primary_item_identifier_reads_only_the_needed_blocks(subtests):
+  fake = FakeTagMemory(iso28560_2_tag_memory, block_size=4)
+  reader, tag = new_reader_and_tag(fake)
+
+  with subtests.test("When the primary item identifier is read"):
+    assert reader.read_primary_item_identifier(tag) == '1620168259'
+
+  with subtests.test("Then only the blocks the data format needs are read"):
+    assert fake.reads == [(0, -(-iso28560.ISO28560_2_Object.min_tag_memory_bytes // 4))]
+
+def test_read_primary_item_identifier_reads_more_on_demand(subtests):
+  fake = FakeTagMemory(iso28560_2_tag_memory, block_size=4)
+  reader, tag = new_reader_and_tag(fake)
+
+  with unittest.mock.patch.object(iso28560.ISO28560_2_Object, 'min_tag_memory_bytes', 4):
+    with subtests.test("When the data format needs less than the data element spans"):
+      assert reader.read_primary_item_identifier(tag) == '1620168259'
+
+    with subtests.test("Then the rest of the data element is read on demand"):
+      assert fake.reads == [(0, 1), (1, 1)]
+      assert tag.tag_memory() == iso28560_2_tag_memory[0:8]
+
+def test_read_primary_item_identifier_capped_to_capacity():
+  fake = FakeTagMemory(iso28560_2_tag_memory[0:12], block_size=4)
+  reader, tag = new_reader_and_tag(fake)
+
+  assert reader.read_primary_item_identifier(tag) == '1620168259'
+  assert fake.reads == [(0, 3)]
@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+
+import context
+
+from lainuri.constants import Status
+import lainuri.db
+import lainuri.rfid_tag_programmer as rfid_tag_programmer
+from lainuri.rfid_tag_programmer import TagProgrammer
+from lainuri.rfid_reader import RFID_Reader
+import lainuri.RL866.simulator as simulator
+import lainuri.RL866.tag_cache as tag_cache
+
+import iso15692
+import iso28560
+import queue
+import time
+import unittest.mock
+
+def test_db_init():
+  lainuri.db.init()
+  lainuri.db.upgrade_database_schema()
+  tag_cache.clear()
+
+def test_encode_tag_memory():
+  assert rfid_tag_programmer.encode_tag_memory('1620168259') == b'\x11\x04\x60\x91\xce\x43\x00'
+  assert rfid_tag_programmer.encode_tag_memory('0201') == b'\x21\x02\x02\x01\x00'
+  assert iso28560.ISO28560_2_Object(afi=0x07, dsfid=0x06, block_size=4, memory_capacity_blocks=28, tag_memory=rfid_tag_programmer.encode_tag_memory('FI-JYVA')).get_primary_item_identifier() == 'FI-JYVA'
+
+def test_program_tags(subtests):
+  with simulator.scenario({
+    'tags': [
+      {'serial_number': 'e004010000000001', 'format': 'blank', 'afi': 0xC2},
+      {'serial_number': 'e004010000000002', 'format': 'iso28560-2', 'primary_item_identifier': '1620168259'},
+      {'serial_number': 'e004010000000003', 'format': 'blank'},
+      {'serial_number': 'e004010000000004', 'format': 'blank', 'arrives': 3600},
+    ],
+  }) as sim:
+    programmer = None
+    results = None
+
+    with subtests.test("Given two blank tags and a programmed tag on the RFID reader"):
+      programmer = TagProgrammer(RFID_Reader(name='simulator', port=sim.port), afi=0x07, tag_timeout=0.2)
+
+    with subtests.test("When three items are programmed"):
+      results = programmer.program(['1620000001', 'FI-JYVA', '0201'])
+
+    with subtests.test("Then the items are programmed to the blank tags, in the order the tags are found, until the blank tags run out"):
+      assert [(r['item_barcode'], r['serial_number'], r['status']) for r in results] == [
+        ('1620000001', 'e004010000000001', Status.SUCCESS),
+        ('FI-JYVA', 'e004010000000003', Status.SUCCESS),
+        ('0201', None, Status.ERROR),
+      ]
+      assert results[2]['states']['exception']['type'] == 'TagNotDetected'
+
+    with subtests.test("And the programmed tags decode to the item barcodes, with the DSFID and the AFI set"):
+      tags = {tag.serial_number: tag for tag in sim.tags}
+      for serial_number, item_barcode in [(0xe004010000000001, '1620000001'), (0xe004010000000003, 'FI-JYVA')]:
+        tag = tags[serial_number]
+        assert (tag.dsfid, tag.afi) == (0x06, 0x07)
+        assert iso28560.ISO28560_2_Object(tag.afi, tag.dsfid, tag.block_size, tag.memory_capacity_blocks, bytes(tag.tag_memory)).get_primary_item_identifier() == item_barcode
+
+    with subtests.test("And the tag which already had data is untouched"):
+      assert tags[0xe004010000000002].tag_memory[0:9] == simulator.iso28560_2_tag(0, '1620168259').tag_memory[0:9]
+      assert sim.handles == {}
+
+    with subtests.test("And the sustained programming rate is reported"):
+      assert programmer.statistics['tags_programmed'] == 2
+      assert programmer.statistics['tags_failed'] == 1
+      assert programmer.statistics['tags_per_minute'] > 0
+
+def test_program_tags_interrupted(subtests):
+  with simulator.scenario({'tags': [{'serial_number': 'e004010000000011', 'format': 'blank'}]}) as sim:
+    barcodes = queue.Queue()
+    programmer = TagProgrammer(RFID_Reader(name='simulator', port=sim.port), afi=0x07, tag_timeout=0.2)
+    interrupted = None
+
+    with subtests.test("Given the item barcodes come from the barcode reader, and no more are read"):
+      barcodes.put('1620000011')
+
+    with subtests.test("When the programming is interrupted while the next item barcode is awaited"):
+      def interrupt(*args):
+        raise KeyboardInterrupt()
+      started = time.monotonic()
+      with unittest.mock.patch.object(programmer, 'program_tag', side_effect=interrupt):
+        try:
+          programmer.program(rfid_tag_programmer.queue_item_barcodes(barcodes))
+        except KeyboardInterrupt:
+          interrupted = time.monotonic() - started
+
+    with subtests.test("Then the interrupt is not held up by the thread waiting for the item barcode"):
+      assert interrupted is not None and interrupted < 1
+      assert programmer.statistics['tags_programmed'] == 0
+
+    with subtests.test("And the thread is released by ending the queue"):
+      barcodes.put(None)
@@ -0,0 +1,140 @@
+#!/usr/bin/python3
+
+import context
+
+import lainuri.exception.rfid as exception_rfid
+from lainuri.RL866.tag import Tag
+from lainuri.RL866.tag_session import TagSessions
+
+import threading
+import time
+
+class FakeConnections():
+  def __init__(self):
+    self.commands = []
+    self.next_handle = 1
+    self.connect_delay = 0
+
+  def connect(self, tag: Tag):
+    self.commands.append(('connect', tag.serial_number()))
+    time.sleep(self.connect_delay)
+    tag.connect(bytes([self.next_handle]))
+    self.next_handle += 1
+
+  def disconnect(self, tag: Tag):
+    self.commands.append(('disconnect', tag.serial_number()))
+    tag.disconnect()
+
+def new_tag_sessions(idle_timeout: float = 3, max_sessions: int = 32) -> tuple:
+  fake = FakeConnections()
+  return (fake, TagSessions(connect=fake.connect, disconnect=fake.disconnect, idle_timeout=idle_timeout, max_sessions=max_sessions))
+
+def test_tag_session_reuse(subtests):
+  fake, tag_sessions = new_tag_sessions()
+  tag = Tag('e004010000000001')
+
+  with subtests.test("Given an operation on a tag"):
+    with tag_sessions.session(tag): pass
+
+  with subtests.test("When the next operations on the tag follow within the idle timeout"):
+    with tag_sessions.session(tag): pass
+    with tag_sessions.session(Tag('e004010000000001')) as other_instance:
+      assert other_instance.get_connection_handle() == b'\x01'
+
+  with subtests.test("Then the tag is connected only once"):
+    assert fake.commands == [('connect', 'e004010000000001')]
+    assert tag_sessions.to_ui() == {'open': 1, 'connects': 1, 'reuses': 2}
+
+  with subtests.test("And the connection is not closed before it has been idle for the idle timeout"):
+    tag_sessions.close_idle()
+    assert fake.commands == [('connect', 'e004010000000001')]
+
+  with subtests.test("When the connection has been idle for the idle timeout"):
+    tag_sessions.idle_timeout = 0.01
+    tag_sessions.sessions['e004010000000001'].last_used -= 0.01
+    tag_sessions.close_idle()
+
+  with subtests.test("Then the tag is disconnected"):
+    assert fake.commands[1:] == [('disconnect', 'e004010000000001')]
+    assert tag_sessions.sessions == {}
+
+def test_tag_session_closed(subtests):
+  fake, tag_sessions = new_tag_sessions()
+  tags = [Tag('e004010000000001'), Tag('e004010000000002')]
+
+  with subtests.test("Given two connected tags"):
+    for tag in tags:
+      with tag_sessions.session(tag): pass
+
+  with subtests.test("When one of them leaves the field"):
+    tag_sessions.close(tags[0:1])
+
+  with subtests.test("Then only it is disconnected"):
+    assert fake.commands[2:] == [('disconnect', 'e004010000000001')]
+
+  with subtests.test("When an operation on the other one fails"):
+    context.assert_raises('operation fails', exception_rfid.RFIDCommand, '', lambda: _fail_in_session(tag_sessions, tags[1]))
+
+  with subtests.test("Then it is disconnected, as its connection handle might not be good anymore"):
+    assert fake.commands[3:] == [('disconnect', 'e004010000000002')]
+    assert tag_sessions.sessions == {}
+
+def _fail_in_session(tag_sessions: TagSessions, tag: Tag):
+  with tag_sessions.session(tag):
+    raise exception_rfid.RFIDCommand('ERR_WRITE', 'rigged to fail')
+
+def test_tag_session_without_idle_timeout():
+  fake, tag_sessions = new_tag_sessions(idle_timeout=0)
+  tag = Tag('e004010000000001')
+  with tag_sessions.session(tag):
+    with tag_sessions.session(tag): pass # Nested operations still share the connection
+  assert fake.commands == [('connect', 'e004010000000001'), ('disconnect', 'e004010000000001')]
+
+def test_tag_sessions_are_limited():
+  fake, tag_sessions = new_tag_sessions(max_sessions=2)
+  for i in range(1, 4):
+    with tag_sessions.session(Tag(f"e00401000000000{i}")): pass
+  assert ('disconnect', 'e004010000000001') in fake.commands
+  assert sorted(tag_sessions.sessions.keys()) == ['e004010000000002', 'e004010000000003']
+
+def test_tag_session_shared_by_threads(subtests):
+  fake, tag_sessions = new_tag_sessions(idle_timeout=0)
+  fake.connect_delay = 0.05
+  entered = threading.Barrier(2)
+  may_leave = threading.Event()
+  handles = []
+
+  def operate(fail: bool):
+    with tag_sessions.session(Tag('e004010000000001')) as tag:
+      handles.append(tag.get_connection_handle())
+      entered.wait(5)
+      if fail: raise exception_rfid.RFIDCommand('ERR_WRITE', 'rigged to fail')
+      may_leave.wait(5)
+
+  with subtests.test("Given two threads opening the same tag at once"):
+    threads = [threading.Thread(target=operate, args=(False,)), threading.Thread(target=lambda: context.assert_raises('operation fails', exception_rfid.RFIDCommand, '', lambda: operate(True)))]
+    for thread in threads: thread.start()
+
+  with subtests.test("Then the tag is connected only once, and both threads use the same connection"):
+    threads[1].join(5)
+    assert fake.commands == [('connect', 'e004010000000001')]
+    assert handles == [b'\x01', b'\x01']
+
+  with subtests.test("When the operation of one thread fails, the connection stays open for the other thread"):
+    assert tag_sessions.sessions['e004010000000001'].users == 1
+
+  with subtests.test("Then the tag is disconnected once the other thread is done with it"):
+    may_leave.set()
+    threads[0].join(5)
+    assert fake.commands == [('connect', 'e004010000000001'), ('disconnect', 'e004010000000001')]
+    assert tag_sessions.sessions == {}
+
+def test_tag_session_with_dead_handle():
+  fake, tag_sessions = new_tag_sessions()
+  tag = Tag('e004010000000001')
+  tag_sessions.open(tag)
+  tag_sessions.open(tag)
+  tag_sessions.fail(tag, exception_rfid.RFIDCommand('ERR_RFID_WRONG_HANDLE', 'Wrong handle'))
+  assert tag_sessions.sessions == {}
+  assert tag.get_connection_handle() is None
+  assert fake.commands == [('connect', 'e004010000000001')] # The reader doesn't know the handle anymore
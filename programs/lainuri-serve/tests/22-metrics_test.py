@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+
+import context
+
+import lainuri.db
+import lainuri.event as le
+import lainuri.event_queue
+import lainuri.metrics as metrics
+from lainuri.rfid_reader import RFID_Reader
+import lainuri.RL866.simulator as simulator
+import lainuri.RL866.tag_cache as tag_cache
+import lainuri.websocket_handlers.status
+
+def test_histogram_percentiles(subtests):
+  metrics.clear()
+
+  with subtests.test("Given a hundred samples, some of them failed"):
+    for i in range(1, 101): metrics.record('test.command', i / 1000, error=(i % 10 == 0))
+
+  with subtests.test("Then the percentiles, counts and the error rate are reported"):
+    snapshot = metrics.snapshot()['test.command']
+    assert snapshot['count'] == 100
+    assert snapshot['errors'] == 10
+    assert snapshot['error_rate'] == 0.1
+    assert (snapshot['p50'], snapshot['p95'], snapshot['p99'], snapshot['max']) == (0.05, 0.095, 0.099, 0.1)
+
+  with subtests.test("When more samples than fit the rolling window are recorded, the percentiles come from the latest samples"):
+    for i in range(0, metrics.WINDOW_SIZE): metrics.record('test.command', 1)
+    snapshot = metrics.snapshot()['test.command']
+    assert snapshot['count'] == 100 + metrics.WINDOW_SIZE
+    assert snapshot['p50'] == 1
+    assert snapshot['error_rate'] == 0
+
+def test_timed(subtests):
+  metrics.clear()
+
+  @metrics.timed_function('test.function')
+  def fails():
+    raise ValueError('fails')
+
+  with subtests.test("A timed block is recorded"):
+    with metrics.timed('test.block'):
+      pass
+    assert metrics.snapshot()['test.block']['count'] == 1
+
+  with subtests.test("A timed function raising an exception is recorded as an error, and the exception passes through"):
+    context.assert_raises('fails', ValueError, 'fails', fails)
+    assert metrics.snapshot()['test.function']['errors'] == 1
+
+def test_rfid_phases_are_timed(subtests):
+  lainuri.db.init()
+  lainuri.db.upgrade_database_schema()
+  tag_cache.clear()
+  metrics.clear()
+
+  with simulator.Simulator(tags=[simulator.iso28560_2_tag(0xe004010000000041, '1620000041')]) as sim:
+    with subtests.test("When a tag is inventoried and fleshed"):
+      reader = RFID_Reader(name='simulator', port=sim.port)
+      reader.do_inventory(no_events=True)
+      reader.tag_sessions.close(reader.tags_present)
+
+    with subtests.test("Then each phase is timed"):
+      assert sorted(metrics.snapshot().keys()) == ['rfid.connect', 'rfid.decode_pii', 'rfid.disconnect', 'rfid.flesh', 'rfid.inventory', 'rfid.queue_wait.background', 'rfid.queue_wait.user', 'rfid.read_blocks', 'rfid.system_information']
+
+  with subtests.test("And the metrics are delivered through the websocket"):
+    lainuri.event_queue.flush_all()
+    lainuri.websocket_handlers.status.metrics_request(le.LEMetricsRequest())
+    event = lainuri.event_queue.pop_event(timeout=1)
+    assert type(event) == le.LEMetricsResponse
+    assert event.metrics['rfid.flesh']['count'] == 1
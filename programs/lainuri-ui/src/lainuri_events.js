@@ -251,6 +251,42 @@ class LESetTagAlarmComplete extends LEvent {
   }
 }
 
+class LESetTagAlarms extends LEvent {
+  static event = 'set-tag-alarms';
+
+  static serializable_attributes = ['item_barcodes', 'on'];
+  item_barcodes;
+  on;
+
+  constructor(item_barcodes, on, sender, recipient, event_id) {
+    super(event_id)
+    this.item_barcodes = item_barcodes
+    this.on = on
+    this.construct(sender, recipient);
+    this.validate_params();
+  }
+}
+
+class LESetTagAlarmsComplete extends LEvent {
+  static event = 'set-tag-alarms-complete'
+
+  static serializable_attributes = ['items', 'on', 'status', 'states']
+  items;
+  on;
+  states;
+  status = Status.NOT_SET;
+
+  constructor(items, on, status, states, sender, recipient, event_id) {
+    super(event_id)
+    this.items = items
+    this.on = on
+    this.states = states
+    this.status = status
+    this.construct(sender, recipient);
+    this.validate_params();
+  }
+}
+
 class LEBarcodeRead extends LEvent {
   static event = 'barcode-read';
 
@@ -633,12 +669,40 @@ class LEServerStatusRequest extends LEvent {
 class LEServerStatusResponse extends LEvent {
   static event = 'server-status-response';
 
-  static serializable_attributes = ['statuses'];
+  static serializable_attributes = ['statuses', 'statistics'];
   statuses;
+  statistics;
 
-  constructor(statuses, sender, recipient, event_id = undefined) {
+  constructor(statuses, statistics = {}, sender, recipient, event_id = undefined) {
     super(event_id);
     this.statuses = statuses
+    this.statistics = statistics
+    this.construct(sender, recipient);
+    this.validate_params()
+  }
+}
+
+class LEMetricsRequest extends LEvent {
+  static event = 'metrics-request';
+  default_dispatch = 'server';
+
+  static serializable_attributes = [];
+
+  constructor(sender, recipient, event_id = undefined) {
+    super(event_id);
+    this.construct(sender, recipient);
+  }
+}
+
+class LEMetricsResponse extends LEvent {
+  static event = 'metrics-response';
+
+  static serializable_attributes = ['metrics'];
+  metrics;
+
+  constructor(metrics, sender, recipient, event_id = undefined) {
+    super(event_id);
+    this.metrics = metrics
     this.construct(sender, recipient);
     this.validate_params()
   }
@@ -733,5 +797,5 @@ class LETestMockDevices extends LEvent {
 }
 
 export {
-  Status, LEvent, LEException, LEAdminModeLeave, LEAdminModeEnter, LEBarcodeRead, LECheckIn, LECheckInComplete, LEItemBibFullDataRequest, LEItemBibFullDataResponse, LELogSend, LELogReceived, LELocaleSet, LETransactionHistoryRequest, LETransactionHistoryResponse, LESetTagAlarm, LESetTagAlarmComplete, LECheckOut, LECheckOutComplete, LEConfigWrite, LEConfigGetpublic, LEConfigGetpublic_Response, LEPrintRequest, LEPrintResponse, LEPrintTemplateList, LEPrintTemplateListResponse, LEPrintTemplateSave, LEPrintTemplateSaveResponse, LEPrintTestRequest, LEPrintTestResponse, LERFIDTagsLost, LERFIDTagsNew, LERFIDTagsPresentRequest, LERFIDTagsPresent, LERingtonePlay, LERingtonePlayComplete, LEServerConnected, LEServerDisconnected, LEServerStatusRequest, LEServerStatusResponse, LETestMockDevices, LEUserLoginComplete, LEUserLoggingIn, LEUserLoginAbort
+  Status, LEvent, LEException, LEAdminModeLeave, LEAdminModeEnter, LEBarcodeRead, LECheckIn, LECheckInComplete, LEItemBibFullDataRequest, LEItemBibFullDataResponse, LELogSend, LELogReceived, LELocaleSet, LEMetricsRequest, LEMetricsResponse, LETransactionHistoryRequest, LETransactionHistoryResponse, LESetTagAlarm, LESetTagAlarmComplete, LESetTagAlarms, LESetTagAlarmsComplete, LECheckOut, LECheckOutComplete, LEConfigWrite, LEConfigGetpublic, LEConfigGetpublic_Response, LEPrintRequest, LEPrintResponse, LEPrintTemplateList, LEPrintTemplateListResponse, LEPrintTemplateSave, LEPrintTemplateSaveResponse, LEPrintTestRequest, LEPrintTestResponse, LERFIDTagsLost, LERFIDTagsNew, LERFIDTagsPresentRequest, LERFIDTagsPresent, LERingtonePlay, LERingtonePlayComplete, LEServerConnected, LEServerDisconnected, LEServerStatusRequest, LEServerStatusResponse, LETestMockDevices, LEUserLoginComplete, LEUserLoggingIn, LEUserLoginAbort
 }